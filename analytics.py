@@ -0,0 +1,532 @@
+import datetime
+import hashlib
+import json
+import os
+import secrets
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+import archive
+import database
+import logs
+import models
+import stats
+import versions
+
+try:
+    import numpy as np
+except ImportError:  # NumPy không bắt buộc: các endpoint /analytics trả 503
+    np = None
+
+# Phân tích số liệu trong tiến trình trên ảnh chụp dạng cột của transactions và products (mảng NumPy).
+#
+# - Ảnh chụp nằm trong ANALYTICS_DIR (mặc định thư mục tạm, theo chuỗi kết nối), dùng chung cho mọi worker:
+#   giao dịch được chia thành các đoạn (segment) theo khoảng ngày, mỗi đoạn là một thư mục các file .npy
+#   (day, type, product, quantity, price) được mmap khi đọc. Đoạn đã ghi không bao giờ bị sửa; file
+#   snapshot.json cho biết các đoạn đang dùng và được thay nguyên tử (os.replace).
+# - Làm mới tăng dần: chỉ khi phiên bản bảng (versions.py) đã đổi và tối đa mỗi ANALYTICS_REFRESH_SECONDS
+#   giây. Mỗi lần làm mới đọc lại ĐOẠN CUỐI (các giao dịch có ngày trong ANALYTICS_TAIL_DAYS ngày gần nhất,
+#   qua index (type, date)), nên thêm/xóa phiếu gần đây được phản ánh bất kể thứ tự mã hay thứ tự commit.
+#   Phần đoạn cuối đã cũ hơn cửa sổ được "niêm phong" thành đoạn cố định.
+# - Dựng lại toàn bộ (tháng đã lưu trữ đọc từ file của archive.py, phần còn lại đọc từ bảng) sau
+#   ANALYTICS_REBUILD_HOURS giờ, hoặc khi tổng số dòng của ảnh chụp lệch với bộ đếm stats.TRANSACTIONS_COUNT
+#   (phiếu lùi ngày hoặc bị xóa nằm ngoài cửa sổ đoạn cuối).
+# - Một worker làm mới tại một thời điểm (khóa file); các worker khác đọc ảnh chụp mới ở lần gọi kế tiếp.
+#   Các phép gom nhóm (bincount/unique) chạy trên mảng, không truy vấn database.
+#
+#   python analytics.py rebuild | refresh | status
+
+ANALYTICS_DIR = os.environ.get("ANALYTICS_DIR")
+TAIL_DAYS = int(os.environ.get("ANALYTICS_TAIL_DAYS", "3"))
+REFRESH_SECONDS = float(os.environ.get("ANALYTICS_REFRESH_SECONDS", "5"))
+REBUILD_HOURS = float(os.environ.get("ANALYTICS_REBUILD_HOURS", "24"))
+FETCH_SIZE = 50_000
+
+FORMAT_VERSION = 1
+PERIODS = ("day", "week", "month", "year")
+IMPORT, EXPORT = 0, 1
+WATCHED_TABLES = ("transactions", "products", "archived_months")
+
+logger = logs.get_logger("analytics")
+
+
+class AnalyticsUnavailable(RuntimeError):
+    """NumPy chưa được cài đặt."""
+
+
+def default_dir(url: str = database.SQLALCHEMY_DATABASE_URL) -> str:
+    digest = hashlib.sha1(str(url).encode("utf-8")).hexdigest()[:12]
+    return ANALYTICS_DIR or os.path.join(tempfile.gettempdir(), f"wms-analytics-{digest}")
+
+
+def _dtypes() -> Dict[str, Any]:
+    return {"day": np.int32, "type": np.int8, "product": np.int32, "quantity": np.int32, "price": np.float64}
+
+
+def to_day(value: datetime.date) -> int:
+    """Số ngày kể từ 1970-01-01 (giống datetime64[D])."""
+    return (value - datetime.date(1970, 1, 1)).days
+
+
+class Snapshot:
+    """Ảnh chụp trong ANALYTICS_DIR: đọc (mmap) từ mọi worker, ghi bởi một worker giữ khóa file."""
+
+    def __init__(self, directory: str):
+        if np is None:
+            raise AnalyticsUnavailable("NumPy is not installed")
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._meta: Dict[str, Any] = {}
+        self._meta_stamp: Optional[Tuple[int, int]] = None
+        self._segments: Dict[str, Dict[str, "np.ndarray"]] = {}
+        self._products: Optional[Dict[str, Any]] = None
+        self._checked_at = 0.0
+
+    # --- Đọc ---
+
+    def _meta_path(self) -> str:
+        return os.path.join(self.directory, "snapshot.json")
+
+    def _load_meta(self) -> Dict[str, Any]:
+        try:
+            stat = os.stat(self._meta_path())
+        except FileNotFoundError:
+            return {}
+        stamp = (stat.st_mtime_ns, stat.st_ino)
+        if stamp != self._meta_stamp:
+            with open(self._meta_path(), encoding="utf-8") as file:
+                meta = json.load(file)
+            if meta.get("format") != FORMAT_VERSION:
+                return {}
+            names = {segment["name"] for segment in meta["segments"]}
+            self._segments = {name: arrays for name, arrays in self._segments.items() if name in names}
+            if self._products is not None and self._products["name"] != meta["products"]:
+                self._products = None
+            self._meta, self._meta_stamp = meta, stamp
+        return self._meta
+
+    def _segment(self, name: str) -> Dict[str, "np.ndarray"]:
+        arrays = self._segments.get(name)
+        if arrays is None:
+            path = os.path.join(self.directory, name)
+            arrays = {column: np.load(os.path.join(path, f"{column}.npy"), mmap_mode="r") for column in _dtypes()}
+            self._segments[name] = arrays
+        return arrays
+
+    def segments(self, day_from: Optional[int] = None, day_to: Optional[int] = None):
+        """Các đoạn có khoảng ngày giao với [day_from, day_to] (bao gồm hai đầu)."""
+        for segment in self._meta.get("segments", []):
+            if segment["rows"] == 0:
+                continue
+            if day_from is not None and segment["day_to"] <= day_from:
+                continue
+            if day_to is not None and segment["day_from"] > day_to:
+                continue
+            yield self._segment(segment["name"])
+
+    def products(self) -> Dict[str, Any]:
+        """{"ids": [...], "names": [...], "categories": [...], "price", "stock", "category", "present"}, chỉ số = mã sản phẩm trong đoạn."""
+        if self._products is None:
+            name = self._meta["products"]
+            path = os.path.join(self.directory, name)
+            with open(os.path.join(path, "labels.json"), encoding="utf-8") as file:
+                labels = json.load(file)
+            arrays = {column: np.load(os.path.join(path, f"{column}.npy"), mmap_mode="r") for column in ("price", "stock", "category", "present")}
+            self._products = dict(labels, **arrays, name=name)
+        return self._products
+
+    def status(self) -> Dict[str, Any]:
+        meta = self._load_meta()
+        return {
+            "built_at": meta.get("built_at"),
+            "refreshed_at": meta.get("refreshed_at"),
+            "rows": sum(segment["rows"] for segment in meta.get("segments", [])),
+            "segments": len(meta.get("segments", [])),
+            "tail_from": str(np.datetime64(meta["tail_from"], "D")) if meta else None,
+            "products": meta.get("product_count", 0),
+        }
+
+    # --- Làm mới ---
+
+    def _write_arrays(self, prefix: str, arrays: Dict[str, "np.ndarray"]) -> str:
+        name = f"{prefix}-{time.time_ns():x}{secrets.token_hex(2)}"
+        work = os.path.join(self.directory, name + ".tmp")
+        os.makedirs(work)
+        for column, values in arrays.items():
+            np.save(os.path.join(work, f"{column}.npy"), values)
+        os.replace(work, os.path.join(self.directory, name))
+        return name
+
+    def _write_meta(self, meta: Dict[str, Any]) -> None:
+        work = self._meta_path() + ".tmp"
+        with open(work, "w", encoding="utf-8") as file:
+            json.dump(meta, file)
+        os.replace(work, self._meta_path())
+        # Xóa các đoạn không còn được dùng sau một khoảng chờ: worker khác có thể vừa đọc snapshot.json cũ
+        # và chưa mở đoạn (đoạn đã mmap thì vẫn đọc được sau khi xóa trên Linux/macOS)
+        used = {segment["name"] for segment in meta["segments"]} | {meta["products"]}
+        expired = time.time() - max(60.0, 4 * REFRESH_SECONDS)
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if os.path.isdir(path) and name not in used and os.path.getmtime(path) < expired:
+                shutil.rmtree(path, ignore_errors=True)
+
+    def ensure_fresh(self, force: bool = False) -> None:
+        """Làm mới nếu đã quá REFRESH_SECONDS từ lần kiểm tra trước và có bảng liên quan đã thay đổi."""
+        now = time.monotonic()
+        if not force and now - self._checked_at < REFRESH_SECONDS and self._meta:
+            return
+        with self._lock:
+            if not force and time.monotonic() - self._checked_at < REFRESH_SECONDS and self._meta:
+                return
+            meta = self._load_meta()
+            if force or self._is_stale(meta):
+                handle = open(os.path.join(self.directory, "snapshot.lock"), "a+b")
+                try:
+                    versions.lock_file(handle)
+                    try:
+                        # Worker khác có thể vừa làm mới xong trong lúc chờ khóa
+                        meta = self._load_meta()
+                        if force or self._is_stale(meta):
+                            with database.SessionLocal() as db:
+                                self._refresh(db, meta)
+                            self._load_meta()
+                    finally:
+                        versions.unlock_file(handle)
+                finally:
+                    handle.close()
+            self._checked_at = time.monotonic()
+
+    def _is_stale(self, meta: Dict[str, Any]) -> bool:
+        if not meta:
+            return True
+        table_versions = versions.get_versions()
+        return meta["versions"] != [table_versions.epoch, *table_versions.read(WATCHED_TABLES).values()] or \
+            meta["tail_from"] < to_day(datetime.date.today()) - TAIL_DAYS
+
+    def _refresh(self, db: Session, meta: Dict[str, Any]) -> None:
+        table_versions = versions.get_versions()
+        # Đọc phiên bản TRƯỚC khi đọc dữ liệu: thay đổi xen giữa sẽ được thấy ở lần làm mới sau
+        stamp = [table_versions.epoch, *table_versions.read(WATCHED_TABLES).values()]
+        rebuild = not meta or meta.get("directory_epoch") != table_versions.epoch or \
+            time.time() - meta["built_epoch"] > REBUILD_HOURS * 3600
+        builder = _Builder(self, db, meta if not rebuild else None)
+        if not rebuild:
+            rebuild = not builder.refresh()
+        if rebuild:
+            logger.info("Dựng lại ảnh chụp phân tích")
+            builder = _Builder(self, db, None)
+            builder.rebuild()
+        db.rollback()
+        self._write_meta(builder.meta(stamp, rebuild))
+
+    # --- Truy vấn (vector hóa) ---
+
+    def revenue(self, period: str, day_from: Optional[int] = None, day_to: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Doanh thu, số lượng và số phiếu xuất theo ngày/tuần/tháng/năm."""
+        keys, revenue, quantity, orders = [], [], [], []
+        for segment in self.segments(day_from, day_to):
+            mask = _mask(segment, day_from, day_to, EXPORT)
+            days = segment["day"][mask]
+            if not len(days):
+                continue
+            unique, inverse = np.unique(_period_keys(days, period), return_inverse=True)
+            amounts = segment["quantity"][mask].astype(np.float64) * segment["price"][mask]
+            keys.append(unique)
+            revenue.append(np.bincount(inverse, weights=amounts))
+            quantity.append(np.bincount(inverse, weights=segment["quantity"][mask]))
+            orders.append(np.bincount(inverse))
+        if not keys:
+            return []
+        unique, inverse = np.unique(np.concatenate(keys), return_inverse=True)
+        totals = [np.bincount(inverse, weights=np.concatenate(values)) for values in (revenue, quantity, orders)]
+        return [
+            {"period": _period_label(key, period), "total_revenue": float(total), "total_quantity": int(qty), "order_count": int(count)}
+            for key, total, qty, count in zip(unique.tolist(), *totals)
+        ]
+
+    def product_totals(self, day_from: Optional[int] = None, day_to: Optional[int] = None) -> Dict[str, "np.ndarray"]:
+        """Mảng theo mã sản phẩm: tổng nhập, tổng xuất và doanh thu trong khoảng ngày."""
+        size = len(self.products()["ids"])
+        imports, exports, revenue = np.zeros(size, np.int64), np.zeros(size, np.int64), np.zeros(size)
+        for segment in self.segments(day_from, day_to):
+            mask = _mask(segment, day_from, day_to)
+            product, kind = segment["product"][mask], segment["type"][mask]
+            quantity = segment["quantity"][mask].astype(np.int64)
+            exported = kind == EXPORT
+            imports += np.bincount(product[~exported], weights=quantity[~exported], minlength=size).astype(np.int64)
+            exports += np.bincount(product[exported], weights=quantity[exported], minlength=size).astype(np.int64)
+            revenue += np.bincount(product[exported], weights=quantity[exported] * segment["price"][mask][exported], minlength=size)
+        return {"imports": imports, "exports": exports, "revenue": revenue}
+
+    def product_report(self, day_from: Optional[int] = None, day_to: Optional[int] = None) -> List[Dict[str, Any]]:
+        products, totals = self.products(), self.product_totals(day_from, day_to)
+        codes = np.flatnonzero((totals["imports"] != 0) | (totals["exports"] != 0))
+        return [_product_row(products, totals, code) for code in codes.tolist()]
+
+    def top_products(self, limit: int, day_from: Optional[int] = None, day_to: Optional[int] = None) -> List[Dict[str, Any]]:
+        """limit sản phẩm có số lượng xuất lớn nhất trong khoảng ngày."""
+        products, totals = self.products(), self.product_totals(day_from, day_to)
+        exports = totals["exports"]
+        candidates = np.flatnonzero(exports > 0)
+        if len(candidates) > limit:
+            candidates = candidates[np.argpartition(-exports[candidates], limit - 1)[:limit]]
+        order = candidates[np.lexsort((candidates, -exports[candidates]))]
+        return [_product_row(products, totals, code) for code in order.tolist()]
+
+    def inventory_value(self) -> Dict[str, Any]:
+        """Tổng giá trị tồn kho (price * stock) và theo loại sản phẩm."""
+        products = self.products()
+        present = products["present"]
+        values = np.where(present, products["price"] * products["stock"], 0.0)
+        by_category = np.bincount(products["category"], weights=values, minlength=len(products["categories"]))
+        counts = np.bincount(products["category"], weights=present.astype(np.float64), minlength=len(products["categories"]))
+        return {
+            "total_value": float(values.sum()),
+            "total_stock": int(np.where(present, products["stock"], 0).sum()),
+            "by_category": [
+                {"category": category, "value": float(value), "product_count": int(count)}
+                for category, value, count in zip(products["categories"], by_category.tolist(), counts.tolist())
+                if count
+            ],
+        }
+
+
+def _mask(segment: Dict[str, "np.ndarray"], day_from: Optional[int], day_to: Optional[int], kind: Optional[int] = None):
+    mask = np.ones(len(segment["day"]), dtype=bool)
+    if day_from is not None:
+        mask &= segment["day"] >= day_from
+    if day_to is not None:
+        mask &= segment["day"] <= day_to
+    if kind is not None:
+        mask &= segment["type"] == kind
+    return mask
+
+
+def _period_keys(days: "np.ndarray", period: str) -> "np.ndarray":
+    if period == "day":
+        return days.astype(np.int64)
+    if period == "week":
+        # 1970-01-01 là thứ Năm: tuần bắt đầu từ thứ Hai
+        return (days.astype(np.int64) + 3) // 7
+    unit = "M" if period == "month" else "Y"
+    return days.astype("datetime64[D]").astype(f"datetime64[{unit}]").astype(np.int64)
+
+
+def _period_label(key: int, period: str) -> str:
+    if period == "day":
+        return str(np.datetime64(key, "D"))
+    if period == "week":
+        return str(np.datetime64(key * 7 - 3, "D"))
+    return str(np.datetime64(key, "M" if period == "month" else "Y"))
+
+
+def _product_row(products: Dict[str, Any], totals: Dict[str, "np.ndarray"], code: int) -> Dict[str, Any]:
+    return {
+        "product_id": products["ids"][code],
+        "product_name": products["names"][code],
+        "total_imports": int(totals["imports"][code]),
+        "total_exports": int(totals["exports"][code]),
+        "revenue": float(totals["revenue"][code]),
+    }
+
+
+class _Builder:
+    """Tạo các đoạn mới cho một lần làm mới (gọi khi giữ khóa file)."""
+
+    def __init__(self, snapshot: Snapshot, db: Session, meta: Optional[Dict[str, Any]]):
+        self.snapshot, self.db = snapshot, db
+        self.old = meta or {}
+        self.ids: List[str] = []
+        self.codes: Dict[str, int] = {}
+        if meta:
+            with open(os.path.join(snapshot.directory, meta["products"], "labels.json"), encoding="utf-8") as file:
+                self.ids = json.load(file)["ids"]
+            self.codes = {product_id: code for code, product_id in enumerate(self.ids)}
+        self.segments: List[Dict[str, Any]] = []
+        self.tail_from = to_day(datetime.date.today()) - TAIL_DAYS
+        self.built_epoch = meta["built_epoch"] if meta else time.time()
+        self.offset = 0
+
+    def _code(self, product_id: str) -> int:
+        code = self.codes.get(product_id)
+        if code is None:
+            code = self.codes[product_id] = len(self.ids)
+            self.ids.append(product_id)
+        return code
+
+    def _columns(self, rows: Sequence[Tuple[Any, ...]]) -> Dict[str, "np.ndarray"]:
+        """rows: (date, type, product_id, quantity, price)."""
+        dtypes = _dtypes()
+        return {
+            "day": np.fromiter((to_day(row[0]) for row in rows), dtypes["day"], len(rows)),
+            "type": np.fromiter((EXPORT if row[1] == "export" else IMPORT for row in rows), dtypes["type"], len(rows)),
+            "product": np.fromiter((self._code(row[2]) for row in rows), dtypes["product"], len(rows)),
+            "quantity": np.fromiter((row[3] for row in rows), dtypes["quantity"], len(rows)),
+            "price": np.fromiter((row[4] for row in rows), dtypes["price"], len(rows)),
+        }
+
+    def _add_segment(self, rows, day_from: int, day_to: int, source: str = "db") -> None:
+        name = self.snapshot._write_arrays("seg", self._columns(rows))
+        self.segments.append({"name": name, "day_from": day_from, "day_to": day_to, "rows": len(rows), "source": source})
+
+    def _read(self, day_from: Optional[int], day_to: Optional[int]) -> List[Tuple[Any, ...]]:
+        table = models.Transaction.__table__
+        # type IN (...) để dùng index (type, date)
+        stmt = select(table.c.date, table.c.type, table.c.product_id, table.c.quantity, table.c.price).where(
+            table.c.type.in_(archive.TYPES)
+        )
+        epoch = datetime.date(1970, 1, 1)
+        if day_from is not None:
+            stmt = stmt.where(table.c.date >= epoch + datetime.timedelta(days=day_from))
+        if day_to is not None:
+            stmt = stmt.where(table.c.date < epoch + datetime.timedelta(days=day_to))
+        rows: List[Tuple[Any, ...]] = []
+        for partition in self.db.execute(stmt.execution_options(yield_per=FETCH_SIZE)).partitions():
+            rows.extend(tuple(row) for row in partition)
+        return rows
+
+    def _counter(self) -> int:
+        return int(stats.read(self.db, [stats.TRANSACTIONS_COUNT])[stats.TRANSACTIONS_COUNT])
+
+    def rebuild(self) -> None:
+        """Đọc lại toàn bộ: mỗi tháng đã lưu trữ một đoạn, phần bảng nóng trước đoạn cuối theo tháng."""
+        self.built_epoch = time.time()
+        for entry in self.db.execute(select(models.ArchivedMonth).order_by(models.ArchivedMonth.month)).scalars():
+            data = archive.read_file(entry.file)
+            start, end = archive.month_bounds(entry.month)
+            rows = list(zip(data["date"], data["type"], data["product_id"], data["quantity"], data["price"]))
+            self._add_segment(rows, to_day(start), to_day(end), f"archive:{entry.file}")
+
+        table = models.Transaction.__table__
+        oldest = [
+            self.db.execute(select(func.min(table.c.date)).where(table.c.type == kind)).scalar() for kind in archive.TYPES
+        ]
+        oldest = [day for day in oldest if day is not None]
+        if oldest:
+            month = min(oldest).replace(day=1)
+            while to_day(month) < self.tail_from:
+                end = archive.month_bounds(month.strftime("%Y-%m"))[1]
+                day_to = min(to_day(end), self.tail_from)
+                rows = self._read(to_day(month), day_to)
+                if rows:
+                    self._add_segment(rows, to_day(month), day_to)
+                month = end
+        self._add_segment(self._read(self.tail_from, None), self.tail_from, 2 ** 31 - 1)
+        self.offset = self._counter() - sum(segment["rows"] for segment in self.segments)
+        if self.offset:
+            logger.warning("Ảnh chụp phân tích lệch %d dòng so với bộ đếm giao dịch (chạy stats.py check)", self.offset)
+
+    def refresh(self) -> bool:
+        """Niêm phong phần cũ của đoạn cuối và đọc lại đoạn cuối. False nếu cần dựng lại toàn bộ."""
+        old_tail_from = self.old["tail_from"]
+        self.segments = [segment for segment in self.old["segments"] if segment["day_from"] < old_tail_from]
+        archived = {
+            f"archive:{name}" for name in self.db.execute(select(models.ArchivedMonth.file)).scalars()
+        }
+        if {segment["source"] for segment in self.segments if segment["source"].startswith("archive:")} != archived:
+            # Có tháng vừa được lưu trữ/khôi phục: giao dịch không đổi nhưng ranh giới các đoạn thì đổi
+            return False
+        if self.tail_from > old_tail_from:
+            rows = self._read(old_tail_from, self.tail_from)
+            self._add_segment(rows, old_tail_from, self.tail_from)
+        else:
+            self.tail_from = old_tail_from
+        self._add_segment(self._read(self.tail_from, None), self.tail_from, 2 ** 31 - 1)
+        self.offset = self.old["offset"]
+        return self._counter() - sum(segment["rows"] for segment in self.segments) == self.offset
+
+    def _products(self) -> str:
+        rows = self.db.execute(
+            select(models.Product.id, models.Product.name, models.Product.category, models.Product.price, models.Product.stock)
+        ).all()
+        for row in rows:
+            self._code(row.id)
+        size = len(self.ids)
+        categories = sorted({row.category or "" for row in rows})
+        category_codes = {category: code for code, category in enumerate(categories)}
+        names: List[Optional[str]] = [None] * size
+        arrays = {
+            "price": np.zeros(size), "stock": np.zeros(size, np.int64),
+            "category": np.zeros(size, np.int32), "present": np.zeros(size, bool),
+        }
+        for row in rows:
+            code = self.codes[row.id]
+            names[code] = row.name
+            arrays["price"][code] = row.price or 0.0
+            arrays["stock"][code] = row.stock or 0
+            arrays["category"][code] = category_codes[row.category or ""]
+            arrays["present"][code] = True
+        name = self.snapshot._write_arrays("products", arrays)
+        with open(os.path.join(self.snapshot.directory, name, "labels.json"), "w", encoding="utf-8") as file:
+            json.dump({"ids": self.ids, "names": names, "categories": categories}, file, ensure_ascii=False)
+        return name
+
+    def meta(self, stamp: List[int], rebuilt: bool) -> Dict[str, Any]:
+        now = datetime.datetime.now().isoformat(timespec="seconds")
+        products = self._products()
+        return {
+            "format": FORMAT_VERSION,
+            "directory_epoch": stamp[0],
+            "versions": stamp,
+            "built_epoch": self.built_epoch,
+            "built_at": now if rebuilt else self.old.get("built_at"),
+            "refreshed_at": now,
+            "tail_from": self.tail_from,
+            "offset": self.offset,
+            "segments": self.segments,
+            "products": products,
+            "product_count": len(self.ids),
+        }
+
+
+_snapshot: Optional[Snapshot] = None
+_snapshot_lock = threading.Lock()
+
+
+def get_snapshot() -> Snapshot:
+    """Ảnh chụp của worker, đã làm mới nếu cần. Gọi trong threadpool (có thể đọc database và ghi file)."""
+    global _snapshot
+    with _snapshot_lock:
+        if _snapshot is None:
+            _snapshot = Snapshot(default_dir())
+    _snapshot.ensure_fresh()
+    return _snapshot
+
+
+def available() -> bool:
+    return np is not None
+
+
+if __name__ == "__main__":
+    # python analytics.py rebuild | refresh | status
+    commands = ("rebuild", "refresh", "status")
+    if len(sys.argv) != 2 or sys.argv[1] not in commands:
+        print("Usage: python analytics.py rebuild|refresh|status")
+        sys.exit(1)
+    if np is None:
+        print("Cần cài đặt NumPy: pip install numpy")
+        sys.exit(1)
+    logs.setup()
+    snapshot = Snapshot(default_dir())
+    if sys.argv[1] == "rebuild":
+        # Bỏ ảnh chụp hiện có để lần làm mới dựng lại từ đầu
+        try:
+            os.remove(snapshot._meta_path())
+        except FileNotFoundError:
+            pass
+    if sys.argv[1] != "status":
+        started = time.perf_counter()
+        snapshot.ensure_fresh(force=True)
+        print(f"Đã làm mới ảnh chụp trong {time.perf_counter() - started:.2f}s")
+    print(json.dumps(snapshot.status(), ensure_ascii=False, indent=2))
+    logs.shutdown()
+    sys.exit(0)
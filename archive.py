@@ -0,0 +1,519 @@
+import bisect
+import datetime
+import gzip
+import hashlib
+import heapq
+import json
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from operator import attrgetter
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import case, delete, func, insert, select, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+import logs
+import models
+
+# Lưu trữ lạnh các tháng giao dịch đã đóng sổ.
+#
+# Bảng transactions chỉ tăng; các tháng cũ hơn ARCHIVE_KEEP_MONTHS tháng được chuyển sang file nén dạng cột
+# (mỗi tháng một file JSON gzip trong ARCHIVE_DIR, mỗi cột là một mảng, dòng sắp theo mã) và bị xóa khỏi bảng,
+# để bảng nóng và các index của nó vừa trong buffer pool.
+#
+# - Danh mục (manifest) là bảng archived_months, cập nhật CÙNG giao dịch DB với lệnh xóa các dòng đã chuyển:
+#   file mới được ghi xong trước, rồi mới commit danh mục trỏ tới nó, nên danh mục luôn trỏ tới một file đầy đủ.
+# - Tổng nhập/xuất theo sản phẩm của từng tháng được lưu ở archived_product_totals, theo (sản phẩm, kho) ở
+#   archived_warehouse_totals; tổng theo tháng ở chính archived_months. Báo cáo tồn kho và việc đối chiếu số liệu
+#   (stats.drift) cộng các tổng này với bảng nóng thay vì đọc file. Các bộ đếm tăng dần (stats.py) không đổi khi
+#   lưu trữ vì giao dịch không bị hủy. Tháng lưu trữ trước khi có archived_warehouse_totals/archived_customer_months
+#   bị `verify` báo lệch: khôi phục (restore) rồi lưu trữ lại tháng đó.
+# - GET /transactions (phân trang theo mã) và /transactions/export đọc cả file lưu trữ; các file vừa đọc được
+#   giữ trong bộ nhớ của worker (ARCHIVE_CACHE_MONTHS tháng gần nhất được dùng).
+# - Đơn hàng của khách hàng gộp cả file lưu trữ, chỉ đọc các tháng có đơn của khách hàng đó
+#   (archived_customer_months). Tìm kiếm giao dịch (?search=) chỉ tra trên bảng nóng; khi có tháng đã lưu trữ,
+#   response có header X-Archived-Months-Excluded (số tháng không được tìm). Phiếu đã lưu trữ không xóa được
+#   qua API; khôi phục tháng đó trước (restore).
+# - Phiếu có ngày thuộc tháng đã lưu trữ được thêm sau đó vẫn nằm ở bảng nóng; chạy archive lại sẽ gộp vào file.
+#
+#   python archive.py archive [--keep-months 12] [--month 2024-05]
+#   python archive.py restore --month 2024-05
+#   python archive.py list | verify
+
+ARCHIVE_DIR = os.environ.get("ARCHIVE_DIR", "archive")
+KEEP_MONTHS = int(os.environ.get("ARCHIVE_KEEP_MONTHS", "12"))
+CACHE_MONTHS = int(os.environ.get("ARCHIVE_CACHE_MONTHS", "3"))
+BATCH_SIZE = 5000
+# Header của response chỉ tra trên bảng nóng (tìm kiếm giao dịch): số tháng đã lưu trữ không được tìm
+EXCLUDED_HEADER = "X-Archived-Months-Excluded"
+
+FORMAT = "wms-transactions-columnar"
+FORMAT_VERSION = 1
+TYPES = ("import", "export")
+
+logger = logs.get_logger("archive")
+
+
+class ArchiveConflict(RuntimeError):
+    """Dữ liệu của tháng thay đổi trong lúc lưu trữ/khôi phục (đã rollback, chạy lại là được)."""
+
+
+def columns() -> List[str]:
+    return [column.name for column in models.Transaction.__table__.columns]
+
+
+def month_bounds(month: str) -> Tuple[datetime.date, datetime.date]:
+    """Ngày đầu tháng và ngày đầu tháng kế tiếp của "YYYY-MM"."""
+    start = datetime.datetime.strptime(month, "%Y-%m").date()
+    end = (start + datetime.timedelta(days=32)).replace(day=1)
+    return start, end
+
+
+def cutoff(keep_months: int = KEEP_MONTHS, today: Optional[datetime.date] = None) -> datetime.date:
+    """
+    Ngày đầu của tháng nóng cũ nhất: giữ tháng hiện tại và keep_months tháng trước đó ở bảng nóng,
+    các tháng trước nữa được lưu trữ.
+    """
+    if keep_months < 0:
+        raise ValueError("keep_months must be >= 0")
+    today = today or datetime.date.today()
+    index = today.year * 12 + today.month - 1 - keep_months
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+
+# --- File lưu trữ ---
+
+def _path(name: str, directory: str) -> str:
+    return os.path.join(directory, name)
+
+
+def write_file(month: str, data: Dict[str, List[Any]], directory: str = ARCHIVE_DIR) -> Tuple[str, str]:
+    """Ghi một tháng (dạng cột) ra file mới; trả về (tên file, sha256). Không bao giờ ghi đè file đang dùng."""
+    os.makedirs(directory, exist_ok=True)
+    name = f"transactions-{month}-{time.time_ns():x}.json.gz"
+    payload = {
+        "format": FORMAT,
+        "version": FORMAT_VERSION,
+        "month": month,
+        "rows": len(data["id"]),
+        "columns": {
+            name: [value.isoformat() if isinstance(value, datetime.date) else value for value in values]
+            for name, values in data.items()
+        },
+    }
+    content = gzip.compress(json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8"), compresslevel=6)
+    path = _path(name, directory)
+    with open(path + ".tmp", "wb") as file:
+        file.write(content)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(path + ".tmp", path)
+    return name, hashlib.sha256(content).hexdigest()
+
+
+def read_file(name: str, directory: str = ARCHIVE_DIR) -> Dict[str, List[Any]]:
+    """Đọc file lưu trữ thành {cột: mảng giá trị}; cột có trong bảng nhưng chưa có trong file nhận None."""
+    with open(_path(name, directory), "rb") as file:
+        payload = json.loads(gzip.decompress(file.read()))
+    if payload.get("format") != FORMAT or payload.get("version") != FORMAT_VERSION:
+        raise ValueError(f"{name}: unsupported archive format")
+    stored, count = payload["columns"], payload["rows"]
+    data = {name: stored.get(name, [None] * count) for name in columns()}
+    data["date"] = [datetime.date.fromisoformat(value) for value in data["date"]]
+    return data
+
+
+def _remove_file(name: str, directory: str) -> None:
+    try:
+        os.remove(_path(name, directory))
+    except FileNotFoundError:
+        pass
+
+
+def _summarize(data: Dict[str, List[Any]]) -> Tuple[Dict[str, Any], Dict[str, Dict[str, int]], Dict[Tuple[str, str], Dict[str, int]]]:
+    """
+    Tổng hợp của tháng (cho archived_months), tổng nhập/xuất theo sản phẩm và theo (sản phẩm, kho)
+    (chỉ các phiếu gắn với kho).
+    """
+    summary = dict(row_count=len(data["id"]), import_quantity=0, export_quantity=0, revenue=0.0, order_count=0)
+    products: Dict[str, Dict[str, int]] = {}
+    warehouses: Dict[Tuple[str, str], Dict[str, int]] = {}
+    for kind, product_id, warehouse_id, quantity, price in zip(
+        data["type"], data["product_id"], data["warehouse_id"], data["quantity"], data["price"]
+    ):
+        targets = [products.setdefault(product_id, {"total_imports": 0, "total_exports": 0})]
+        if warehouse_id is not None:
+            targets.append(warehouses.setdefault((product_id, warehouse_id), {"total_imports": 0, "total_exports": 0}))
+        if kind == "import":
+            summary["import_quantity"] += quantity
+            for totals in targets:
+                totals["total_imports"] += quantity
+        elif kind == "export":
+            summary["export_quantity"] += quantity
+            summary["revenue"] += quantity * price
+            summary["order_count"] += 1
+            for totals in targets:
+                totals["total_exports"] += quantity
+    summary["first_id"], summary["last_id"] = data["id"][0], data["id"][-1]
+    return summary, products, warehouses
+
+
+def _customer_orders(data: Dict[str, List[Any]]) -> Dict[str, int]:
+    """Số đơn hàng (phiếu xuất) của từng khách hàng trong tháng (cho archived_customer_months)."""
+    counts: Dict[str, int] = {}
+    for kind, customer_id in zip(data["type"], data["customer_id"]):
+        if kind == "export" and customer_id is not None:
+            counts[customer_id] = counts.get(customer_id, 0) + 1
+    return counts
+
+
+# --- Lưu trữ / khôi phục (đồng bộ, chạy từ dòng lệnh) ---
+
+def _month_rows(db: Session, month: str):
+    table = models.Transaction.__table__
+    start, end = month_bounds(month)
+    # type IN (...) để dùng index (type, date)
+    return db.execute(
+        select(table).where(table.c.type.in_(TYPES), table.c.date >= start, table.c.date < end).order_by(table.c.id)
+    ).mappings().all()
+
+
+def archive_month(db: Session, month: str, directory: str = ARCHIVE_DIR) -> int:
+    """
+    Chuyển các giao dịch nóng của tháng month vào file lưu trữ (gộp với file cũ nếu tháng đã được lưu trữ)
+    và commit. Trả về số dòng đã chuyển.
+    """
+    table = models.Transaction.__table__
+    rows = _month_rows(db, month)
+    if not rows:
+        db.rollback()
+        return 0
+    entry = db.get(models.ArchivedMonth, month)
+    data = read_file(entry.file, directory) if entry else {name: [] for name in columns()}
+    for row in rows:
+        for name in data:
+            data[name].append(row[name])
+    order = sorted(range(len(data["id"])), key=data["id"].__getitem__)
+    data = {name: [values[i] for i in order] for name, values in data.items()}
+
+    name, checksum = write_file(month, data, directory)
+    try:
+        ids = [row["id"] for row in rows]
+        deleted = 0
+        for start in range(0, len(ids), BATCH_SIZE):
+            deleted += db.execute(delete(table).where(table.c.id.in_(ids[start:start + BATCH_SIZE]))).rowcount
+        if deleted != len(ids):
+            # Có phiếu bị xóa (và đã hoàn tồn kho/doanh thu) sau khi đọc: không được đưa vào file
+            raise ArchiveConflict(f"{month}: {len(ids) - deleted} transactions changed while archiving")
+        summary, products, warehouses = _summarize(data)
+        values = dict(summary, file=name, checksum=checksum, archived_at=datetime.datetime.now())
+        old_file = entry.file if entry else None
+        if entry:
+            for key, value in values.items():
+                setattr(entry, key, value)
+        else:
+            db.add(models.ArchivedMonth(month=month, **values))
+        db.execute(delete(models.ArchivedProductTotal).where(models.ArchivedProductTotal.month == month))
+        db.execute(insert(models.ArchivedProductTotal), [
+            {"month": month, "product_id": product_id, **totals} for product_id, totals in products.items()
+        ])
+        db.execute(delete(models.ArchivedWarehouseTotal).where(models.ArchivedWarehouseTotal.month == month))
+        if warehouses:
+            db.execute(insert(models.ArchivedWarehouseTotal), [
+                {"month": month, "product_id": product_id, "warehouse_id": warehouse_id, **totals}
+                for (product_id, warehouse_id), totals in warehouses.items()
+            ])
+        db.execute(delete(models.ArchivedCustomerMonth).where(models.ArchivedCustomerMonth.month == month))
+        customers = _customer_orders(data)
+        if customers:
+            db.execute(insert(models.ArchivedCustomerMonth), [
+                {"month": month, "customer_id": customer_id, "order_count": count}
+                for customer_id, count in customers.items()
+            ])
+        db.commit()
+    except BaseException:
+        db.rollback()
+        _remove_file(name, directory)
+        raise
+    if old_file:
+        _remove_file(old_file, directory)
+    return len(rows)
+
+
+def archive_closed_months(db: Session, keep_months: int = KEEP_MONTHS, directory: str = ARCHIVE_DIR) -> Dict[str, int]:
+    """Lưu trữ mọi tháng trước cutoff(keep_months) còn dòng trong bảng nóng. Trả về {tháng: số dòng}."""
+    table = models.Transaction.__table__
+    before = cutoff(keep_months)
+    # MIN theo từng loại phiếu dùng được index (type, date)
+    oldest = [
+        db.execute(select(func.min(table.c.date)).where(table.c.type == kind, table.c.date < before)).scalar()
+        for kind in TYPES
+    ]
+    oldest = [day for day in oldest if day is not None]
+    moved = {}
+    if not oldest:
+        return moved
+    month = min(oldest).replace(day=1)
+    while month < before:
+        key = month.strftime("%Y-%m")
+        count = archive_month(db, key, directory)
+        if count:
+            moved[key] = count
+            logger.info("Đã lưu trữ %d giao dịch của tháng %s", count, key)
+        month = month_bounds(key)[1]
+    return moved
+
+
+def restore_month(db: Session, month: str, directory: str = ARCHIVE_DIR) -> int:
+    """Đưa các giao dịch của tháng đã lưu trữ trở lại bảng transactions và commit. Trả về số dòng."""
+    entry = db.get(models.ArchivedMonth, month)
+    if entry is None:
+        return 0
+    data = read_file(entry.file, directory)
+    names = list(data)
+    rows = [dict(zip(names, values)) for values in zip(*data.values())]
+    table = models.Transaction.__table__
+    for start in range(0, len(rows), BATCH_SIZE):
+        db.execute(insert(table), rows[start:start + BATCH_SIZE])
+    db.execute(delete(models.ArchivedProductTotal).where(models.ArchivedProductTotal.month == month))
+    db.execute(delete(models.ArchivedWarehouseTotal).where(models.ArchivedWarehouseTotal.month == month))
+    db.execute(delete(models.ArchivedCustomerMonth).where(models.ArchivedCustomerMonth.month == month))
+    name = entry.file
+    db.delete(entry)
+    db.commit()
+    _remove_file(name, directory)
+    return len(rows)
+
+
+def verify(db: Session, directory: str = ARCHIVE_DIR) -> List[str]:
+    """Kiểm tra file của từng tháng trong danh mục (tồn tại, checksum, số dòng, tổng hợp). Trả về các lỗi."""
+    problems = []
+    for entry in db.execute(select(models.ArchivedMonth).order_by(models.ArchivedMonth.month)).scalars():
+        path = _path(entry.file, directory)
+        if not os.path.exists(path):
+            problems.append(f"{entry.month}: missing file {entry.file}")
+            continue
+        with open(path, "rb") as file:
+            if hashlib.sha256(file.read()).hexdigest() != entry.checksum:
+                problems.append(f"{entry.month}: checksum mismatch")
+                continue
+        data = read_file(entry.file, directory)
+        summary, products, warehouses = _summarize(data)
+        for key, value in summary.items():
+            if key == "revenue" and abs(value - entry.revenue) <= 1e-6 * max(1.0, abs(value)):
+                continue
+            if getattr(entry, key) != value:
+                problems.append(f"{entry.month}: {key} {getattr(entry, key)} != {value}")
+        stored = {
+            row.product_id: {"total_imports": row.total_imports, "total_exports": row.total_exports}
+            for row in db.execute(select(models.ArchivedProductTotal).where(models.ArchivedProductTotal.month == entry.month)).scalars()
+        }
+        if stored != products:
+            problems.append(f"{entry.month}: archived_product_totals mismatch")
+        stored = {
+            (row.product_id, row.warehouse_id): {"total_imports": row.total_imports, "total_exports": row.total_exports}
+            for row in db.execute(select(models.ArchivedWarehouseTotal).where(models.ArchivedWarehouseTotal.month == entry.month)).scalars()
+        }
+        if stored != warehouses:
+            problems.append(f"{entry.month}: archived_warehouse_totals mismatch")
+        stored = {
+            row.customer_id: row.order_count
+            for row in db.execute(select(models.ArchivedCustomerMonth).where(models.ArchivedCustomerMonth.month == entry.month)).scalars()
+        }
+        if stored != _customer_orders(data):
+            problems.append(f"{entry.month}: archived_customer_months mismatch")
+    return problems
+
+
+# --- Đọc dữ liệu lưu trữ khi phục vụ request ---
+
+async def months(db: AsyncSession, month_from: Optional[str] = None, month_to: Optional[str] = None):
+    """Các dòng danh mục (tháng, file, first_id, last_id, ...) theo thứ tự tháng, lọc theo khoảng tháng."""
+    table = models.ArchivedMonth.__table__
+    stmt = select(table).order_by(table.c.month)
+    if month_from:
+        stmt = stmt.where(table.c.month >= month_from)
+    if month_to:
+        stmt = stmt.where(table.c.month <= month_to)
+    return (await db.execute(stmt)).all()
+
+
+async def customer_months(db: AsyncSession, customer_id: str):
+    """Các dòng danh mục của những tháng đã lưu trữ có đơn hàng của khách hàng, theo thứ tự tháng."""
+    table, index = models.ArchivedMonth.__table__, models.ArchivedCustomerMonth.__table__
+    stmt = select(table).join(index, index.c.month == table.c.month).where(
+        index.c.customer_id == customer_id
+    ).order_by(table.c.month)
+    return (await db.execute(stmt)).all()
+
+
+class ArchiveReader:
+    """Đọc file lưu trữ, giữ ARCHIVE_CACHE_MONTHS file dùng gần nhất trong bộ nhớ (tên file đổi mỗi lần ghi)."""
+
+    def __init__(self, directory: str = ARCHIVE_DIR, cache_months: int = CACHE_MONTHS):
+        self.directory = directory
+        self.cache_months = cache_months
+        self._lock = threading.Lock()
+        self._files: "OrderedDict[str, Dict[str, List[Any]]]" = OrderedDict()
+
+    def load(self, name: str) -> Dict[str, List[Any]]:
+        with self._lock:
+            data = self._files.get(name)
+            if data is not None:
+                self._files.move_to_end(name)
+                return data
+        data = read_file(name, self.directory)
+        with self._lock:
+            self._files[name] = data
+            while len(self._files) > self.cache_months:
+                self._files.popitem(last=False)
+        return data
+
+    def page(self, entries: Sequence[Any], after_id: Optional[str], count: Optional[int]) -> List[SimpleNamespace]:
+        """Tối đa count giao dịch lưu trữ có mã > after_id, theo thứ tự mã (giống phân trang bảng nóng)."""
+        result: List[SimpleNamespace] = []
+        for entry in sorted(entries, key=attrgetter("first_id")):
+            if after_id is not None and entry.last_id <= after_id:
+                continue
+            # Các tháng sau đều bắt đầu từ mã lớn hơn: không thể lọt vào count dòng đầu
+            if count is not None and len(result) >= count and entry.first_id > result[-1].id:
+                break
+            data = self.load(entry.file)
+            start = 0 if after_id is None else bisect.bisect_right(data["id"], after_id)
+            stop = len(data["id"]) if count is None else min(len(data["id"]), start + count)
+            names = list(data)
+            rows = [SimpleNamespace(**dict(zip(names, (data[name][i] for name in names)))) for i in range(start, stop)]
+            result = list(heapq.merge(result, rows, key=attrgetter("id")))
+            if count is not None:
+                del result[count:]
+        return result
+
+    def select(self, entry: Any, names: Sequence[str], date_from: Optional[datetime.date] = None,
+               date_to: Optional[datetime.date] = None, type: Optional[str] = None,
+               customer_id: Optional[str] = None) -> List[Tuple[Any, ...]]:
+        """Các dòng (chỉ gồm cột names) của một tháng thỏa điều kiện, theo thứ tự mã."""
+        data = self.load(entry.file)
+        wanted = [
+            i for i, (day, kind, customer) in enumerate(zip(data["date"], data["type"], data["customer_id"]))
+            if (date_from is None or day >= date_from) and (date_to is None or day <= date_to) and (type is None or kind == type)
+            and (customer_id is None or customer == customer_id)
+        ]
+        return [tuple(data[name][i] for name in names) for i in wanted]
+
+
+_reader: Optional[ArchiveReader] = None
+
+
+def get_reader() -> ArchiveReader:
+    global _reader
+    if _reader is None:
+        _reader = ArchiveReader()
+    return _reader
+
+
+def merge_by_id(hot: Sequence[Any], archived: Sequence[Any], count: Optional[int]) -> List[Any]:
+    """Gộp hai danh sách đã sắp theo mã, giữ count dòng đầu (None: tất cả)."""
+    if not archived:
+        return list(hot)
+    merged = list(heapq.merge(hot, archived, key=attrgetter("id")))
+    return merged if count is None else merged[:count]
+
+
+def product_totals():
+    """Subquery (product_id, total_imports, total_exports) gồm cả bảng nóng và các tháng đã lưu trữ."""
+    tx, cold = models.Transaction, models.ArchivedProductTotal
+    parts = union_all(
+        select(
+            tx.product_id.label("product_id"),
+            func.sum(case((tx.type == "import", tx.quantity), else_=0)).label("total_imports"),
+            func.sum(case((tx.type == "export", tx.quantity), else_=0)).label("total_exports"),
+        ).group_by(tx.product_id),
+        select(
+            cold.product_id.label("product_id"),
+            func.sum(cold.total_imports).label("total_imports"),
+            func.sum(cold.total_exports).label("total_exports"),
+        ).group_by(cold.product_id),
+    ).subquery()
+    return select(
+        parts.c.product_id,
+        func.sum(parts.c.total_imports).label("total_imports"),
+        func.sum(parts.c.total_exports).label("total_exports"),
+    ).group_by(parts.c.product_id).subquery()
+
+
+def warehouse_totals():
+    """
+    Subquery (product_id, warehouse_id, total_imports, total_exports) gồm cả bảng nóng và các tháng đã lưu trữ;
+    chỉ gồm các phiếu gắn với kho.
+    """
+    tx, cold = models.Transaction, models.ArchivedWarehouseTotal
+    parts = union_all(
+        select(
+            tx.product_id.label("product_id"),
+            tx.warehouse_id.label("warehouse_id"),
+            func.sum(case((tx.type == "import", tx.quantity), else_=0)).label("total_imports"),
+            func.sum(case((tx.type == "export", tx.quantity), else_=0)).label("total_exports"),
+        ).where(tx.warehouse_id.is_not(None)).group_by(tx.product_id, tx.warehouse_id),
+        select(
+            cold.product_id.label("product_id"),
+            cold.warehouse_id.label("warehouse_id"),
+            func.sum(cold.total_imports).label("total_imports"),
+            func.sum(cold.total_exports).label("total_exports"),
+        ).group_by(cold.product_id, cold.warehouse_id),
+    ).subquery()
+    return select(
+        parts.c.product_id,
+        parts.c.warehouse_id,
+        func.sum(parts.c.total_imports).label("total_imports"),
+        func.sum(parts.c.total_exports).label("total_exports"),
+    ).group_by(parts.c.product_id, parts.c.warehouse_id).subquery()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Lưu trữ các tháng giao dịch đã đóng sổ")
+    parser.add_argument("command", choices=["archive", "restore", "list", "verify"])
+    parser.add_argument("--month", help="Tháng YYYY-MM (archive: chỉ tháng này; restore: bắt buộc)")
+    parser.add_argument("--keep-months", type=int, default=KEEP_MONTHS, help="Số tháng gần nhất giữ ở bảng nóng")
+    parser.add_argument("--directory", default=ARCHIVE_DIR)
+    args = parser.parse_args()
+
+    from database import SessionLocal, engine
+    import versions  # noqa: F401  (tăng phiên bản bảng sau commit để ETag của API được làm mới)
+
+    logs.setup()
+    models.Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+    code = 0
+    try:
+        if args.command == "archive":
+            if args.month:
+                if month_bounds(args.month)[1] > cutoff(0):
+                    parser.error(f"{args.month} chưa đóng sổ")
+                moved = {args.month: archive_month(session, args.month, args.directory)}
+            else:
+                moved = archive_closed_months(session, args.keep_months, args.directory)
+            print(f"Đã lưu trữ {sum(moved.values())} giao dịch của {len([m for m in moved.values() if m])} tháng.")
+        elif args.command == "restore":
+            if not args.month:
+                parser.error("restore cần --month")
+            print(f"Đã khôi phục {restore_month(session, args.month, args.directory)} giao dịch của tháng {args.month}.")
+        elif args.command == "list":
+            for entry in session.execute(select(models.ArchivedMonth).order_by(models.ArchivedMonth.month)).scalars():
+                print(f"{entry.month}  {entry.row_count:>9} dòng  {entry.file}  {entry.archived_at:%Y-%m-%d %H:%M}")
+        else:
+            problems = verify(session, args.directory)
+            for problem in problems:
+                print(problem)
+            print(f"{len(problems)} lỗi.")
+            code = 1 if problems else 0
+    finally:
+        session.close()
+        logs.shutdown()
+    sys.exit(code)
@@ -0,0 +1,200 @@
+import hashlib
+import os
+import tempfile
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Set, Tuple
+
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+import database
+import models
+from versions import SharedCounters
+
+# Cache trong tiến trình cho các dòng hay được tra theo khóa chính (sản phẩm, nhân viên, khách hàng,
+# nhà cung cấp, kho) khi tạo/xóa phiếu.
+#
+# - Mỗi bảng một LRU giới hạn số mục (ENTITY_CACHE_MAX_ENTRIES) và thời gian sống (ENTITY_CACHE_TTL giây).
+# - Đồng bộ giữa các worker không cần dịch vụ ngoài: mỗi (bảng, id) được băm vào một ô thế hệ trong file
+#   mmap dùng chung (versions.SharedCounters). Ghi vào một dòng làm tăng ô của nó SAU khi commit; mục cache
+#   nhớ thế hệ lúc đọc và bị coi là cũ khi thế hệ đã khác (hai id chung ô chỉ gây thêm một lần đọc lại).
+# - Việc ghi được ghi nhận tự động qua session (thêm/sửa/xóa đối tượng ORM, query().delete() hàng loạt),
+#   nên các handler POST/PUT/DELETE không cần tự gọi invalidate. Công cụ nạp dữ liệu ngoài ORM gọi
+#   invalidate_all().
+# - Cột được cập nhật liên tục ngoài ORM (Product.stock bằng UPDATE nguyên tử, Employee.revenue_contribution
+#   khi gộp employee_revenue định kỳ) không được cache: các thao tác này không làm mất hiệu lực mục cache và
+#   các cột này luôn được đọc từ DB.
+# Giá trị trả về là dict các cột (chỉ đọc), không gắn với session nào.
+
+CACHED_MODELS = (models.Product, models.Employee, models.Customer, models.Supplier, models.Warehouse)
+VOLATILE_COLUMNS = {"products": {"stock"}, "employees": {"revenue_contribution"}}
+
+MAX_ENTRIES = int(os.environ.get("ENTITY_CACHE_MAX_ENTRIES", "10000"))
+TTL_SECONDS = float(os.environ.get("ENTITY_CACHE_TTL", "300"))
+
+# Ô 0: thế hệ chung (invalidate_all); ô 1: tổng số lần ghi; các ô còn lại: thế hệ theo (bảng, id)
+GLOBAL_SLOT = 0
+WRITES_SLOT = 1
+KEY_SLOTS = 4096
+
+_CACHED_TABLES = {model.__tablename__: model for model in CACHED_MODELS}
+
+
+def default_path(url: str = database.SQLALCHEMY_DATABASE_URL) -> str:
+    digest = hashlib.sha1(str(url).encode("utf-8")).hexdigest()[:12]
+    return os.environ.get("ENTITY_CACHE_FILE") or os.path.join(tempfile.gettempdir(), f"wms-entity-cache-{digest}.bin")
+
+
+def _slot(table: str, key: Any) -> int:
+    # crc32 thay cho hash(): hash() của chuỗi khác nhau giữa các tiến trình
+    return 2 + zlib.crc32(f"{table}:{key}".encode("utf-8")) % KEY_SLOTS
+
+
+class EntityCache:
+    def __init__(self, path: str, max_entries: int = MAX_ENTRIES, ttl: float = TTL_SECONDS):
+        self.counters = SharedCounters(path, 2 + KEY_SLOTS)
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # {bảng: OrderedDict(id -> (dòng, thế hệ, hết hạn lúc))}
+        self._entries: Dict[str, "OrderedDict[Any, Tuple[Dict[str, Any], Tuple[int, int], float]]"] = {
+            table: OrderedDict() for table in _CACHED_TABLES
+        }
+        self._stats = {table: dict(hits=0, misses=0, evictions=0, stale=0) for table in _CACHED_TABLES}
+        self._columns = {
+            table: [column for column in model.__table__.columns if column.name not in VOLATILE_COLUMNS.get(table, ())]
+            for table, model in _CACHED_TABLES.items()
+        }
+
+    def _generation(self, table: str, key: Any) -> Tuple[int, int]:
+        return self.counters.get(GLOBAL_SLOT), self.counters.get(_slot(table, key))
+
+    def _lookup(self, table: str, key: Any) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entries, stats = self._entries[table], self._stats[table]
+            entry = entries.get(key)
+            if entry is not None:
+                row, generation, expires = entry
+                if expires > time.monotonic() and generation == self._generation(table, key):
+                    entries.move_to_end(key)
+                    stats["hits"] += 1
+                    return row
+                del entries[key]
+                stats["stale"] += 1
+            stats["misses"] += 1
+            return None
+
+    def _store(self, table: str, key: Any, row: Dict[str, Any], generation: Tuple[int, int]) -> None:
+        with self._lock:
+            entries = self._entries[table]
+            entries[key] = (row, generation, time.monotonic() + self.ttl)
+            entries.move_to_end(key)
+            while len(entries) > self.max_entries:
+                entries.popitem(last=False)
+                self._stats[table]["evictions"] += 1
+
+    async def get(self, db: AsyncSession, model, key: Any) -> Optional[Dict[str, Any]]:
+        """Dòng có khóa chính key (dict các cột không biến động) hoặc None nếu không tồn tại."""
+        table = model.__tablename__
+        row = self._lookup(table, key)
+        if row is not None:
+            return row
+
+        # Thế hệ được đọc TRƯỚC khi truy vấn: nếu dòng bị ghi trong lúc đọc, mục này sẽ bị coi là cũ
+        generation = self._generation(table, key)
+        writes = self.counters.get(WRITES_SLOT)
+        result = (await db.execute(
+            select(*self._columns[table]).where(model.__table__.c.id == key)
+        )).mappings().first()
+        if result is None:
+            return None
+        row = dict(result)
+        # Với REPEATABLE READ, SELECT trong một giao dịch đã mở có thể thấy ảnh chụp từ trước một lần ghi
+        # đã tăng thế hệ: chỉ lưu khi không có lần ghi nào kể từ lúc giao dịch bắt đầu
+        if db.sync_session.info.get(_WRITES_AT_BEGIN) == writes:
+            self._store(table, key, row, generation)
+        return row
+
+    def invalidate(self, keys) -> None:
+        """keys: tập (bảng, id); id None nghĩa là mọi dòng của bảng (ghi hàng loạt)."""
+        if not keys:
+            return
+        if any(key is None for _, key in keys):
+            self.invalidate_all()
+            return
+        self.counters.increment([WRITES_SLOT] + [_slot(table, key) for table, key in keys])
+        with self._lock:
+            for table, key in keys:
+                self._entries[table].pop(key, None)
+
+    def invalidate_all(self) -> None:
+        self.counters.increment([GLOBAL_SLOT, WRITES_SLOT])
+        with self._lock:
+            for entries in self._entries.values():
+                entries.clear()
+
+    def status(self) -> Dict[str, Dict[str, int]]:
+        """Số lần trúng/trượt/bị đẩy ra/cũ và số mục hiện có theo bảng (của worker hiện tại)."""
+        with self._lock:
+            return {table: dict(self._stats[table], size=len(self._entries[table])) for table in _CACHED_TABLES}
+
+
+_cache: Optional[EntityCache] = None
+
+
+def get_cache() -> EntityCache:
+    global _cache
+    if _cache is None:
+        _cache = EntityCache(default_path())
+    return _cache
+
+
+async def get(db: AsyncSession, model, key: Any) -> Optional[Dict[str, Any]]:
+    """Tra dòng theo khóa chính qua cache của worker: await cache.get(db, models.Product, product_id)."""
+    return await get_cache().get(db, model, key)
+
+
+# --- Ghi nhận dòng bị ghi qua session và làm mất hiệu lực sau commit ---
+
+_PENDING = "entity_cache_pending"
+_WRITES_AT_BEGIN = "entity_cache_writes"
+
+
+@event.listens_for(Session, "after_begin")
+def _remember_writes(session, transaction, connection):
+    session.info.setdefault(_WRITES_AT_BEGIN, get_cache().counters.get(WRITES_SLOT))
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_flushed(session, flush_context):
+    pending: Set[Tuple[str, Any]] = session.info.setdefault(_PENDING, set())
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        table = getattr(obj, "__tablename__", None)
+        if table in _CACHED_TABLES:
+            pending.add((table, obj.id))
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _collect_bulk(orm_execute_state):
+    # db.query(Model).delete() / update(Model) qua session: không biết dòng nào, bỏ cả bảng
+    if orm_execute_state.is_update or orm_execute_state.is_delete:
+        mapper = orm_execute_state.bind_mapper
+        table = getattr(mapper, "local_table", None)
+        if table is not None and table.name in _CACHED_TABLES:
+            orm_execute_state.session.info.setdefault(_PENDING, set()).add((table.name, None))
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session):
+    session.info.pop(_WRITES_AT_BEGIN, None)
+    get_cache().invalidate(session.info.pop(_PENDING, None))
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session):
+    session.info.pop(_WRITES_AT_BEGIN, None)
+    session.info.pop(_PENDING, None)
@@ -0,0 +1,314 @@
+import argparse
+import bisect
+import datetime
+import random
+import sys
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence
+
+from sqlalchemy import bindparam, create_engine, delete, select, update
+from sqlalchemy.orm import Session
+
+import cache
+import database
+import models
+import search_index
+import stats
+import versions
+
+# Sinh dữ liệu giả lập với khối lượng gần với thực tế để tái hiện các vấn đề hiệu năng.
+#
+#   python datagen.py --reset --products 100000 --customers 5000 --transactions 10000000 --years 3
+#   python datagen.py --reset --database-url sqlite:///./load.db --transactions 1000000
+#
+# - Chèn hàng loạt bằng Core executemany theo lô lớn (--batch-size dòng một lần), không tạo đối tượng ORM.
+# - Phân bố lệch như dữ liệu thật: một số ít sản phẩm/khách hàng/nhân viên chiếm phần lớn giao dịch
+#   (phân bố Zipf với hệ số --skew), số phiếu mỗi ngày tăng dần theo thời gian và ít hơn vào cuối tuần.
+# - Giao dịch được sinh theo thứ tự ngày; phiếu xuất vượt quá tồn kho hiện tại được đổi thành phiếu nhập,
+#   nên tồn kho cuối cùng của mỗi sản phẩm luôn khớp với lịch sử giao dịch và không âm.
+# - Sau khi chèn xong: cập nhật tồn kho và doanh số nhân viên, tạo lại chỉ mục tìm kiếm và các bộ đếm
+#   của trang tổng quan (xem search_index.py, stats.py).
+
+CATEGORIES = ["Laptop", "Điện thoại", "Máy tính bảng", "Màn hình", "Phụ kiện", "Tai nghe", "Loa", "Máy in", "Linh kiện", "Thiết bị mạng"]
+BRANDS = ["Asus", "Dell", "HP", "Lenovo", "Acer", "Samsung", "Apple", "Xiaomi", "Sony", "LG", "Logitech", "TP-Link", "Canon"]
+MODELS = ["Pro", "Air", "Max", "Lite", "Plus", "Ultra", "Mini", "Gaming", "Office", "Studio"]
+ORIGINS = ["Việt Nam", "Trung Quốc", "Hàn Quốc", "Nhật Bản", "Mỹ", "Đài Loan", "Thái Lan"]
+LAST_NAMES = ["Nguyễn", "Trần", "Lê", "Phạm", "Hoàng", "Huỳnh", "Phan", "Vũ", "Võ", "Đặng", "Bùi", "Đỗ", "Hồ", "Ngô", "Dương"]
+MIDDLE_NAMES = ["Văn", "Thị", "Hữu", "Minh", "Thanh", "Ngọc", "Đức", "Quang", "Thu", "Hoài"]
+FIRST_NAMES = ["An", "Bình", "Cường", "Dũng", "Giang", "Hà", "Hải", "Hương", "Khánh", "Lan", "Linh", "Long", "Mai", "Nam", "Phúc", "Quân", "Sơn", "Tâm", "Trang", "Tuấn", "Vy", "Yến"]
+CITIES = ["Hà Nội", "TP.HCM", "Đà Nẵng", "Hải Phòng", "Cần Thơ", "Huế", "Nha Trang", "Biên Hòa", "Vinh", "Quy Nhơn"]
+STREETS = ["Lê Lợi", "Trần Hưng Đạo", "Nguyễn Huệ", "Hai Bà Trưng", "Cầu Giấy", "Giải Phóng", "Điện Biên Phủ", "Lý Thường Kiệt"]
+DEPARTMENTS = ["Phòng Kế toán", "Phòng Quản lý kho", "Phòng Bán hàng", "Phòng Mua hàng", "Phòng Kỹ thuật", "Phòng Nhân sự"]
+POSITIONS = ["Nhân viên kho", "Nhân viên bán hàng", "Quản lý kho", "Trưởng nhóm bán hàng", "Kế toán"]
+
+# Tỉ lệ phiếu xuất trong tổng số phiếu (phần còn lại là phiếu nhập)
+EXPORT_RATIO = 0.6
+# Số ngày hàng cuối tuần so với ngày thường
+WEEKEND_FACTOR = 0.6
+
+
+def make_id(prefix: str, number: int) -> str:
+    # Dạng mã cũ (tiền tố + 8 ký tự hex in hoa) nhưng tăng dần nên không bao giờ trùng và cũng được ghi vào
+    # cuối index như mã theo thời gian của ids.py
+    return f"{prefix}{number:08X}"
+
+
+def person_name(rng: random.Random) -> str:
+    return f"{rng.choice(LAST_NAMES)} {rng.choice(MIDDLE_NAMES)} {rng.choice(FIRST_NAMES)}"
+
+
+def phone(rng: random.Random) -> str:
+    return "09" + "".join(rng.choice("0123456789") for _ in range(8))
+
+
+def address(rng: random.Random) -> str:
+    return f"{rng.randint(1, 500)} {rng.choice(STREETS)}, {rng.choice(CITIES)}"
+
+
+class Zipf:
+    """Chọn ngẫu nhiên một phần tử với xác suất tỉ lệ 1/hạng^s; hạng được xáo trộn để phần tử phổ biến
+    không phải luôn là các mã nhỏ nhất."""
+
+    def __init__(self, items: Sequence[str], s: float, rng: random.Random):
+        self.items = list(items)
+        rng.shuffle(self.items)
+        total = 0.0
+        self.cumulative = []
+        for rank in range(1, len(self.items) + 1):
+            total += 1.0 / rank ** s
+            self.cumulative.append(total)
+        self.rng = rng
+
+    def pick(self) -> str:
+        index = bisect.bisect_left(self.cumulative, self.rng.random() * self.cumulative[-1])
+        return self.items[min(index, len(self.items) - 1)]
+
+
+def daily_counts(total: int, start: datetime.date, days: int, growth: float) -> Iterator[tuple]:
+    """Chia total phiếu cho các ngày: tăng tuyến tính theo thời gian (cuối kỳ gấp 1+growth đầu kỳ), ít hơn cuối tuần."""
+    weights = []
+    for offset in range(days):
+        day = start + datetime.timedelta(days=offset)
+        weight = 1.0 + growth * offset / max(1, days - 1)
+        if day.weekday() >= 5:
+            weight *= WEEKEND_FACTOR
+        weights.append(weight)
+    scale = total / sum(weights)
+    assigned, carry = 0, 0.0
+    for offset, weight in enumerate(weights):
+        carry += weight * scale
+        count = int(carry) if offset < days - 1 else total - assigned
+        carry -= count
+        assigned += count
+        yield start + datetime.timedelta(days=offset), count
+
+
+class Loader:
+    def __init__(self, session: Session, batch_size: int):
+        self.session = session
+        self.batch_size = batch_size
+
+    def insert(self, model, rows: Iterable[Dict]) -> int:
+        """Chèn theo lô bằng Core executemany và commit mỗi lô. Trả về số dòng."""
+        table = model.__table__
+        started = time.perf_counter()
+        count = 0
+        batch: List[Dict] = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= self.batch_size:
+                count += self._flush(table, batch)
+                batch = []
+        if batch:
+            count += self._flush(table, batch)
+        elapsed = time.perf_counter() - started
+        print(f"  {table.name}: {count} dòng trong {elapsed:.1f}s ({count / max(elapsed, 1e-9):,.0f} dòng/s)")
+        return count
+
+    def _flush(self, table, batch: List[Dict]) -> int:
+        self.session.execute(table.insert(), batch)
+        self.session.commit()
+        return len(batch)
+
+
+def reset(session: Session) -> None:
+    # Xóa theo thứ tự khóa ngoại (bảng con trước), giống create_initial_data trong main.py
+    for model in (models.Transaction, models.Inventory, models.Product, models.Employee, models.Supplier,
+                  models.Customer, models.Warehouse, models.Department, models.SearchGram, models.StatCounter,
+                  models.ProductSales, models.RevenueMonthly, models.EmployeeRevenue, models.WarehouseUsage,
+                  models.StockSnapshot, models.StockSnapshotDay, models.StockAdjustment, models.ArchivedMonth,
+                  models.ArchivedProductTotal, models.ArchivedWarehouseTotal, models.ArchivedCustomerMonth):
+        session.execute(delete(model))
+    session.commit()
+
+
+def generate(session: Session, args) -> None:
+    rng = random.Random(args.seed)
+    loader = Loader(session, args.batch_size)
+    today = datetime.date.today()
+    start = today - datetime.timedelta(days=365 * args.years)
+
+    department_ids = [make_id("BP", i) for i in range(len(DEPARTMENTS))]
+    loader.insert(models.Department, (
+        {"id": department_ids[i], "name": name, "phone": phone(rng)} for i, name in enumerate(DEPARTMENTS)
+    ))
+
+    warehouse_ids = [make_id("WH", i) for i in range(args.warehouses)]
+    loader.insert(models.Warehouse, (
+        {"id": warehouse_id, "name": f"Kho {CITIES[i % len(CITIES)]} {i + 1}", "location": CITIES[i % len(CITIES)],
+         "capacity": rng.randint(50, 500) * 1000}
+        for i, warehouse_id in enumerate(warehouse_ids)
+    ))
+
+    employee_ids = [make_id("NV", i) for i in range(args.employees)]
+    loader.insert(models.Employee, (
+        {"id": employee_id, "name": person_name(rng), "gender": rng.choice(["Nam", "Nữ"]), "phone": phone(rng),
+         "address": address(rng), "position": rng.choice(POSITIONS), "revenue_contribution": 0.0,
+         "department_id": rng.choice(department_ids)}
+        for employee_id in employee_ids
+    ))
+
+    supplier_ids = [make_id("NCC", i) for i in range(args.suppliers)]
+    loader.insert(models.Supplier, (
+        {"id": supplier_id, "name": f"Công ty {rng.choice(BRANDS)} {rng.choice(CITIES)} {i + 1}",
+         "contactPerson": person_name(rng), "phone": phone(rng), "email": f"ncc{i + 1}@example.com", "address": address(rng)}
+        for i, supplier_id in enumerate(supplier_ids)
+    ))
+
+    customer_ids = [make_id("KH", i) for i in range(args.customers)]
+    loader.insert(models.Customer, (
+        {"id": customer_id, "name": person_name(rng), "phone": phone(rng), "address": address(rng)}
+        for customer_id in customer_ids
+    ))
+
+    # Giá bán lệch theo phân bố log-normal (nhiều hàng rẻ, ít hàng rất đắt); tồn kho đầu kỳ là 0,
+    # được cập nhật sau khi sinh giao dịch
+    product_ids = [make_id("SP", i) for i in range(args.products)]
+    prices: Dict[str, float] = {}
+    costs: Dict[str, float] = {}
+    product_rows = []
+    for i, product_id in enumerate(product_ids):
+        price = round(rng.lognormvariate(14, 1.2), -3) or 1000.0
+        prices[product_id] = price
+        costs[product_id] = round(price * rng.uniform(0.6, 0.9), -3) or price
+        made = start - datetime.timedelta(days=rng.randint(0, 365))
+        category = rng.choice(CATEGORIES)
+        product_rows.append({
+            "id": product_id, "name": f"{category} {rng.choice(BRANDS)} {rng.choice(MODELS)} {i + 1}",
+            "category": category, "XuatXu": rng.choice(ORIGINS), "stock": 0, "GiaNhap": costs[product_id], "price": price,
+            "NgaySX": made, "HanSD": made + datetime.timedelta(days=365 * rng.randint(2, 6)),
+        })
+    loader.insert(models.Product, product_rows)
+    del product_rows
+
+    stock = {product_id: 0 for product_id in product_ids}
+    revenue = {employee_id: 0.0 for employee_id in employee_ids}
+    pick_product = Zipf(product_ids, args.skew, rng)
+    pick_customer = Zipf(customer_ids, args.skew, rng) if customer_ids else None
+    pick_employee = Zipf(employee_ids, args.skew * 0.7, rng)
+
+    def transactions() -> Iterator[Dict]:
+        number = 0
+        for day, count in daily_counts(args.transactions, start, 365 * args.years, args.growth):
+            for _ in range(count):
+                product_id = pick_product.pick()
+                employee_id = pick_employee.pick()
+                quantity = min(50, int(rng.expovariate(0.3)) + 1)
+                if rng.random() < EXPORT_RATIO and stock[product_id] >= quantity:
+                    stock[product_id] -= quantity
+                    revenue[employee_id] += quantity * prices[product_id]
+                    row = {"type": "export", "price": prices[product_id], "supplier_id": None,
+                           "customer_id": pick_customer.pick() if pick_customer else None}
+                else:
+                    # Nhập hàng theo lô lớn hơn nhiều so với một lần xuất
+                    quantity = quantity * rng.randint(5, 20)
+                    stock[product_id] += quantity
+                    row = {"type": "import", "price": costs[product_id],
+                           "supplier_id": rng.choice(supplier_ids) if supplier_ids else None, "customer_id": None}
+                row.update(id=make_id("TX", number), product_id=product_id, employee_id=employee_id, quantity=quantity, date=day)
+                number += 1
+                yield row
+
+    loader.insert(models.Transaction, transactions())
+
+    # Tồn kho cuối kỳ: cập nhật theo lô bằng executemany; phân bổ vào 1-2 kho trong bảng inventory
+    started = time.perf_counter()
+    table = models.Product.__table__
+    stmt = update(table).where(table.c.id == bindparam("b_id")).values(stock=bindparam("b_stock"))
+    items = [{"b_id": product_id, "b_stock": value} for product_id, value in stock.items() if value]
+    for i in range(0, len(items), args.batch_size):
+        session.execute(stmt, items[i:i + args.batch_size])
+        session.commit()
+    print(f"  products.stock: {len(items)} dòng trong {time.perf_counter() - started:.1f}s")
+
+    def inventory() -> Iterator[Dict]:
+        for product_id, value in stock.items():
+            if not value or not warehouse_ids:
+                continue
+            first, second = rng.sample(warehouse_ids, 2) if len(warehouse_ids) > 1 else (warehouse_ids[0], None)
+            if second and value > 1 and rng.random() < 0.3:
+                part = rng.randint(1, value - 1)
+                yield {"product_id": product_id, "warehouse_id": first, "stock": part}
+                yield {"product_id": product_id, "warehouse_id": second, "stock": value - part}
+            else:
+                yield {"product_id": product_id, "warehouse_id": first, "stock": value}
+
+    loader.insert(models.Inventory, inventory())
+
+    table = models.Employee.__table__
+    stmt = update(table).where(table.c.id == bindparam("b_id")).values(revenue_contribution=bindparam("b_revenue"))
+    session.execute(stmt, [{"b_id": employee_id, "b_revenue": value} for employee_id, value in revenue.items()])
+    session.commit()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Sinh dữ liệu giả lập cho WMS")
+    parser.add_argument("--database-url", help="Chuỗi kết nối (mặc định: như database.py / biến môi trường DATABASE_URL)")
+    parser.add_argument("--reset", action="store_true", help="Xóa toàn bộ dữ liệu hiện có trước khi sinh")
+    parser.add_argument("--products", type=int, default=100_000)
+    parser.add_argument("--customers", type=int, default=5_000)
+    parser.add_argument("--employees", type=int, default=200)
+    parser.add_argument("--suppliers", type=int, default=500)
+    parser.add_argument("--warehouses", type=int, default=10)
+    parser.add_argument("--transactions", type=int, default=1_000_000)
+    parser.add_argument("--years", type=int, default=3, help="Số năm lịch sử giao dịch (kết thúc hôm nay)")
+    parser.add_argument("--skew", type=float, default=1.1, help="Hệ số Zipf; 0 là phân bố đều")
+    parser.add_argument("--growth", type=float, default=1.0, help="Số phiếu/ngày cuối kỳ gấp (1 + growth) lần đầu kỳ")
+    parser.add_argument("--batch-size", type=int, default=10_000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+    if args.products < 1 or args.employees < 1:
+        parser.error("cần ít nhất 1 sản phẩm và 1 nhân viên")
+
+    if args.database_url:
+        engine = create_engine(args.database_url)
+    else:
+        engine = database.engine
+    models.Base.metadata.create_all(bind=engine)
+
+    session = Session(engine, autoflush=False)
+    try:
+        if args.reset:
+            reset(session)
+        elif session.execute(select(models.Product.id).limit(1)).first() is not None:
+            print("Database đã có dữ liệu; chạy lại với --reset để xóa và sinh mới.")
+            return 1
+
+        started = time.perf_counter()
+        print("Đang sinh dữ liệu...")
+        generate(session, args)
+        print("Đang tạo chỉ mục tìm kiếm và số liệu tổng hợp...")
+        print(f"  search_index: {search_index.rebuild(session)} dòng")
+        stats.recompute(session)
+        # Dữ liệu được nạp ngoài API: làm mới ETag của mọi bảng và cache dòng của server đang chạy trên cùng database
+        url = args.database_url or database.SQLALCHEMY_DATABASE_URL
+        versions.TableVersions(versions.default_path(url)).bump(versions.TABLES)
+        cache.EntityCache(cache.default_path(url)).invalidate_all()
+        print(f"Hoàn tất trong {time.perf_counter() - started:.1f}s.")
+    finally:
+        session.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
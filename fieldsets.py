@@ -0,0 +1,66 @@
+import datetime
+import json
+from typing import Any, Dict, List, Optional, Sequence
+
+from fastapi import HTTPException, Response, status
+
+# Tập trường (sparse fieldset) dùng chung cho các endpoint danh sách: ?fields=id,name
+#
+# Khi có fields, endpoint chỉ SELECT các cột được yêu cầu (select() của Core, không dựng đối tượng ORM) và
+# chỉ trả về các trường đó. JSON được mã hóa trực tiếp từ các dòng, bỏ qua bước dựng và kiểm tra
+# response_model của pydantic cho từng dòng. Không có fields thì endpoint trả về đầy đủ như trước.
+#
+# Tên trường giống trong JSON đầy đủ (alias nếu schema dùng alias, ví dụ productId của giao dịch); tên
+# thuộc tính snake_case cũng được chấp nhận. Các cột khóa của phân trang luôn được SELECT để tạo cursor,
+# nhưng chỉ có trong JSON khi được yêu cầu.
+
+
+def _output_names(schema) -> Dict[str, str]:
+    """Tên thuộc tính -> tên trong JSON (theo alias như response_model)."""
+    return {name: info.alias or name for name, info in schema.model_fields.items()}
+
+
+def parse(fields: Optional[str], schema) -> Optional[List[str]]:
+    """Tên thuộc tính của các trường được yêu cầu, theo thứ tự khai báo trong schema (None: không có fields)."""
+    if fields is None:
+        return None
+    output = _output_names(schema)
+    accepted = {**{alias: name for name, alias in output.items()}, **{name: name for name in output}}
+    requested = {value.strip() for value in fields.split(",") if value.strip()}
+    unknown = requested - set(accepted)
+    if unknown or not requested:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown field: {', '.join(sorted(unknown)) or '(empty)'} (allowed: {', '.join(output.values())})"
+        )
+    wanted = {accepted[value] for value in requested}
+    return [name for name in output if name in wanted]
+
+
+def columns(model, names: Sequence[str], keys: Sequence[Any] = ()) -> List[Any]:
+    """Các cột cần SELECT: cột của model có trong names, cộng các cột khóa còn thiếu."""
+    table = model.__table__
+    selected = [table.c[name] for name in names if name in table.c]
+    selected.extend(key for key in keys if key.key not in {column.key for column in selected})
+    return selected
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def respond(rows: Sequence[Any], names: Sequence[str], schema, response: Response) -> Response:
+    """
+    Response JSON gồm các trường names của từng dòng (đọc bằng getattr). Header đã đặt trên response của
+    endpoint (X-Next-Cursor, ETag) được giữ lại.
+    """
+    output = _output_names(schema)
+    pairs = [(name, output[name]) for name in names]
+    body = json.dumps(
+        [{key: getattr(row, name, None) for name, key in pairs} for row in rows],
+        ensure_ascii=False, separators=(",", ":"), default=_default,
+    )
+    headers = {key: value for key, value in response.headers.items() if key != "content-length"}
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -0,0 +1,156 @@
+import datetime
+import os
+import secrets
+import sys
+import threading
+import time
+import uuid
+from typing import Optional
+
+# Sinh mã (khóa chính) cho các bảng: tiền tố dễ đọc (SP, NV, TX, ...) + phần thân.
+#
+# - "ulid" (mặc định): 10 ký tự thời gian (mili giây, base32 Crockford) + 8 ký tự ngẫu nhiên (40 bit).
+#   Mã sinh sau luôn lớn hơn mã sinh trước nên dòng mới được ghi vào cuối index khóa chính (InnoDB gom
+#   dòng theo khóa chính) thay vì rải ngẫu nhiên lên mọi trang, và 40 bit ngẫu nhiên mỗi mili giây loại bỏ nguy cơ trùng của
+#   8 ký tự hex (2^32 giá trị: khoảng 1% khả năng trùng ở ~9.000 mã, gần như chắc chắn trùng ở vài trăm nghìn).
+#   Trong cùng một mili giây, phần ngẫu nhiên được tăng dần nên thứ tự vẫn giữ đúng trong một worker.
+# - "uuid": dạng cũ, tiền tố + 8 ký tự hex ngẫu nhiên (ID_STRATEGY=uuid để quay lại).
+#
+# Chuyển đổi: mã cũ vẫn hợp lệ và không cần đổi; mã mới được sinh theo dạng mới ngay khi triển khai.
+# Bảng transactions (ghi nhiều nhất, không bảng nào tham chiếu tới) có thể đổi mã cũ sang dạng mới theo ngày
+# giao dịch để cả bảng được sắp theo thời gian:
+#
+#   python ids.py rekey-transactions [--batch-size 5000]
+#
+# So sánh tốc độ ghi giữa hai dạng mã: python bench.py ids --rows 200000
+
+ID_STRATEGY = os.environ.get("ID_STRATEGY", "ulid")
+STRATEGIES = ("ulid", "uuid")
+
+CROCKFORD = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+TIME_CHARS = 10
+RANDOM_CHARS = 8
+RANDOM_BITS = 5 * RANDOM_CHARS
+
+# Tiền tố mã của từng bảng
+PREFIXES = {
+    "departments": "BP",
+    "products": "SP",
+    "employees": "NV",
+    "suppliers": "NCC",
+    "customers": "KH",
+    "warehouses": "WH",
+    "transactions": "TX",
+}
+
+
+def _encode(value: int, length: int) -> str:
+    chars = []
+    for _ in range(length):
+        value, digit = divmod(value, 32)
+        chars.append(CROCKFORD[digit])
+    return "".join(reversed(chars))
+
+
+class TimeOrderedIds:
+    """Sinh phần thân mã theo thời gian, tăng dần nghiêm ngặt trong một tiến trình."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._last_ms = -1
+        self._last_random = 0
+
+    def body(self, ms: Optional[int] = None) -> str:
+        with self._lock:
+            ms = int(time.time() * 1000) if ms is None else ms
+            if ms <= self._last_ms:
+                # Cùng mili giây (hoặc đồng hồ lùi): giữ mốc thời gian cũ, tăng phần ngẫu nhiên
+                ms, random_part = self._last_ms, self._last_random + 1
+                if random_part >> RANDOM_BITS:
+                    ms, random_part = ms + 1, secrets.randbits(RANDOM_BITS - 1)
+            else:
+                # Bit cao nhất để trống: còn chỗ tăng dần trong cùng mili giây
+                random_part = secrets.randbits(RANDOM_BITS - 1)
+            self._last_ms, self._last_random = ms, random_part
+        return _encode(ms, TIME_CHARS) + _encode(random_part, RANDOM_CHARS)
+
+
+_time_ordered = TimeOrderedIds()
+
+
+def new_id(prefix: str, strategy: Optional[str] = None) -> str:
+    """Mã mới cho một dòng: new_id("SP") -> "SP01JAB3K9QZ7M2X4C1V"."""
+    strategy = strategy or ID_STRATEGY
+    if strategy == "uuid":
+        return f"{prefix}{uuid.uuid4().hex[:8].upper()}"
+    if strategy == "ulid":
+        return prefix + _time_ordered.body()
+    raise ValueError(f"Unknown ID_STRATEGY: {strategy} (expected one of {STRATEGIES})")
+
+
+def is_time_ordered(value: str, prefix: str) -> bool:
+    body = value[len(prefix):]
+    return value.startswith(prefix) and len(body) == TIME_CHARS + RANDOM_CHARS and all(char in CROCKFORD for char in body)
+
+
+def timestamp_of(value: str, prefix: str) -> Optional[datetime.datetime]:
+    """Thời điểm tạo của một mã dạng "ulid" (None với mã dạng cũ)."""
+    if not is_time_ordered(value, prefix):
+        return None
+    ms = 0
+    for char in value[len(prefix):len(prefix) + TIME_CHARS]:
+        ms = ms * 32 + CROCKFORD.index(char)
+    return datetime.datetime.fromtimestamp(ms / 1000, datetime.timezone.utc)
+
+
+def rekey_transactions(db, batch_size: int = 5000) -> int:
+    """
+    Đổi mã dạng cũ của bảng transactions sang dạng theo thời gian (lấy mốc là ngày giao dịch), xử lý
+    từng ngày theo index (type, date) và commit sau mỗi lô. Chạy lại được: mã đã ở dạng mới được bỏ qua.
+    Trả về số dòng đã đổi.
+    """
+    from sqlalchemy import bindparam, select, update
+
+    import models
+
+    table = models.Transaction.__table__
+    prefix = PREFIXES["transactions"]
+    generator = TimeOrderedIds()
+    stmt = update(table).where(table.c.id == bindparam("old_id")).values(id=bindparam("new_id"))
+    days = db.execute(select(table.c.date).distinct().order_by(table.c.date)).scalars().all()
+    changed = 0
+    for day in days:
+        ms = int(datetime.datetime.combine(day, datetime.time(), datetime.timezone.utc).timestamp() * 1000)
+        old_ids = [
+            row_id for row_id in db.execute(
+                select(table.c.id).where(table.c.type.in_(["import", "export"]), table.c.date == day).order_by(table.c.id)
+            ).scalars()
+            if not is_time_ordered(row_id, prefix)
+        ]
+        for start in range(0, len(old_ids), batch_size):
+            db.execute(stmt, [
+                {"old_id": old_id, "new_id": prefix + generator.body(ms)} for old_id in old_ids[start:start + batch_size]
+            ])
+            db.commit()
+        changed += len(old_ids)
+    return changed
+
+
+if __name__ == "__main__":
+    # python ids.py rekey-transactions [--batch-size N]
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Công cụ mã khóa chính")
+    parser.add_argument("command", choices=["rekey-transactions"])
+    parser.add_argument("--batch-size", type=int, default=5000)
+    args = parser.parse_args()
+
+    from database import SessionLocal
+    import versions  # noqa: F401  (tăng phiên bản bảng sau commit để ETag của API được làm mới)
+
+    session = SessionLocal()
+    try:
+        print(f"Đã đổi mã của {rekey_transactions(session, args.batch_size)} giao dịch.")
+    finally:
+        session.close()
+    sys.exit(0)
@@ -0,0 +1,188 @@
+import atexit
+import contextvars
+import copy
+import datetime
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+from typing import Any, Dict, Optional
+
+# Ghi log không chặn request, dạng JSON mỗi dòng một bản ghi.
+#
+# - Handler được gắn vào logger "wms" chỉ đẩy bản ghi vào hàng đợi (QueueHandler); một luồng nền
+#   (QueueListener) ghi ra stdout. Request không phải chờ ghi, và mỗi bản ghi là một dòng trọn vẹn nên
+#   log của nhiều worker không bị xen lẫn giữa dòng.
+# - Bản ghi trong lúc xử lý request tự có method, route (mẫu đường dẫn) và pid của worker.
+# - access() ghi một dòng cho mỗi request (thời gian xử lý, số câu lệnh SQL, thời gian chờ DB), gọi từ
+#   metrics.MetricsMiddleware.
+# - Lấy mẫu: bản ghi DEBUG chỉ giữ tỉ lệ LOG_DEBUG_SAMPLE (ghi đè từng dòng bằng extra={"sample_rate": r});
+#   log truy cập giữ tỉ lệ LOG_ACCESS_SAMPLE nhưng luôn giữ request lỗi 5xx và request chậm hơn LOG_SLOW_MS.
+#
+#   LOG_LEVEL=DEBUG LOG_DEBUG_SAMPLE=0.1 LOG_FORMAT=text uvicorn main:app
+
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "json")
+DEBUG_SAMPLE = float(os.environ.get("LOG_DEBUG_SAMPLE", "0.01"))
+ACCESS_SAMPLE = float(os.environ.get("LOG_ACCESS_SAMPLE", "1.0"))
+SLOW_MS = float(os.environ.get("LOG_SLOW_MS", "500"))
+
+ROOT = "wms"
+
+# Các thuộc tính có sẵn của LogRecord; mọi thuộc tính khác (truyền qua extra=) được xuất thành trường JSON
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "sample_rate"}
+
+_scope: contextvars.ContextVar[Optional[Dict[str, Any]]] = contextvars.ContextVar("log_scope", default=None)
+
+
+class RequestContextFilter(logging.Filter):
+    """Thêm method/route của request hiện tại vào bản ghi (chạy ở luồng gọi log, trước khi vào hàng đợi)."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        scope = _scope.get()
+        if scope is not None:
+            record.__dict__.setdefault("method", scope.get("method"))
+            route = scope.get("route")
+            record.__dict__.setdefault("route", getattr(route, "path", None) or scope.get("path"))
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Chỉ giữ một phần bản ghi DEBUG (log chi tiết số lượng lớn trên đường xử lý request)."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        rate = getattr(record, "sample_rate", None)
+        if rate is None:
+            rate = DEBUG_SAMPLE if record.levelno <= logging.DEBUG else 1.0
+        return rate >= 1.0 or random.random() < rate
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "ts": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "pid": record.process,
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        extra = " ".join(
+            f"{key}={value}" for key, value in record.__dict__.items() if key not in _RESERVED and not key.startswith("_")
+        )
+        line = super().format(record)
+        return f"{line} {extra}" if extra else line
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Ghép message ở luồng gọi (args có thể thay đổi sau đó) nhưng giữ traceback ở trường riêng,
+        # không nối vào message như QueueHandler mặc định
+        record = copy.copy(record)
+        record.msg, record.args = record.getMessage(), None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_handler: Optional[logging.Handler] = None
+# Sau shutdown() logger "wms" ghi thẳng qua handler này (không còn luồng nền để lấy bản ghi khỏi hàng đợi)
+_direct: Optional[logging.Handler] = None
+
+
+def setup(level: str = LOG_LEVEL, fmt: str = LOG_FORMAT, stream=None) -> None:
+    """Gắn QueueHandler vào logger "wms" và khởi động luồng ghi nền. Gọi lại nhiều lần không có tác dụng."""
+    global _listener, _handler, _direct
+    if _listener is not None:
+        return
+    writer = logging.StreamHandler(stream or sys.stdout)
+    writer.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter())
+
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    handler = _QueueHandler(log_queue)
+    handler.addFilter(SamplingFilter())
+    handler.addFilter(RequestContextFilter())
+
+    root = logging.getLogger(ROOT)
+    root.setLevel(level)
+    if _direct is not None:
+        root.removeHandler(_direct)
+        _direct = None
+    root.addHandler(handler)
+    root.propagate = False
+
+    _listener = logging.handlers.QueueListener(log_queue, writer, respect_handler_level=True)
+    _listener.start()
+    _handler = handler
+    atexit.register(shutdown)
+
+
+def shutdown() -> None:
+    """
+    Ghi nốt các bản ghi còn trong hàng đợi, dừng luồng nền và gỡ QueueHandler; các bản ghi sau đó được ghi
+    thẳng (đồng bộ) bằng cùng định dạng, không bị giữ lại trong hàng đợi.
+    """
+    global _listener, _handler, _direct
+    if _listener is None:
+        return
+    root = logging.getLogger(ROOT)
+    root.removeHandler(_handler)
+    _listener.stop()
+    writer = _listener.handlers[0]
+    for log_filter in _handler.filters:
+        writer.addFilter(log_filter)
+    root.addHandler(writer)
+    _listener, _handler, _direct = None, None, writer
+
+
+def get_logger(name: str) -> logging.Logger:
+    return logging.getLogger(f"{ROOT}.{name}")
+
+
+_access = get_logger("access")
+
+
+def bind_request(scope: Dict[str, Any]) -> contextvars.Token:
+    return _scope.set(scope)
+
+
+def unbind_request(token: contextvars.Token) -> None:
+    _scope.reset(token)
+
+
+def access(method: str, route: str, status: int, elapsed: float, statements: int, db_time: float) -> None:
+    latency_ms = elapsed * 1000
+    notable = status >= 500 or latency_ms >= SLOW_MS
+    if not notable and ACCESS_SAMPLE < 1.0 and random.random() >= ACCESS_SAMPLE:
+        return
+    # Request lỗi/chậm ghi ở mức WARNING: vẫn được giữ khi LOG_LEVEL=WARNING
+    level = logging.WARNING if notable else logging.INFO
+    if not _access.isEnabledFor(level):
+        return
+    _access.log(
+        level,
+        "%s %s %s", method, route, status,
+        extra={
+            "method": method, "route": route, "status": status,
+            "latency_ms": round(latency_ms, 2), "queries": statements, "db_ms": round(db_time * 1000, 2),
+            # Đã lấy mẫu ở trên: không để SamplingFilter lọc thêm lần nữa
+            "sample_rate": 1.0,
+        },
+    )
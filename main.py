@@ -1,17 +1,46 @@
-from fastapi import FastAPI, Depends, HTTPException, status, Query
+from fastapi import FastAPI, Depends, HTTPException, status, Query, Response
 from sqlalchemy.orm import Session
-from sqlalchemy import func, extract, String
-from database import SessionLocal, engine
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import and_, func, String, case, delete, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from database import SessionLocal, AsyncSessionLocal, engine
+import database
 import models
 import schemas
+import pagination
+import fieldsets
+import search_index
+import stats
+import metrics
+import logs
+import migrations
+import versions
+import cache
+import ids
+import archive
+import analytics
+import stock_history
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+import asyncio
+import csv
 import datetime
-import uuid
-from typing import List, Optional, Dict, Any
+import functools
+import io
+import json
+from types import SimpleNamespace
+from typing import List, Optional, Dict, Any, Literal, Tuple
+
+# Log JSON ghi qua hàng đợi và luồng nền (logs.py) thay cho print() trên đường xử lý request
+logs.setup()
+logger = logs.get_logger("main")
 
 # Đảm bảo tất cả các bảng trong cơ sở dữ liệu được tạo NGAY KHI module được tải.
 # Điều này khắc phục lỗi "Table doesn't exist" trong quá trình khởi động.
 models.Base.metadata.create_all(bind=engine)
+# Bảng đã có từ phiên bản trước: tạo các index mới khai báo trong models.py
+migrations.upgrade(engine)
 
 # Khởi tạo ứng dụng FastAPI
 app = FastAPI(
@@ -33,26 +62,34 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Cho phép frontend đọc cursor của trang kế tiếp
+    expose_headers=[pagination.NEXT_CURSOR_HEADER, "ETag"],
 )
 
-# Dependency để lấy session database
-def get_db():
-    db = SessionLocal()
-    try:
+# Số liệu theo route (thời gian, số câu lệnh SQL, thời gian DB, số dòng) cho GET /metrics
+app.add_middleware(metrics.MetricsMiddleware)
+metrics.instrument_engine(engine)
+metrics.instrument_engine(database.async_engine.sync_engine)
+
+# Dependency để lấy session database.
+# Các handler đều là async def nên dùng AsyncSession: mọi truy vấn được await, event loop không bị chặn
+# trong lúc chờ database. Các hàm đồng bộ dùng chung (stats, search_index) được gọi qua db.run_sync,
+# chạy trên cùng kết nối và cùng giao dịch với session của request. run_sync chạy trên luồng của event loop,
+# nên chỉ dùng cho các câu lệnh ngắn; việc đọc file lưu trữ hay gom nhóm trong Python đi qua _in_threadpool.
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 # --- Logic tạo dữ liệu mẫu khi khởi động ứng dụng ---
 def create_initial_data(db: Session):
     # Kiểm tra xem có bất kỳ dữ liệu nào trong bảng Department không.
     # Nếu không có, giả định rằng database trống và cần tạo dữ liệu mẫu.
     if db.query(models.Department).first() is None:
-        print("Kiểm tra database và tạo dữ liệu mẫu ban đầu (nếu cần)...")
+        logger.info("Kiểm tra database và tạo dữ liệu mẫu ban đầu (nếu cần)...")
         
         # Xóa tất cả dữ liệu hiện có trong các bảng (quan trọng để tránh trùng lặp sau khi tạo lại bảng)
         # Sắp xếp thứ tự xóa theo mối quan hệ khóa ngoại (bảng con trước, bảng cha sau)
-        print("  Đang xóa dữ liệu cũ (nếu có)...")
+        logger.info("Đang xóa dữ liệu cũ (nếu có)...")
         db.query(models.Transaction).delete()
         db.query(models.Inventory).delete()
         db.query(models.Product).delete()
@@ -61,26 +98,39 @@ def create_initial_data(db: Session):
         db.query(models.Customer).delete()
         db.query(models.Warehouse).delete()
         db.query(models.Department).delete()
+        db.query(models.SearchGram).delete()
+        db.query(models.StatCounter).delete()
+        db.query(models.ProductSales).delete()
+        db.query(models.RevenueMonthly).delete()
+        db.query(models.EmployeeRevenue).delete()
+        db.query(models.WarehouseUsage).delete()
+        db.query(models.StockSnapshot).delete()
+        db.query(models.StockAdjustment).delete()
+        db.query(models.StockSnapshotDay).delete()
+        db.query(models.ArchivedMonth).delete()
+        db.query(models.ArchivedProductTotal).delete()
+        db.query(models.ArchivedWarehouseTotal).delete()
+        db.query(models.ArchivedCustomerMonth).delete()
         db.commit()
-        print("  Đã xóa dữ liệu cũ.")
+        logger.info("Đã xóa dữ liệu cũ.")
 
-        print("  Bắt đầu thêm dữ liệu mẫu mới...")
+        logger.info("Bắt đầu thêm dữ liệu mẫu mới...")
         
         # Departments
         departments_data = [
-            models.Department(id=f"BP{uuid.uuid4().hex[:8].upper()}", name="Phòng Kế toán", phone="0241234567"),
-            models.Department(id=f"BP{uuid.uuid4().hex[:8].upper()}", name="Phòng Quản lý kho", phone="0248765432"),
-            models.Department(id=f"BP{uuid.uuid4().hex[:8].upper()}", name="Phòng Bán hàng", phone="0243334444"),
+            models.Department(id=ids.new_id("BP"), name="Phòng Kế toán", phone="0241234567"),
+            models.Department(id=ids.new_id("BP"), name="Phòng Quản lý kho", phone="0248765432"),
+            models.Department(id=ids.new_id("BP"), name="Phòng Bán hàng", phone="0243334444"),
         ]
         db.add_all(departments_data)
         db.commit()
         for d in departments_data: db.refresh(d)
-        print(f"  Đã thêm {len(departments_data)} bộ phận.")
+        logger.info("Đã thêm %d bộ phận.", len(departments_data))
 
         # Products
-        product_id_1 = f"SP{uuid.uuid4().hex[:8].upper()}"
-        product_id_2 = f"SP{uuid.uuid4().hex[:8].upper()}"
-        product_id_3 = f"SP{uuid.uuid4().hex[:8].upper()}"
+        product_id_1 = ids.new_id("SP")
+        product_id_2 = ids.new_id("SP")
+        product_id_3 = ids.new_id("SP")
         products_data = [
             models.Product(id=product_id_1, name='Laptop Gaming ABC', category='Laptop', price=25000000, stock=50, XuatXu='Trung Quốc', GiaNhap=20000000, NgaySX=datetime.date(2023, 1, 15), HanSD=datetime.date(2028, 1, 15)),
             models.Product(id=product_id_2, name='Bàn phím cơ XYZ', category='Phụ kiện', price=1500000, stock=120, XuatXu='Việt Nam', GiaNhap=1000000, NgaySX=datetime.date(2023, 3, 1), HanSD=datetime.date(2027, 3, 1)),
@@ -89,14 +139,14 @@ def create_initial_data(db: Session):
         db.add_all(products_data)
         db.commit()
         for p in products_data: db.refresh(p)
-        print(f"  Đã thêm {len(products_data)} sản phẩm.")
+        logger.info("Đã thêm %d sản phẩm.", len(products_data))
 
         # Employees
         dept_qlkho = db.query(models.Department).filter_by(name="Phòng Quản lý kho").first()
         dept_banhang = db.query(models.Department).filter_by(name="Phòng Bán hàng").first()
-        employee_id_1 = f"NV{uuid.uuid4().hex[:8].upper()}"
-        employee_id_2 = f"NV{uuid.uuid4().hex[:8].upper()}"
-        employee_id_3 = f"NV{uuid.uuid4().hex[:8].upper()}"
+        employee_id_1 = ids.new_id("NV")
+        employee_id_2 = ids.new_id("NV")
+        employee_id_3 = ids.new_id("NV")
         employees_data = [
             models.Employee(id=employee_id_1, name='Nguyễn Văn A', gender='Nam', phone='0901112222', address='123 Cầu Giấy, Hà Nội', position='Quản lý kho', revenue_contribution=0.0, department_id=dept_qlkho.id if dept_qlkho else None),
             models.Employee(id=employee_id_2, name='Trần Thị B', gender='Nữ', phone='0903334444', address='456 Hai Bà Trưng, Hà Nội', position='Nhân viên kho', revenue_contribution=0.0, department_id=dept_qlkho.id if dept_qlkho else None),
@@ -105,11 +155,11 @@ def create_initial_data(db: Session):
         db.add_all(employees_data)
         db.commit()
         for e in employees_data: db.refresh(e)
-        print(f"  Đã thêm {len(employees_data)} nhân viên.")
+        logger.info("Đã thêm %d nhân viên.", len(employees_data))
 
         # Suppliers
-        supplier_id_1 = f"NCC{uuid.uuid4().hex[:8].upper()}"
-        supplier_id_2 = f"NCC{uuid.uuid4().hex[:8].upper()}"
+        supplier_id_1 = ids.new_id("NCC")
+        supplier_id_2 = ids.new_id("NCC")
         suppliers_data = [
             models.Supplier(id=supplier_id_1, name='Công ty TNHH Linh kiện Phương Nam', contactPerson='Nguyễn Bách', phone='0901234567', email='phuongnam@example.com', address='123 Đường ABC, TP.HCM'),
             models.Supplier(id=supplier_id_2, name='Nhà phân phối thiết bị số Sài Gòn', contactPerson='Trần Thanh', phone='0907654321', email='saigon-digital@example.com', address='456 Đường XYZ, Hà Nội'),
@@ -117,11 +167,11 @@ def create_initial_data(db: Session):
         db.add_all(suppliers_data)
         db.commit()
         for s in suppliers_data: db.refresh(s)
-        print(f"  Đã thêm {len(suppliers_data)} nhà cung cấp.")
+        logger.info("Đã thêm %d nhà cung cấp.", len(suppliers_data))
 
         # Customers
-        customer_id_1 = f"KH{uuid.uuid4().hex[:8].upper()}"
-        customer_id_2 = f"KH{uuid.uuid4().hex[:8].upper()}"
+        customer_id_1 = ids.new_id("KH")
+        customer_id_2 = ids.new_id("KH")
         customers_data = [
             models.Customer(id=customer_id_1, name='Nguyễn Thị D', phone='0912345678', address='789 Giải Phóng, Hà Nội'),
             models.Customer(id=customer_id_2, name='Phạm Văn E', phone='0987654321', address='101 Hoàng Mai, Hà Nội'),
@@ -129,11 +179,11 @@ def create_initial_data(db: Session):
         db.add_all(customers_data)
         db.commit()
         for c in customers_data: db.refresh(c)
-        print(f"  Đã thêm {len(customers_data)} khách hàng.")
+        logger.info("Đã thêm %d khách hàng.", len(customers_data))
 
         # Warehouses
-        warehouse_id_1 = f"WH{uuid.uuid4().hex[:8].upper()}"
-        warehouse_id_2 = f"WH{uuid.uuid4().hex[:8].upper()}"
+        warehouse_id_1 = ids.new_id("WH")
+        warehouse_id_2 = ids.new_id("WH")
         warehouses_data = [
             models.Warehouse(id=warehouse_id_1, name="Kho Hà Nội", location="Hà Nội", capacity=10000),
             models.Warehouse(id=warehouse_id_2, name="Kho TP.HCM", location="TP.HCM", capacity=15000),
@@ -141,7 +191,7 @@ def create_initial_data(db: Session):
         db.add_all(warehouses_data)
         db.commit()
         for w in warehouses_data: db.refresh(w)
-        print(f"  Đã thêm {len(warehouses_data)} kho.")
+        logger.info("Đã thêm %d kho.", len(warehouses_data))
 
         # Inventory
         inventory_items = []
@@ -153,12 +203,12 @@ def create_initial_data(db: Session):
             inventory_items.append(models.Inventory(product_id=product_id_2, warehouse_id=warehouse_id_2, stock=120))
         db.add_all(inventory_items)
         db.commit()
-        print(f"  Đã thêm {len(inventory_items)} mục tồn kho.")
+        logger.info("Đã thêm %d mục tồn kho.", len(inventory_items))
 
         # Transactions
         transactions_data = [
             models.Transaction(
-                id=f"TX{uuid.uuid4().hex[:8].upper()}", 
+                id=ids.new_id("TX"), 
                 type='import', 
                 product_id=product_id_1,
                 quantity=10, 
@@ -169,7 +219,7 @@ def create_initial_data(db: Session):
                 price=20000000.0
             ),
             models.Transaction(
-                id=f"TX{uuid.uuid4().hex[:8].upper()}", 
+                id=ids.new_id("TX"), 
                 type='export', 
                 product_id=product_id_2,
                 quantity=5, 
@@ -180,7 +230,7 @@ def create_initial_data(db: Session):
                 price=1500000.0
             ),
             models.Transaction(
-                id=f"TX{uuid.uuid4().hex[:8].upper()}", 
+                id=ids.new_id("TX"), 
                 type='import', 
                 product_id=product_id_3,
                 quantity=20, 
@@ -191,7 +241,7 @@ def create_initial_data(db: Session):
                 price=800000.0
             ),
             models.Transaction(
-                id=f"TX{uuid.uuid4().hex[:8].upper()}", 
+                id=ids.new_id("TX"), 
                 type='export', 
                 product_id=product_id_1, 
                 quantity=2, 
@@ -204,11 +254,11 @@ def create_initial_data(db: Session):
         ]
         db.add_all(transactions_data)
         db.commit()
-        print(f"  Đã thêm {len(transactions_data)} giao dịch.")
+        logger.info("Đã thêm %d giao dịch.", len(transactions_data))
         
-        print("Đã thêm dữ liệu mẫu thành công.")
+        logger.info("Đã thêm dữ liệu mẫu thành công.")
     else:
-        print("Database đã có dữ liệu mẫu, không tạo lại.")
+        logger.info("Database đã có dữ liệu mẫu, không tạo lại.")
 
 # Đăng ký hàm tạo dữ liệu ban đầu để chạy khi ứng dụng khởi động
 @app.on_event("startup")
@@ -217,113 +267,485 @@ async def startup_event():
     try:
         # Gọi hàm tạo dữ liệu ban đầu
         create_initial_data(db)
+        # Database có sẵn dữ liệu từ trước khi có bảng search_index: đánh chỉ mục một lần
+        if search_index.is_empty(db):
+            logger.info("Đã đánh chỉ mục tìm kiếm cho %d dòng.", search_index.rebuild(db))
+        # Lần đầu chạy (hoặc sau khi tạo dữ liệu mẫu): tính bộ đếm của trang tổng quan từ dữ liệu hiện có
+        if stats.is_empty(db):
+            stats.recompute(db)
+        elif stats.revenue_is_empty(db):
+            stats.rebuild_revenue_monthly(db)
+        if stats.employee_revenue_is_empty(db):
+            stats.rebuild_employee_revenue(db)
+        if stats.warehouse_usage_is_empty(db):
+            stats.rebuild_warehouse_usage(db)
     finally:
         db.close()
+    # Việc chạy nền của mỗi worker. Chạy trùng giữa các worker vẫn an toàn: việc gộp doanh thu chỉ ghi các
+    # nhân viên có giá trị khác, và mỗi ngày chỉ một worker chụp được tồn kho (khóa chính stock_snapshot_days)
+    app.state.background_tasks = []
+    if stats.EMPLOYEE_REVENUE_MERGE_SECONDS > 0:
+        app.state.background_tasks.append(asyncio.create_task(
+            _run_periodically(stats.EMPLOYEE_REVENUE_MERGE_SECONDS, stats.merge_employee_revenue, "Gộp doanh thu nhân viên")
+        ))
+    if stock_history.CHECK_SECONDS > 0:
+        app.state.background_tasks.append(asyncio.create_task(
+            _run_periodically(stock_history.CHECK_SECONDS, stock_history.ensure_recent, "Chụp tồn kho", immediately=True)
+        ))
+
+def _with_session(job):
+    with SessionLocal() as db:
+        return job(db)
+
+async def _in_threadpool(job, *args):
+    # job(db, *args) trong threadpool với session đồng bộ riêng (không chung giao dịch với request)
+    return await run_in_threadpool(_with_session, lambda db: job(db, *args))
+
+async def _run_periodically(seconds: float, job, name: str, immediately: bool = False):
+    # job(db) chạy trong threadpool với session riêng, mỗi seconds giây; lỗi chỉ được ghi log
+    if not immediately:
+        await asyncio.sleep(seconds)
+    while True:
+        try:
+            await run_in_threadpool(_with_session, job)
+        except Exception:
+            logger.exception("%s thất bại", name)
+        await asyncio.sleep(seconds)
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    for task in getattr(app.state, "background_tasks", []):
+        task.cancel()
+    # Ghi nốt log còn trong hàng đợi trước khi worker dừng
+    logs.shutdown()
 
 # --- API Endpoints ---
 
+async def _sparse_list(db: AsyncSession, response: Response, model, schema, names: List[str], keys, limit: Optional[int] = None,
+                       cursor: Optional[str] = None, matched_ids: Optional[List[str]] = None) -> Response:
+    """
+    Danh sách chỉ gồm các trường names (?fields=...): SELECT đúng các cột đó, không nạp đối tượng ORM.
+    matched_ids: kết quả tìm kiếm đã xếp hạng (giữ thứ tự, không phân trang); None: phân trang theo keys.
+    """
+    stmt = select(*fieldsets.columns(model, names, keys))
+    if matched_ids is not None:
+        found = {row.id: row for row in (await db.execute(stmt.where(model.id.in_(matched_ids)))).all()}
+        rows = [found[entity_id] for entity_id in matched_ids if entity_id in found]
+    else:
+        rows = pagination.page_results((await db.execute(pagination.paginate(stmt, keys, limit, cursor))).all(), keys, limit, response)
+    return fieldsets.respond(rows, names, schema, response)
+
+# Tháng dạng YYYY-MM của các báo cáo theo tháng (chỉ tháng 01-12)
+MONTH_PATTERN = r"^\d{4}-(0[1-9]|1[0-2])$"
+
 # Products
-@app.get("/products", response_model=List[schemas.Product])
-async def get_products(db: Session = Depends(get_db), search: Optional[str] = Query(None, description="Search term for product name, ID, or category")):
-    print(f"Received GET /products with search term: {search}")
-    query = db.query(models.Product)
+@app.get("/products", response_model=List[schemas.Product], dependencies=[Depends(versions.conditional_get("products"))])
+async def get_products(
+    response: Response,
+    db: AsyncSession = Depends(get_db),
+    search: Optional[str] = Query(None, description="Search term for product name, ID, or category"),
+    limit: Optional[int] = Query(None, ge=1, le=pagination.MAX_LIMIT, description="Số dòng tối đa mỗi trang (bỏ trống để lấy tất cả)"),
+    cursor: Optional[str] = Query(None, description="Cursor trang kế tiếp, lấy từ header X-Next-Cursor của trang trước"),
+    fields: Optional[str] = Query(None, description="Chỉ trả về các trường này (phân cách bởi dấu phẩy), ví dụ id,name")
+):
+    logger.debug("Received GET /products", extra={"search": search})
+    names = fieldsets.parse(fields, schemas.Product)
     if search:
-        search_lower = f"%{search.lower()}%"
-        query = query.filter(
-            (func.lower(models.Product.name).like(search_lower)) |
-            (func.lower(models.Product.id).like(search_lower)) |
-            (func.lower(models.Product.category).like(search_lower))
-        )
-    return query.all()
+        # Kết quả tìm kiếm được xếp hạng theo độ liên quan (tối đa limit dòng), không phân trang bằng cursor
+        matched_ids = await db.run_sync(search_index.search_ids, "products", search, limit or search_index.DEFAULT_LIMIT)
+        if names:
+            return await _sparse_list(db, response, models.Product, schemas.Product, names, [models.Product.id], matched_ids=matched_ids)
+        return await db.run_sync(search_index.load_ranked, models.Product, matched_ids)
+    keys = [models.Product.id]
+    if names:
+        return await _sparse_list(db, response, models.Product, schemas.Product, names, keys, limit, cursor)
+    query = pagination.paginate(select(models.Product), keys, limit, cursor)
+    return pagination.page_results((await db.execute(query)).scalars().all(), keys, limit, response)
 
 @app.post("/products", response_model=schemas.Product, status_code=status.HTTP_201_CREATED)
-async def create_product(product: schemas.ProductCreate, db: Session = Depends(get_db)):
-    new_id = f"SP{uuid.uuid4().hex[:8].upper()}"
+async def create_product(product: schemas.ProductCreate, db: AsyncSession = Depends(get_db)):
+    new_id = ids.new_id("SP")
     db_product = models.Product(**product.dict(), id=new_id)
     db.add(db_product)
-    db.commit()
-    db.refresh(db_product)
+    await db.run_sync(stats.product_changed, None, (db_product.price, db_product.stock))
+    await db.commit()
+    await db.refresh(db_product)
     return db_product
 
 @app.put("/products/{product_id}", response_model=schemas.Product)
-async def update_product(product_id: str, product: schemas.ProductCreate, db: Session = Depends(get_db)):
-    db_product = db.query(models.Product).filter(models.Product.id == product_id).first()
+async def update_product(product_id: str, product: schemas.ProductCreate, db: AsyncSession = Depends(get_db)):
+    db_product = await db.get(models.Product, product_id)
     if db_product is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Product not found")
     
+    old_state = (db_product.price, db_product.stock)
     for key, value in product.dict(exclude_unset=True).items():
         setattr(db_product, key, value)
+    await db.run_sync(stats.product_changed, old_state, (db_product.price, db_product.stock))
     
-    db.commit()
-    db.refresh(db_product)
+    await db.commit()
+    await db.refresh(db_product)
     return db_product
 
 @app.delete("/products/{product_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_product(product_id: str, db: Session = Depends(get_db)):
-    db_product = db.query(models.Product).filter(models.Product.id == product_id).first()
+async def delete_product(product_id: str, db: AsyncSession = Depends(get_db)):
+    db_product = await db.get(models.Product, product_id)
     if db_product is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Product not found")
     
-    db.delete(db_product)
-    db.commit()
+    # Tồn kho tại từng kho được trừ như sửa tay (mức sử dụng kho, ảnh chụp theo kho) rồi mới xóa dòng inventory;
+    # phần còn lại của tồn kho tổng (không nằm ở kho nào) được ghi nhận theo sản phẩm
+    inventory = (await db.execute(
+        select(models.Inventory.warehouse_id, models.Inventory.stock).where(models.Inventory.product_id == product_id)
+    )).all()
+    for warehouse_id, stock in inventory:
+        await _change_inventory_by_hand(db, product_id, warehouse_id, -(stock or 0))
+    if inventory:
+        await db.execute(delete(models.Inventory).where(models.Inventory.product_id == product_id))
+        await db.refresh(db_product)
+    await db.run_sync(stats.product_changed, (db_product.price, db_product.stock), None)
+    await db.run_sync(stock_history.record_adjustment, product_id, None, -(db_product.stock or 0))
+    await db.delete(db_product)
+    await db.commit()
     return
 
 # Employees
-@app.get("/employees", response_model=List[schemas.Employee])
-async def get_employees(db: Session = Depends(get_db)):
-    return db.query(models.Employee).all()
+@app.get("/employees", response_model=List[schemas.Employee], dependencies=[Depends(versions.conditional_get("employees"))])
+async def get_employees(
+    response: Response,
+    db: AsyncSession = Depends(get_db),
+    limit: Optional[int] = Query(None, ge=1, le=pagination.MAX_LIMIT, description="Số dòng tối đa mỗi trang (bỏ trống để lấy tất cả)"),
+    cursor: Optional[str] = Query(None, description="Cursor trang kế tiếp, lấy từ header X-Next-Cursor của trang trước"),
+    fields: Optional[str] = Query(None, description="Chỉ trả về các trường này (phân cách bởi dấu phẩy), ví dụ id,name")
+):
+    keys = [models.Employee.id]
+    names = fieldsets.parse(fields, schemas.Employee)
+    if names:
+        return await _sparse_list(db, response, models.Employee, schemas.Employee, names, keys, limit, cursor)
+    query = pagination.paginate(select(models.Employee), keys, limit, cursor)
+    return pagination.page_results((await db.execute(query)).scalars().all(), keys, limit, response)
+
+def _leaderboard_window(period: str, month_from: Optional[str], month_to: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+    """Khoảng tháng của bảng xếp hạng: from/to nếu có, không thì tháng/năm hiện tại theo period."""
+    if month_from is None and month_to is None and period != "all":
+        current = stats.month_of(datetime.date.today())
+        return (current, current) if period == "month" else (current[:4] + "-01", current[:4] + "-12")
+    return month_from, month_to
+
+# Khoảng mặc định (tháng/năm hiện tại) đi vào ETag: sang tháng mới thì không trả 304 cho tháng cũ
+@app.get(
+    "/employees/leaderboard",
+    response_model=List[Dict[str, Any]],
+    dependencies=[Depends(versions.conditional_get(
+        "employee_revenue", "employees",
+        scope=lambda request: "%s..%s" % _leaderboard_window(
+            request.query_params.get("period", "month"), request.query_params.get("from"), request.query_params.get("to")
+        )
+    ))]
+)
+async def get_employee_leaderboard(
+    db: AsyncSession = Depends(get_db),
+    period: Literal["month", "year", "all"] = Query("month", description="Tháng hiện tại, năm hiện tại hoặc toàn bộ (bị thay bởi from/to nếu có)"),
+    month_from: Optional[str] = Query(None, alias="from", pattern=MONTH_PATTERN, description="Từ tháng (YYYY-MM, bao gồm)"),
+    month_to: Optional[str] = Query(None, alias="to", pattern=MONTH_PATTERN, description="Đến tháng (YYYY-MM, bao gồm)"),
+    limit: int = Query(10, ge=1, le=100, description="Số nhân viên trả về")
+):
+    # Đọc từ bảng employee_revenue (theo nhân viên và tháng), không gom nhóm bảng transactions
+    month_from, month_to = _leaderboard_window(period, month_from, month_to)
+    return await db.run_sync(stats.leaderboard, month_from, month_to, limit)
+
+@app.post("/employees/revenue/merge", response_model=Dict[str, Any])
+async def merge_employee_revenue():
+    # Cập nhật ngay employees.revenue_contribution (bình thường chạy nền mỗi EMPLOYEE_REVENUE_MERGE_SECONDS giây)
+    return {"updated": await _in_threadpool(stats.merge_employee_revenue)}
+
+@app.post("/employees/revenue/reconcile", response_model=Dict[str, Any])
+async def reconcile_employee_revenue():
+    # Tính lại toàn bộ employee_revenue từ transactions và các tháng đã lưu trữ (tốn kém, chỉ dùng định kỳ)
+    return {"rows": await _in_threadpool(stats.rebuild_employee_revenue)}
 
 @app.post("/employees", response_model=schemas.Employee, status_code=status.HTTP_201_CREATED)
-async def create_employee(employee: schemas.EmployeeCreate, db: Session = Depends(get_db)):
-    new_id = f"NV{uuid.uuid4().hex[:8].upper()}"
+async def create_employee(employee: schemas.EmployeeCreate, db: AsyncSession = Depends(get_db)):
+    new_id = ids.new_id("NV")
     db_employee = models.Employee(**employee.dict(), id=new_id, revenue_contribution=0.0)
     db.add(db_employee)
-    db.commit()
-    db.refresh(db_employee)
+    await db.commit()
+    await db.refresh(db_employee)
     return db_employee
 
 @app.put("/employees/{employee_id}", response_model=schemas.Employee)
-async def update_employee(employee_id: str, employee: schemas.EmployeeCreate, db: Session = Depends(get_db)):
-    db_employee = db.query(models.Employee).filter(models.Employee.id == employee_id).first()
+async def update_employee(employee_id: str, employee: schemas.EmployeeCreate, db: AsyncSession = Depends(get_db)):
+    db_employee = await db.get(models.Employee, employee_id)
     if db_employee is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Employee not found")
     
     for key, value in employee.dict(exclude_unset=True).items():
         setattr(db_employee, key, value)
     
-    db.commit()
-    db.refresh(db_employee)
+    await db.commit()
+    await db.refresh(db_employee)
     return db_employee
 
 @app.delete("/employees/{employee_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_employee(employee_id: str, db: Session = Depends(get_db)):
-    db_employee = db.query(models.Employee).filter(models.Employee.id == employee_id).first()
+async def delete_employee(employee_id: str, db: AsyncSession = Depends(get_db)):
+    db_employee = await db.get(models.Employee, employee_id)
     if db_employee is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Employee not found")
     
-    db.delete(db_employee)
-    db.commit()
+    await db.delete(db_employee)
+    await db.commit()
     return
 
 # Transactions
-@app.get("/transactions", response_model=List[schemas.Transaction])
-async def get_transactions(db: Session = Depends(get_db), search: Optional[str] = Query(None, description="Search term for transaction ID, product ID, or employee ID")):
-    print(f"Received GET /transactions with search term: {search}")
-    query = db.query(models.Transaction)
+
+# Giá trị của tham số expand (phân cách bởi dấu phẩy) -> (trường trả về, bảng chứa tên)
+TRANSACTION_EXPANSIONS = {
+    "product": ("product_name", models.Product),
+    "employee": ("employee_name", models.Employee),
+    "counterparty": ("counterparty_name", None),  # nhà cung cấp (phiếu nhập) hoặc khách hàng (phiếu xuất)
+}
+
+def _parse_expand(expand: Optional[str], allowed) -> List[str]:
+    values = {value.strip() for value in (expand or "").split(",") if value.strip()}
+    unknown = values - set(allowed)
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown expand value: {', '.join(sorted(unknown))} (allowed: {', '.join(allowed)})"
+        )
+    return [value for value in allowed if value in values]
+
+def _expanded_transactions(expand: List[str], names: Optional[List[str]] = None):
+    """
+    SELECT các cột của transactions kèm tên đã yêu cầu, bằng LEFT JOIN theo khóa chính (chỉ nạp cột name
+    của bảng được join, mỗi phiếu vẫn là đúng một dòng). names (?fields=...): chỉ các cột đó cùng mã phiếu.
+    """
+    tx = models.Transaction
+    columns, joins = [], []
+    if "product" in expand:
+        columns.append(models.Product.name.label("product_name"))
+        joins.append((models.Product, models.Product.id == tx.product_id))
+    if "employee" in expand:
+        columns.append(models.Employee.name.label("employee_name"))
+        joins.append((models.Employee, models.Employee.id == tx.employee_id))
+    if "counterparty" in expand:
+        columns.append(case((tx.type == "import", models.Supplier.name), else_=models.Customer.name).label("counterparty_name"))
+        joins.append((models.Supplier, models.Supplier.id == tx.supplier_id))
+        joins.append((models.Customer, models.Customer.id == tx.customer_id))
+    stmt = select(*(fieldsets.columns(tx, names, [tx.id]) if names else [tx.__table__]), *columns)
+    for model, condition in joins:
+        stmt = stmt.outerjoin(model, condition)
+    return stmt
+
+async def _attach_names(db: AsyncSession, rows: List[Any], expand: List[str]) -> None:
+    """Gắn tên cho các phiếu không lấy được bằng JOIN (tháng đã lưu trữ): một truy vấn IN cho mỗi bảng."""
+    lookups = []
+    if "product" in expand:
+        lookups.append((models.Product, "product_name", lambda row: row.product_id))
+    if "employee" in expand:
+        lookups.append((models.Employee, "employee_name", lambda row: row.employee_id))
+    if "counterparty" in expand:
+        lookups.append((models.Supplier, "counterparty_name", lambda row: row.supplier_id if row.type == "import" else None))
+        lookups.append((models.Customer, "counterparty_name", lambda row: row.customer_id if row.type != "import" else None))
+    for model, field, key_of in lookups:
+        keys = {key_of(row) for row in rows} - {None}
+        names = dict((await db.execute(select(model.id, model.name).where(model.id.in_(keys)))).all()) if keys else {}
+        for row in rows:
+            key = key_of(row)
+            if key is not None or not hasattr(row, field):
+                setattr(row, field, names.get(key))
+
+@app.get(
+    "/transactions",
+    response_model=List[schemas.TransactionExpanded],
+    response_model_exclude_unset=True,
+    dependencies=[Depends(versions.conditional_get("transactions", "products", "archived_months", "employees", "suppliers", "customers"))]
+)
+async def get_transactions(
+    response: Response,
+    db: AsyncSession = Depends(get_db),
+    search: Optional[str] = Query(None, description="Search term for transaction ID, product ID, or employee ID (archived months are not searched, see header X-Archived-Months-Excluded)"),
+    limit: Optional[int] = Query(None, ge=1, le=pagination.MAX_LIMIT, description="Số dòng tối đa mỗi trang (bỏ trống để lấy tất cả)"),
+    cursor: Optional[str] = Query(None, description="Cursor trang kế tiếp, lấy từ header X-Next-Cursor của trang trước"),
+    expand: Optional[str] = Query(None, description="Thêm tên: product, employee, counterparty (phân cách bởi dấu phẩy)"),
+    fields: Optional[str] = Query(None, description="Chỉ trả về các trường này (phân cách bởi dấu phẩy), ví dụ id,productId,quantity")
+):
+    logger.debug("Received GET /transactions", extra={"search": search})
+    expand = _parse_expand(expand, list(TRANSACTION_EXPANSIONS))
+    names = fieldsets.parse(fields, schemas.TransactionExpanded)
+    if names:
+        # Trường tên trong fields tự bật expand tương ứng; tên đã expand luôn được trả về
+        expand = [value for value, (field, _) in TRANSACTION_EXPANSIONS.items() if value in expand or field in names]
+        expanded_fields = {TRANSACTION_EXPANSIONS[value][0] for value in expand}
+        names = [name for name in schemas.TransactionExpanded.model_fields if name in names or name in expanded_fields]
     if search:
-        search_lower = f"%{search.lower()}%"
-        query = query.filter(
-            (func.lower(models.Transaction.id).like(search_lower)) |
-            (func.lower(models.Transaction.product_id).like(search_lower)) |
-            (func.lower(models.Transaction.employee_id).like(search_lower)) |
-            (func.lower(models.Transaction.supplier_id).like(search_lower)) |
-            (func.lower(models.Transaction.customer_id).like(search_lower))
+        # Kết quả tìm kiếm được xếp hạng theo độ liên quan (tối đa limit dòng), không phân trang bằng cursor.
+        # Chỉ tìm trên bảng nóng: khi đã có tháng lưu trữ, header X-Archived-Months-Excluded cho biết số tháng
+        # không được tìm (khôi phục tháng đó bằng archive.py restore để tìm được)
+        matched_ids = await db.run_sync(search_index.search_ids, "transactions", search, limit or search_index.DEFAULT_LIMIT)
+        excluded = len(await archive.months(db))
+        if excluded:
+            response.headers[archive.EXCLUDED_HEADER] = str(excluded)
+        if not expand and not names:
+            return await db.run_sync(search_index.load_ranked, models.Transaction, matched_ids)
+        found = {row.id: row for row in (await db.execute(
+            _expanded_transactions(expand, names).where(models.Transaction.id.in_(matched_ids))
+        )).all()}
+        rows = [found[transaction_id] for transaction_id in matched_ids if transaction_id in found]
+        return fieldsets.respond(rows, names, schemas.TransactionExpanded, response) if names else rows
+    keys = [models.Transaction.id]
+    if expand or names:
+        query = pagination.paginate(_expanded_transactions(expand, names), keys, limit, cursor)
+        rows = (await db.execute(query)).all()
+    else:
+        query = pagination.paginate(select(models.Transaction), keys, limit, cursor)
+        rows = (await db.execute(query)).scalars().all()
+    # Gộp với các tháng đã lưu trữ (archive.py) theo cùng thứ tự mã, lấy dư 1 dòng như paginate
+    entries = await archive.months(db)
+    if entries:
+        after_id = pagination.decode_cursor(cursor, len(keys))[0] if cursor else None
+        count = None if limit is None else limit + 1
+        archived = await run_in_threadpool(archive.get_reader().page, entries, after_id, count)
+        if expand and archived:
+            await _attach_names(db, archived, expand)
+        rows = archive.merge_by_id(rows, archived, count)
+    rows = pagination.page_results(rows, keys, limit, response)
+    return fieldsets.respond(rows, names, schemas.TransactionExpanded, response) if names else rows
+
+# Các cột được xuất, theo đúng thứ tự trong file CSV
+EXPORT_COLUMNS = ["id", "type", "product_id", "employee_id", "quantity", "price", "date", "supplier_id", "customer_id", "warehouse_id"]
+# Số dòng lấy từ server-side cursor mỗi lần (và gửi đi thành một khối)
+EXPORT_BATCH_SIZE = 1000
+
+def _encode_rows(rows, field_names: List[str], fmt: str) -> bytes:
+    buffer = io.StringIO()
+    if fmt == "csv":
+        writer = csv.writer(buffer)
+        writer.writerows(
+            [value.isoformat() if isinstance(value, datetime.date) else value for value in row]
+            for row in rows
         )
-    return query.all()
+    else:
+        for row in rows:
+            buffer.write(json.dumps(dict(zip(field_names, row)), ensure_ascii=False, default=str))
+            buffer.write("\n")
+    return buffer.getvalue().encode("utf-8")
+
+async def _stream_transactions(stmt, fmt: str, archived=()):
+    # Generator chạy khi response đang được gửi nên dùng session riêng thay vì session của dependency.
+    # db.stream (server-side cursor) + yield_per: driver chỉ giữ một lô dòng trong bộ nhớ tại một thời điểm.
+    # archived: các hàm đọc dòng của từng tháng đã lưu trữ, được xuất trước các dòng của bảng nóng.
+    async with AsyncSessionLocal() as db:
+        # Tên trường giống với JSON của GET /transactions (camelCase)
+        field_names = [schemas.to_camel(name) for name in EXPORT_COLUMNS]
+        if fmt == "csv":
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(field_names)
+            yield buffer.getvalue().encode("utf-8")
+
+        for load in archived:
+            rows = await run_in_threadpool(load)
+            for start in range(0, len(rows), EXPORT_BATCH_SIZE):
+                yield _encode_rows(rows[start:start + EXPORT_BATCH_SIZE], field_names, fmt)
+
+        result = await db.stream(stmt.execution_options(yield_per=EXPORT_BATCH_SIZE))
+        async for rows in result.partitions():
+            yield _encode_rows(rows, field_names, fmt)
+
+@app.get("/transactions/export")
+async def export_transactions(
+    db: AsyncSession = Depends(get_db),
+    fmt: Literal["ndjson", "csv"] = Query("ndjson", alias="format", description="Định dạng xuất: ndjson hoặc csv"),
+    date_from: Optional[datetime.date] = Query(None, description="Từ ngày (bao gồm)"),
+    date_to: Optional[datetime.date] = Query(None, description="Đến ngày (bao gồm)"),
+    type: Optional[Literal["import", "export"]] = Query(None, description="Chỉ xuất phiếu nhập hoặc phiếu xuất")
+):
+    table = models.Transaction.__table__
+    stmt = select(*[table.c[name] for name in EXPORT_COLUMNS]).order_by(table.c.id)
+    if date_from:
+        stmt = stmt.where(table.c.date >= date_from)
+    if date_to:
+        stmt = stmt.where(table.c.date <= date_to)
+    if type:
+        stmt = stmt.where(table.c.type == type)
+    # Các tháng đã lưu trữ trong khoảng ngày: xuất trước, mỗi tháng theo thứ tự mã
+    entries = await archive.months(
+        db, date_from.strftime("%Y-%m") if date_from else None, date_to.strftime("%Y-%m") if date_to else None
+    )
+    reader = archive.get_reader()
+    archived = [
+        functools.partial(reader.select, entry, EXPORT_COLUMNS, date_from=date_from, date_to=date_to, type=type)
+        for entry in entries
+    ]
+
+    media_type = "text/csv; charset=utf-8" if fmt == "csv" else "application/x-ndjson"
+    filename = f"transactions.{'csv' if fmt == 'csv' else 'ndjson'}"
+    return StreamingResponse(
+        _stream_transactions(stmt, fmt, archived),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+async def _change_stock(db: AsyncSession, product_id: str, delta: int, require_stock: bool) -> bool:
+    """
+    UPDATE products SET stock = stock + :delta WHERE id = :id [AND stock >= -:delta]
+    Một câu lệnh có điều kiện thay cho đọc tồn kho vào Python rồi ghi lại: không mất cập nhật khi nhiều
+    phiếu xuất chạy đồng thời và khóa dòng chỉ được giữ trong một câu lệnh.
+    Trả về False nếu không có dòng nào được cập nhật (sản phẩm không tồn tại hoặc không đủ tồn kho).
+    """
+    table = models.Product.__table__
+    stmt = update(table).where(table.c.id == product_id).values(stock=func.coalesce(table.c.stock, 0) + delta)
+    if require_stock:
+        stmt = stmt.where(func.coalesce(table.c.stock, 0) >= -delta)
+    return (await db.execute(stmt)).rowcount == 1
+
+async def _change_inventory(db: AsyncSession, product_id: str, warehouse_id: str, delta: int, require_stock: bool) -> bool:
+    """
+    Như _change_stock cho tồn kho của sản phẩm tại một kho (bảng inventory). Dòng chưa có được tạo khi nhập
+    thêm; trả về False nếu không đủ tồn kho tại kho (hoặc chưa có dòng khi cần trừ).
+    """
+    table = models.Inventory.__table__
+    condition = (table.c.product_id == product_id, table.c.warehouse_id == warehouse_id)
+    stmt = update(table).where(*condition).values(stock=func.coalesce(table.c.stock, 0) + delta)
+    if require_stock:
+        stmt = stmt.where(func.coalesce(table.c.stock, 0) >= -delta)
+    if (await db.execute(stmt)).rowcount == 1:
+        return True
+    if delta <= 0:
+        return False
+    try:
+        async with db.begin_nested():
+            await db.execute(insert(table).values(product_id=product_id, warehouse_id=warehouse_id, stock=delta))
+    except IntegrityError:
+        # Giao dịch khác vừa tạo dòng này
+        return (await db.execute(stmt)).rowcount == 1
+    return True
+
+async def _change_warehouse_usage(db: AsyncSession, warehouse_id: str, delta: int, capacity: Optional[int]) -> bool:
+    """
+    UPDATE warehouse_usage SET used = used + :delta WHERE warehouse_id = :id [AND used + :delta <= :capacity]
+    Sức chứa chỉ được kiểm tra khi tăng (capacity None: không giới hạn). Trả về False nếu vượt sức chứa.
+    """
+    table = models.WarehouseUsage.__table__
+    stmt = update(table).where(table.c.warehouse_id == warehouse_id).values(used=table.c.used + delta)
+    if capacity is not None and delta > 0:
+        stmt = stmt.where(table.c.used + delta <= capacity)
+    if (await db.execute(stmt)).rowcount == 1:
+        return True
+    if (await db.execute(select(table.c.warehouse_id).where(table.c.warehouse_id == warehouse_id))).first() is not None:
+        return False
+    # Kho chưa có dòng mức sử dụng: tạo rồi thử lại
+    try:
+        async with db.begin_nested():
+            await db.execute(insert(table).values(warehouse_id=warehouse_id, used=0))
+    except IntegrityError:
+        pass
+    return (await db.execute(stmt)).rowcount == 1
 
 @app.post("/transactions", response_model=schemas.Transaction, status_code=status.HTTP_201_CREATED)
-async def create_transaction(transaction: schemas.TransactionCreate, db: Session = Depends(get_db)):
-    new_id = f"TX{uuid.uuid4().hex[:8].upper()}"
+async def create_transaction(transaction: schemas.TransactionCreate, db: AsyncSession = Depends(get_db)):
+    new_id = ids.new_id("TX")
     db_transaction = models.Transaction(
         id=new_id,
         type=transaction.type,
@@ -333,137 +755,322 @@ async def create_transaction(transaction: schemas.TransactionCreate, db: Session
         employee_id=transaction.employee_id, # Corrected: employee_id
         supplier_id=transaction.supplier_id, # Corrected: supplier_id
         customer_id=transaction.customer_id, # Corrected: customer_id
-        price=transaction.price
+        price=transaction.price,
+        warehouse_id=transaction.warehouse_id
     )
     db.add(db_transaction)
-    
-    product = db.query(models.Product).filter(models.Product.id == db_transaction.product_id).first()
-    if not product:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Product not found for transaction")
-    
-    if db_transaction.type == 'import':
-        product.stock += db_transaction.quantity
-    elif db_transaction.type == 'export':
-        if product.stock < db_transaction.quantity:
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Not enough stock for this export transaction")
-        product.stock -= db_transaction.quantity
-    
-    employee = db.query(models.Employee).filter(models.Employee.id == db_transaction.employee_id).first()
-    if not employee:
+
+    stock_delta = db_transaction.quantity if db_transaction.type == 'import' else -db_transaction.quantity
+    if not await _change_stock(db, db_transaction.product_id, stock_delta, require_stock=db_transaction.type == 'export'):
+        # Chỉ khi cập nhật thất bại mới cần biết lý do
+        if await cache.get(db, models.Product, db_transaction.product_id) is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Product not found for transaction")
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Not enough stock for this export transaction")
+
+    # Doanh thu của nhân viên được cộng vào employee_revenue (stats.transactions_changed), không ghi dòng employees
+    if await cache.get(db, models.Employee, db_transaction.employee_id) is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Employee not found for transaction")
+    if db_transaction.supplier_id and await cache.get(db, models.Supplier, db_transaction.supplier_id) is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Supplier not found for transaction")
+    if db_transaction.customer_id and await cache.get(db, models.Customer, db_transaction.customer_id) is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Customer not found for transaction")
 
-    if db_transaction.type == 'export':
-        employee.revenue_contribution += (db_transaction.quantity * db_transaction.price)
+    # Tồn kho tại kho và mức sử dụng kho đổi trong cùng giao dịch DB với tồn kho tổng của sản phẩm
+    if db_transaction.warehouse_id:
+        warehouse = await cache.get(db, models.Warehouse, db_transaction.warehouse_id)
+        if warehouse is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Warehouse not found for transaction")
+        if not await _change_inventory(db, db_transaction.product_id, db_transaction.warehouse_id, stock_delta, require_stock=db_transaction.type == 'export'):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Not enough stock in this warehouse")
+        if not await _change_warehouse_usage(db, db_transaction.warehouse_id, stock_delta, warehouse["capacity"]):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Warehouse capacity exceeded")
 
-    db.commit()
-    db.refresh(db_transaction)
-    db.refresh(product)
-    db.refresh(employee)
+    price = (await cache.get(db, models.Product, db_transaction.product_id))["price"]
+    await db.run_sync(stats.stock_changed, price, stock_delta)
+    await db.run_sync(stats.transactions_changed, [db_transaction], 1)
+    await db.run_sync(stock_history.transactions_changed, [db_transaction], 1)
+
+    await db.commit()
+    await db.refresh(db_transaction)
     
     return db_transaction
 
+# Số phiếu tối đa trong một lần gọi POST /transactions/batch
+TRANSACTION_BATCH_LIMIT = 1000
+
+@app.post("/transactions/batch", response_model=List[schemas.TransactionBatchItemResult])
+async def create_transactions_batch(transactions: List[schemas.TransactionCreate], db: AsyncSession = Depends(get_db)):
+    if len(transactions) > TRANSACTION_BATCH_LIMIT:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"A batch can contain at most {TRANSACTION_BATCH_LIMIT} transactions")
+
+    # Kiểm tra sự tồn tại bằng một truy vấn IN cho mỗi bảng thay vì hai SELECT cho mỗi phiếu.
+    # Các dòng sản phẩm được khóa (FOR UPDATE) để tồn kho không đổi giữa lúc kiểm tra và lúc cập nhật.
+    product_ids = sorted({t.product_id for t in transactions})
+    products = {
+        row.id: row for row in await db.execute(
+            select(models.Product.id, models.Product.stock, models.Product.price)
+            .where(models.Product.id.in_(product_ids)).order_by(models.Product.id).with_for_update()
+        )
+    }
+    employee_ids = set((await db.execute(
+        select(models.Employee.id).where(models.Employee.id.in_({t.employee_id for t in transactions}))
+    )).scalars())
+    supplier_ids = set((await db.execute(
+        select(models.Supplier.id).where(models.Supplier.id.in_({t.supplier_id for t in transactions if t.supplier_id}))
+    )).scalars())
+    customer_ids = set((await db.execute(
+        select(models.Customer.id).where(models.Customer.id.in_({t.customer_id for t in transactions if t.customer_id}))
+    )).scalars())
+    # Sức chứa, mức sử dụng và tồn kho theo kho của các kho được nhắc tới (khóa như dòng sản phẩm)
+    capacities = dict((await db.execute(
+        select(models.Warehouse.id, models.Warehouse.capacity)
+        .where(models.Warehouse.id.in_({t.warehouse_id for t in transactions if t.warehouse_id}))
+    )).all())
+    used = dict((await db.execute(
+        select(models.WarehouseUsage.warehouse_id, models.WarehouseUsage.used)
+        .where(models.WarehouseUsage.warehouse_id.in_(sorted(capacities)))
+        .order_by(models.WarehouseUsage.warehouse_id).with_for_update()
+    )).all())
+    inventory = {
+        (row.product_id, row.warehouse_id): row.stock or 0 for row in await db.execute(
+            select(models.Inventory.product_id, models.Inventory.warehouse_id, models.Inventory.stock)
+            .where(models.Inventory.product_id.in_(product_ids), models.Inventory.warehouse_id.in_(sorted(capacities)))
+            .order_by(models.Inventory.product_id, models.Inventory.warehouse_id).with_for_update()
+        )
+    }
+
+    # Xét từng phiếu theo thứ tự gửi lên; tồn kho được trừ dần để phiếu sau thấy kết quả của phiếu trước
+    stock = {product_id: row.stock or 0 for product_id, row in products.items()}
+    stock_deltas: Dict[str, int] = {}
+    inventory_deltas: Dict[Any, int] = {}
+    usage_deltas: Dict[str, int] = {}
+    accepted = []
+    results = []
+    for index, transaction in enumerate(transactions):
+        if transaction.product_id not in products:
+            error = "Product not found for transaction"
+        elif transaction.employee_id not in employee_ids:
+            error = "Employee not found for transaction"
+        elif transaction.supplier_id and transaction.supplier_id not in supplier_ids:
+            error = "Supplier not found for transaction"
+        elif transaction.customer_id and transaction.customer_id not in customer_ids:
+            error = "Customer not found for transaction"
+        elif transaction.warehouse_id and transaction.warehouse_id not in capacities:
+            error = "Warehouse not found for transaction"
+        elif transaction.type == 'export' and stock[transaction.product_id] < transaction.quantity:
+            error = "Not enough stock for this export transaction"
+        elif transaction.warehouse_id and transaction.type == 'export' and inventory.get((transaction.product_id, transaction.warehouse_id), 0) < transaction.quantity:
+            error = "Not enough stock in this warehouse"
+        elif (transaction.warehouse_id and transaction.type == 'import' and capacities[transaction.warehouse_id] is not None
+              and used.get(transaction.warehouse_id, 0) + transaction.quantity > capacities[transaction.warehouse_id]):
+            error = "Warehouse capacity exceeded"
+        else:
+            error = None
+        if error:
+            results.append(schemas.TransactionBatchItemResult(index=index, status="error", detail=error))
+            continue
+
+        delta = transaction.quantity if transaction.type == 'import' else -transaction.quantity
+        stock[transaction.product_id] += delta
+        stock_deltas[transaction.product_id] = stock_deltas.get(transaction.product_id, 0) + delta
+        if transaction.warehouse_id:
+            key = (transaction.product_id, transaction.warehouse_id)
+            inventory[key] = inventory.get(key, 0) + delta
+            inventory_deltas[key] = inventory_deltas.get(key, 0) + delta
+            used[transaction.warehouse_id] = used.get(transaction.warehouse_id, 0) + delta
+            usage_deltas[transaction.warehouse_id] = usage_deltas.get(transaction.warehouse_id, 0) + delta
+        new_id = ids.new_id("TX")
+        accepted.append({"id": new_id, **transaction.dict()})
+        results.append(schemas.TransactionBatchItemResult(index=index, status="created", id=new_id))
+
+    if accepted:
+        # Ghi tất cả trong một giao dịch DB: một INSERT nhiều dòng và một UPDATE gộp cho mỗi sản phẩm,
+        # mỗi cặp (sản phẩm, kho) và mỗi kho
+        await db.execute(models.Transaction.__table__.insert(), accepted)
+        for product_id, delta in sorted(stock_deltas.items()):
+            # Điều kiện tồn kho vẫn được kiểm tra trong câu lệnh UPDATE phòng khi DB không hỗ trợ FOR UPDATE
+            if delta and not await _change_stock(db, product_id, delta, require_stock=delta < 0):
+                await db.rollback()
+                raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Stock changed concurrently, please retry the batch")
+        for (product_id, warehouse_id), delta in sorted(inventory_deltas.items()):
+            if delta and not await _change_inventory(db, product_id, warehouse_id, delta, require_stock=delta < 0):
+                await db.rollback()
+                raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Stock changed concurrently, please retry the batch")
+        for warehouse_id, delta in sorted(usage_deltas.items()):
+            if delta and not await _change_warehouse_usage(db, warehouse_id, delta, capacities[warehouse_id]):
+                await db.rollback()
+                raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Warehouse usage changed concurrently, please retry the batch")
+        await db.run_sync(stats.add, {stats.INVENTORY_VALUE: sum((products[p].price or 0.0) * d for p, d in stock_deltas.items())})
+        await db.run_sync(stats.transactions_changed, [SimpleNamespace(**row) for row in accepted], 1)
+        await db.run_sync(stock_history.transactions_changed, [SimpleNamespace(**row) for row in accepted], 1)
+        await db.commit()
+
+    return results
+
 @app.delete("/transactions/{transaction_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_transaction(transaction_id: str, db: Session = Depends(get_db)):
-    db_transaction = db.query(models.Transaction).filter(models.Transaction.id == transaction_id).first()
+async def delete_transaction(transaction_id: str, db: AsyncSession = Depends(get_db)):
+    db_transaction = await db.get(models.Transaction, transaction_id)
     if db_transaction is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Transaction not found")
     
-    product = db.query(models.Product).filter(models.Product.id == db_transaction.product_id).first()
-    if product:
-        if db_transaction.type == 'import':
-            product.stock -= db_transaction.quantity
-        elif db_transaction.type == 'export':
-            product.stock += db_transaction.quantity
-    
-    employee = db.query(models.Employee).filter(models.Employee.id == db_transaction.employee_id).first()
-    if employee and db_transaction.type == 'export':
-        employee.revenue_contribution -= (db_transaction.quantity * db_transaction.price)
-
-    db.delete(db_transaction)
-    db.commit()
-    if product: db.refresh(product)
-    if employee: db.refresh(employee)
+    # Hoàn lại tồn kho bằng câu lệnh UPDATE nguyên tử (sản phẩm đã bị xóa thì bỏ qua như trước)
+    stock_delta = -db_transaction.quantity if db_transaction.type == 'import' else db_transaction.quantity
+    if await _change_stock(db, db_transaction.product_id, stock_delta, require_stock=False):
+        price = (await cache.get(db, models.Product, db_transaction.product_id))["price"]
+        await db.run_sync(stats.stock_changed, price, stock_delta)
+    if db_transaction.warehouse_id:
+        # Hoàn lại cả tồn kho tại kho và mức sử dụng kho (không chặn theo sức chứa khi hoàn lại)
+        await _change_inventory(db, db_transaction.product_id, db_transaction.warehouse_id, stock_delta, require_stock=False)
+        await _change_warehouse_usage(db, db_transaction.warehouse_id, stock_delta, None)
+
+    await db.run_sync(stats.transactions_changed, [db_transaction], -1)
+    await db.run_sync(stock_history.transactions_changed, [db_transaction], -1)
+    await db.delete(db_transaction)
+    await db.commit()
     
     return
 
 # Suppliers
-@app.get("/suppliers", response_model=List[schemas.Supplier])
-async def get_suppliers(db: Session = Depends(get_db), search: Optional[str] = Query(None, description="Search term for supplier name, ID, or contact person")):
-    print(f"Received GET /suppliers with search term: {search}")
-    query = db.query(models.Supplier)
+@app.get("/suppliers", response_model=List[schemas.Supplier], dependencies=[Depends(versions.conditional_get("suppliers"))])
+async def get_suppliers(
+    response: Response,
+    db: AsyncSession = Depends(get_db),
+    search: Optional[str] = Query(None, description="Search term for supplier name, ID, or contact person"),
+    limit: Optional[int] = Query(None, ge=1, le=pagination.MAX_LIMIT, description="Số dòng tối đa mỗi trang (bỏ trống để lấy tất cả)"),
+    cursor: Optional[str] = Query(None, description="Cursor trang kế tiếp, lấy từ header X-Next-Cursor của trang trước"),
+    fields: Optional[str] = Query(None, description="Chỉ trả về các trường này (phân cách bởi dấu phẩy), ví dụ id,name")
+):
+    logger.debug("Received GET /suppliers", extra={"search": search})
+    names = fieldsets.parse(fields, schemas.Supplier)
     if search:
-        search_lower = f"%{search.lower()}%"
-        query = query.filter(
-            (func.lower(models.Supplier.name).like(search_lower)) |
-            (func.lower(models.Supplier.id).like(search_lower)) |
-            (func.lower(models.Supplier.contactPerson).like(search_lower))
-        )
-    return query.all()
+        # Kết quả tìm kiếm được xếp hạng theo độ liên quan (tối đa limit dòng), không phân trang bằng cursor
+        matched_ids = await db.run_sync(search_index.search_ids, "suppliers", search, limit or search_index.DEFAULT_LIMIT)
+        if names:
+            return await _sparse_list(db, response, models.Supplier, schemas.Supplier, names, [models.Supplier.id], matched_ids=matched_ids)
+        return await db.run_sync(search_index.load_ranked, models.Supplier, matched_ids)
+    keys = [models.Supplier.id]
+    if names:
+        return await _sparse_list(db, response, models.Supplier, schemas.Supplier, names, keys, limit, cursor)
+    query = pagination.paginate(select(models.Supplier), keys, limit, cursor)
+    return pagination.page_results((await db.execute(query)).scalars().all(), keys, limit, response)
 
 @app.post("/suppliers", response_model=schemas.Supplier, status_code=status.HTTP_201_CREATED)
-async def create_supplier(supplier: schemas.SupplierCreate, db: Session = Depends(get_db)):
-    new_id = f"NCC{uuid.uuid4().hex[:8].upper()}"
+async def create_supplier(supplier: schemas.SupplierCreate, db: AsyncSession = Depends(get_db)):
+    new_id = ids.new_id("NCC")
     db_supplier = models.Supplier(**supplier.dict(), id=new_id)
     db.add(db_supplier)
-    db.commit()
-    db.refresh(db_supplier)
+    await db.commit()
+    await db.refresh(db_supplier)
     return db_supplier
 
 @app.put("/suppliers/{supplier_id}", response_model=schemas.Supplier)
-async def update_supplier(supplier_id: str, supplier: schemas.SupplierCreate, db: Session = Depends(get_db)):
-    db_supplier = db.query(models.Supplier).filter(models.Supplier.id == supplier_id).first()
+async def update_supplier(supplier_id: str, supplier: schemas.SupplierCreate, db: AsyncSession = Depends(get_db)):
+    db_supplier = await db.get(models.Supplier, supplier_id)
     if db_supplier is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Supplier not found")
     
     for key, value in supplier.dict(exclude_unset=True).items():
         setattr(db_supplier, key, value)
     
-    db.commit()
-    db.refresh(db_supplier)
+    await db.commit()
+    await db.refresh(db_supplier)
     return db_supplier
 
 @app.delete("/suppliers/{supplier_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_supplier(supplier_id: str, db: Session = Depends(get_db)):
-    db_supplier = db.query(models.Supplier).filter(models.Supplier.id == supplier_id).first()
+async def delete_supplier(supplier_id: str, db: AsyncSession = Depends(get_db)):
+    db_supplier = await db.get(models.Supplier, supplier_id)
     if db_supplier is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Supplier not found")
     
-    db.delete(db_supplier)
-    db.commit()
+    await db.delete(db_supplier)
+    await db.commit()
     return
 
 # Customers
-@app.get("/customers", response_model=List[schemas.Customer])
-async def get_customers(db: Session = Depends(get_db), search: Optional[str] = Query(None, description="Search term for customer name, ID, or phone")):
-    query = db.query(models.Customer)
+@app.get("/customers", response_model=List[schemas.Customer], dependencies=[Depends(versions.conditional_get("customers"))])
+async def get_customers(
+    response: Response,
+    db: AsyncSession = Depends(get_db),
+    search: Optional[str] = Query(None, description="Search term for customer name, ID, or phone"),
+    limit: Optional[int] = Query(None, ge=1, le=pagination.MAX_LIMIT, description="Số dòng tối đa mỗi trang (bỏ trống để lấy tất cả)"),
+    cursor: Optional[str] = Query(None, description="Cursor trang kế tiếp, lấy từ header X-Next-Cursor của trang trước"),
+    fields: Optional[str] = Query(None, description="Chỉ trả về các trường này (phân cách bởi dấu phẩy), ví dụ id,name")
+):
+    names = fieldsets.parse(fields, schemas.Customer)
     if search:
-        search_lower = f"%{search.lower()}%"
-        query = query.filter(
-            (func.lower(models.Customer.name).like(search_lower)) |
-            (func.lower(models.Customer.id).like(search_lower)) |
-            (func.lower(models.Customer.phone).like(search_lower))
-        )
-    return query.all()
+        # Kết quả tìm kiếm được xếp hạng theo độ liên quan (tối đa limit dòng), không phân trang bằng cursor
+        matched_ids = await db.run_sync(search_index.search_ids, "customers", search, limit or search_index.DEFAULT_LIMIT)
+        if names:
+            return await _sparse_list(db, response, models.Customer, schemas.Customer, names, [models.Customer.id], matched_ids=matched_ids)
+        return await db.run_sync(search_index.load_ranked, models.Customer, matched_ids)
+    keys = [models.Customer.id]
+    if names:
+        return await _sparse_list(db, response, models.Customer, schemas.Customer, names, keys, limit, cursor)
+    query = pagination.paginate(select(models.Customer), keys, limit, cursor)
+    return pagination.page_results((await db.execute(query)).scalars().all(), keys, limit, response)
 
 @app.post("/customers", response_model=schemas.Customer, status_code=status.HTTP_201_CREATED)
-async def create_customer(customer: schemas.CustomerCreate, db: Session = Depends(get_db)):
-    new_id = f"KH{uuid.uuid4().hex[:8].upper()}"
+async def create_customer(customer: schemas.CustomerCreate, db: AsyncSession = Depends(get_db)):
+    new_id = ids.new_id("KH")
     db_customer = models.Customer(**customer.dict(), id=new_id)
     db.add(db_customer)
-    db.commit()
-    db.refresh(db_customer)
+    await db.commit()
+    await db.refresh(db_customer)
     return db_customer
 
-@app.get("/customers/{customer_id}/orders", response_model=List[schemas.OrderForCustomer])
-async def get_customer_orders(customer_id: str, db: Session = Depends(get_db)):
-    customer = db.query(models.Customer).filter(models.Customer.id == customer_id).first()
+@app.get(
+    "/customers/{customer_id}/orders",
+    response_model=List[schemas.OrderForCustomer],
+    response_model_exclude_unset=True,
+    dependencies=[Depends(versions.conditional_get("customers", "transactions", "products", "employees", "archived_customer_months"))]
+)
+async def get_customer_orders(
+    customer_id: str,
+    response: Response,
+    db: AsyncSession = Depends(get_db),
+    expand: Optional[str] = Query(None, description="Thêm tên: product, employee (phân cách bởi dấu phẩy)"),
+    fields: Optional[str] = Query(None, description="Chỉ trả về các trường này (phân cách bởi dấu phẩy), ví dụ id,totalAmount")
+):
+    expand = _parse_expand(expand, ["product", "employee"])
+    names = fieldsets.parse(fields, schemas.OrderForCustomer)
+    if names:
+        expand = [value for value in ["product", "employee"] if value in expand or f"{value}_name" in names]
+        names = [name for name in schemas.OrderForCustomer.model_fields if name in names or name[:-len("_name")] in expand]
+    customer = await cache.get(db, models.Customer, customer_id)
     if not customer:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Customer not found")
     
-    orders = db.query(models.Transaction).filter(
-        models.Transaction.customer_id == customer_id,
-        models.Transaction.type == 'export'
-    ).all()
+    # Chỉ nạp các cột cần cho đơn hàng; tên sản phẩm/nhân viên lấy bằng LEFT JOIN trong cùng câu lệnh
+    tx = models.Transaction
+    if names:
+        # Thành tiền tính ngay trong câu SELECT để không phải nạp quantity/price khi không được yêu cầu
+        stmt = select(*fieldsets.columns(tx, names, [tx.id]))
+        if "totalAmount" in names:
+            stmt = stmt.add_columns((tx.quantity * tx.price).label("totalAmount"))
+    else:
+        stmt = select(tx.id, tx.product_id, tx.employee_id, tx.quantity, tx.price, tx.date)
+    if "product" in expand:
+        stmt = stmt.add_columns(models.Product.name.label("product_name")).outerjoin(models.Product, models.Product.id == tx.product_id)
+    if "employee" in expand:
+        stmt = stmt.add_columns(models.Employee.name.label("employee_name")).outerjoin(models.Employee, models.Employee.id == tx.employee_id)
+    orders = (await db.execute(stmt.where(tx.customer_id == customer_id, tx.type == 'export'))).all()
+    # Đơn hàng ở các tháng đã lưu trữ (archive.py): chỉ đọc file của các tháng có đơn của khách hàng này
+    entries = await archive.customer_months(db, customer_id)
+    if entries:
+        columns = ["id", "product_id", "employee_id", "quantity", "price", "date"]
+        reader = archive.get_reader()
+        archived = [
+            SimpleNamespace(**dict(zip(columns, values)))
+            for entry in entries
+            for values in await run_in_threadpool(reader.select, entry, columns, type="export", customer_id=customer_id)
+        ]
+        for order in archived:
+            order.totalAmount = order.quantity * order.price
+        if expand:
+            await _attach_names(db, archived, expand)
+        orders = sorted([*orders, *archived], key=lambda order: order.id)
+    if names:
+        return fieldsets.respond(orders, names, schemas.OrderForCustomer, response)
 
     return [
         schemas.OrderForCustomer(
@@ -471,243 +1078,432 @@ async def get_customer_orders(customer_id: str, db: Session = Depends(get_db)):
             product_id=order.product_id,
             quantity=order.quantity,
             totalAmount=order.quantity * order.price,
-            date=order.date
+            date=order.date,
+            **{f"{name}_name": getattr(order, f"{name}_name") for name in expand}
         )
         for order in orders
     ]
 
 # Warehouses
-@app.get("/warehouses", response_model=List[schemas.Warehouse])
-async def get_warehouses(db: Session = Depends(get_db), search: Optional[str] = Query(None, description="Search term for warehouse name, ID, or location")):
-    query = db.query(models.Warehouse)
+@app.get("/warehouses", response_model=List[schemas.Warehouse], dependencies=[Depends(versions.conditional_get("warehouses"))])
+async def get_warehouses(
+    response: Response,
+    db: AsyncSession = Depends(get_db),
+    search: Optional[str] = Query(None, description="Search term for warehouse name, ID, or location"),
+    limit: Optional[int] = Query(None, ge=1, le=pagination.MAX_LIMIT, description="Số dòng tối đa mỗi trang (bỏ trống để lấy tất cả)"),
+    cursor: Optional[str] = Query(None, description="Cursor trang kế tiếp, lấy từ header X-Next-Cursor của trang trước"),
+    fields: Optional[str] = Query(None, description="Chỉ trả về các trường này (phân cách bởi dấu phẩy), ví dụ id,name")
+):
+    names = fieldsets.parse(fields, schemas.Warehouse)
     if search:
-        search_lower = f"%{search.lower()}%"
-        query = query.filter(
-            (func.lower(models.Warehouse.name).like(search_lower)) |
-            (func.lower(models.Warehouse.id).like(search_lower)) |
-            (func.lower(models.Warehouse.location).like(search_lower))
-        )
-    return query.all()
+        # Kết quả tìm kiếm được xếp hạng theo độ liên quan (tối đa limit dòng), không phân trang bằng cursor
+        matched_ids = await db.run_sync(search_index.search_ids, "warehouses", search, limit or search_index.DEFAULT_LIMIT)
+        if names:
+            return await _sparse_list(db, response, models.Warehouse, schemas.Warehouse, names, [models.Warehouse.id], matched_ids=matched_ids)
+        return await db.run_sync(search_index.load_ranked, models.Warehouse, matched_ids)
+    keys = [models.Warehouse.id]
+    if names:
+        return await _sparse_list(db, response, models.Warehouse, schemas.Warehouse, names, keys, limit, cursor)
+    query = pagination.paginate(select(models.Warehouse), keys, limit, cursor)
+    return pagination.page_results((await db.execute(query)).scalars().all(), keys, limit, response)
 
 @app.post("/warehouses", response_model=schemas.Warehouse, status_code=status.HTTP_201_CREATED)
-async def create_warehouse(warehouse: schemas.WarehouseCreate, db: Session = Depends(get_db)):
-    new_id = f"WH{uuid.uuid4().hex[:8].upper()}"
+async def create_warehouse(warehouse: schemas.WarehouseCreate, db: AsyncSession = Depends(get_db)):
+    new_id = ids.new_id("WH")
     db_warehouse = models.Warehouse(**warehouse.dict(), id=new_id)
     db.add(db_warehouse)
-    db.commit()
-    db.refresh(db_warehouse)
+    db.add(models.WarehouseUsage(warehouse_id=new_id, used=0))
+    await db.commit()
+    await db.refresh(db_warehouse)
     return db_warehouse
 
 @app.put("/warehouses/{warehouse_id}", response_model=schemas.Warehouse)
-async def update_warehouse(warehouse_id: str, warehouse: schemas.WarehouseCreate, db: Session = Depends(get_db)):
-    db_warehouse = db.query(models.Warehouse).filter(models.Warehouse.id == warehouse_id).first()
+async def update_warehouse(warehouse_id: str, warehouse: schemas.WarehouseCreate, db: AsyncSession = Depends(get_db)):
+    db_warehouse = await db.get(models.Warehouse, warehouse_id)
     if db_warehouse is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Warehouse not found")
     
+    if warehouse.capacity is not None:
+        used = (await db.execute(
+            select(models.WarehouseUsage.used).where(models.WarehouseUsage.warehouse_id == warehouse_id)
+        )).scalar() or 0
+        if warehouse.capacity < used:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Capacity is below current warehouse usage")
     for key, value in warehouse.dict(exclude_unset=True).items():
         setattr(db_warehouse, key, value)
     
-    db.commit()
-    db.refresh(db_warehouse)
+    await db.commit()
+    await db.refresh(db_warehouse)
     return db_warehouse
 
 @app.delete("/warehouses/{warehouse_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_warehouse(warehouse_id: str, db: Session = Depends(get_db)):
-    db_warehouse = db.query(models.Warehouse).filter(models.Warehouse.id == warehouse_id).first()
+async def delete_warehouse(warehouse_id: str, db: AsyncSession = Depends(get_db)):
+    db_warehouse = await db.get(models.Warehouse, warehouse_id)
     if db_warehouse is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Warehouse not found")
     
-    db.delete(db_warehouse)
-    db.commit()
+    await db.execute(delete(models.WarehouseUsage).where(models.WarehouseUsage.warehouse_id == warehouse_id))
+    await db.delete(db_warehouse)
+    await db.commit()
     return
 
+@app.get("/warehouses/{warehouse_id}/utilization", response_model=schemas.WarehouseUtilization, dependencies=[Depends(versions.conditional_get("warehouse_usage", "warehouses"))])
+async def get_warehouse_utilization(warehouse_id: str, db: AsyncSession = Depends(get_db)):
+    # Đọc dòng tổng hợp warehouse_usage (được cập nhật cùng mọi thay đổi tồn kho theo kho), không cộng bảng inventory
+    warehouse = await cache.get(db, models.Warehouse, warehouse_id)
+    if warehouse is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Warehouse not found")
+    used = (await db.execute(
+        select(models.WarehouseUsage.used).where(models.WarehouseUsage.warehouse_id == warehouse_id)
+    )).scalar() or 0
+    capacity = warehouse["capacity"]
+    return schemas.WarehouseUtilization(
+        warehouse_id=warehouse_id,
+        capacity=capacity,
+        used=used,
+        available=capacity - used if capacity is not None else None,
+        utilization=used / capacity if capacity else None,
+    )
+
 # Inventory
-@app.get("/inventory", response_model=List[schemas.Inventory])
-async def get_inventory(db: Session = Depends(get_db)):
-    return db.query(models.Inventory).all()
+@app.get("/inventory", response_model=List[schemas.Inventory], dependencies=[Depends(versions.conditional_get("inventory"))])
+async def get_inventory(
+    response: Response,
+    db: AsyncSession = Depends(get_db),
+    limit: Optional[int] = Query(None, ge=1, le=pagination.MAX_LIMIT, description="Số dòng tối đa mỗi trang (bỏ trống để lấy tất cả)"),
+    cursor: Optional[str] = Query(None, description="Cursor trang kế tiếp, lấy từ header X-Next-Cursor của trang trước"),
+    fields: Optional[str] = Query(None, description="Chỉ trả về các trường này (phân cách bởi dấu phẩy), ví dụ id,name")
+):
+    # Khóa chính kép nên cursor gồm cả (product_id, warehouse_id)
+    keys = [models.Inventory.product_id, models.Inventory.warehouse_id]
+    names = fieldsets.parse(fields, schemas.Inventory)
+    if names:
+        return await _sparse_list(db, response, models.Inventory, schemas.Inventory, names, keys, limit, cursor)
+    query = pagination.paginate(select(models.Inventory), keys, limit, cursor)
+    return pagination.page_results((await db.execute(query)).scalars().all(), keys, limit, response)
+
+async def _change_inventory_by_hand(db: AsyncSession, product_id: str, warehouse_id: str, delta: int) -> None:
+    """
+    Sửa tồn kho theo kho bằng tay: mức sử dụng kho, tồn kho tổng của sản phẩm và giá trị tồn kho đổi cùng
+    một lượng trong cùng giao dịch DB, để tổng các dòng inventory vẫn khớp với products.stock.
+    """
+    if not delta:
+        return
+    warehouse = await cache.get(db, models.Warehouse, warehouse_id)
+    if not await _change_warehouse_usage(db, warehouse_id, delta, warehouse["capacity"] if warehouse else None):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Warehouse capacity exceeded")
+    if not await _change_stock(db, product_id, delta, require_stock=True):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Not enough stock for this product")
+    await db.run_sync(stats.stock_changed, (await cache.get(db, models.Product, product_id))["price"], delta)
+    await db.run_sync(stock_history.record_adjustment, product_id, warehouse_id, delta)
 
 @app.post("/inventory", response_model=schemas.Inventory, status_code=status.HTTP_201_CREATED)
-async def create_inventory(inventory: schemas.InventoryCreate, db: Session = Depends(get_db)):
+async def create_inventory(inventory: schemas.InventoryCreate, db: AsyncSession = Depends(get_db)):
+    if await cache.get(db, models.Product, inventory.product_id) is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Product not found")
+    if await cache.get(db, models.Warehouse, inventory.warehouse_id) is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Warehouse not found")
+    if await db.get(models.Inventory, {"product_id": inventory.product_id, "warehouse_id": inventory.warehouse_id}) is not None:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Inventory item already exists")
     db_inventory = models.Inventory(
         product_id=inventory.product_id, # Corrected: product_id
         warehouse_id=inventory.warehouse_id, # Corrected: warehouse_id
         stock=inventory.stock
     )
     db.add(db_inventory)
-    db.commit()
-    db.refresh(db_inventory)
+    try:
+        # Flush trước: request đồng thời tạo cùng dòng thì thất bại ở đây, trước khi đổi các số liệu khác
+        await db.flush()
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Inventory item already exists")
+    await _change_inventory_by_hand(db, inventory.product_id, inventory.warehouse_id, inventory.stock or 0)
+    await db.commit()
+    await db.refresh(db_inventory)
     return db_inventory
 
 @app.put("/inventory/{product_id}/{warehouse_id}", response_model=schemas.Inventory)
-async def update_inventory(product_id: str, warehouse_id: str, inventory: schemas.InventoryUpdate, db: Session = Depends(get_db)):
-    db_inventory = db.query(models.Inventory).filter(
-        models.Inventory.product_id == product_id,
-        models.Inventory.warehouse_id == warehouse_id
-    ).first()
+async def update_inventory(product_id: str, warehouse_id: str, inventory: schemas.InventoryUpdate, db: AsyncSession = Depends(get_db)):
+    db_inventory = await db.get(models.Inventory, {"product_id": product_id, "warehouse_id": warehouse_id})
     if db_inventory is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Inventory item not found")
     
+    delta = (inventory.stock or 0) - (db_inventory.stock or 0) if inventory.stock is not None else 0
+    await _change_inventory_by_hand(db, product_id, warehouse_id, delta)
     update_data = inventory.dict(exclude_unset=True)
     for key, value in update_data.items():
         setattr(db_inventory, key, value)
     
     db.add(db_inventory)
-    db.commit()
-    db.refresh(db_inventory)
+    await db.commit()
+    await db.refresh(db_inventory)
     return db_inventory
 
 @app.delete("/inventory/{product_id}/{warehouse_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_inventory(product_id: str, warehouse_id: str, db: Session = Depends(get_db)):
-    db_inventory = db.query(models.Inventory).filter(
-        models.Inventory.product_id == product_id,
-        models.Inventory.warehouse_id == warehouse_id
-    ).first()
+async def delete_inventory(product_id: str, warehouse_id: str, db: AsyncSession = Depends(get_db)):
+    db_inventory = await db.get(models.Inventory, {"product_id": product_id, "warehouse_id": warehouse_id})
     if db_inventory is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Inventory item not found")
     
-    db.delete(db_inventory)
-    db.commit()
+    await _change_inventory_by_hand(db, product_id, warehouse_id, -(db_inventory.stock or 0))
+    await db.delete(db_inventory)
+    await db.commit()
     return
 
 # Departments
-@app.get("/departments", response_model=List[schemas.Department])
-async def get_departments(db: Session = Depends(get_db), search: Optional[str] = Query(None, description="Search term for department name, ID, or phone")):
-    query = db.query(models.Department)
+@app.get("/departments", response_model=List[schemas.Department], dependencies=[Depends(versions.conditional_get("departments"))])
+async def get_departments(
+    response: Response,
+    db: AsyncSession = Depends(get_db),
+    search: Optional[str] = Query(None, description="Search term for department name, ID, or phone"),
+    limit: Optional[int] = Query(None, ge=1, le=pagination.MAX_LIMIT, description="Số dòng tối đa mỗi trang (bỏ trống để lấy tất cả)"),
+    cursor: Optional[str] = Query(None, description="Cursor trang kế tiếp, lấy từ header X-Next-Cursor của trang trước"),
+    fields: Optional[str] = Query(None, description="Chỉ trả về các trường này (phân cách bởi dấu phẩy), ví dụ id,name")
+):
+    names = fieldsets.parse(fields, schemas.Department)
     if search:
-        search_lower = f"%{search.lower()}%"
-        query = query.filter(
-            (func.lower(models.Department.name).like(search_lower)) |
-            (func.lower(models.Department.id).like(search_lower)) |
-            (func.lower(models.Department.phone).like(search_lower))
-        )
-    return query.all()
+        # Kết quả tìm kiếm được xếp hạng theo độ liên quan (tối đa limit dòng), không phân trang bằng cursor
+        matched_ids = await db.run_sync(search_index.search_ids, "departments", search, limit or search_index.DEFAULT_LIMIT)
+        if names:
+            return await _sparse_list(db, response, models.Department, schemas.Department, names, [models.Department.id], matched_ids=matched_ids)
+        return await db.run_sync(search_index.load_ranked, models.Department, matched_ids)
+    keys = [models.Department.id]
+    if names:
+        return await _sparse_list(db, response, models.Department, schemas.Department, names, keys, limit, cursor)
+    query = pagination.paginate(select(models.Department), keys, limit, cursor)
+    return pagination.page_results((await db.execute(query)).scalars().all(), keys, limit, response)
 
 @app.post("/departments", response_model=schemas.Department, status_code=status.HTTP_201_CREATED)
-async def create_department(department: schemas.DepartmentCreate, db: Session = Depends(get_db)):
-    new_id = f"BP{uuid.uuid4().hex[:8].upper()}"
+async def create_department(department: schemas.DepartmentCreate, db: AsyncSession = Depends(get_db)):
+    new_id = ids.new_id("BP")
     db_department = models.Department(**department.dict(), id=new_id)
     db.add(db_department)
-    db.commit()
-    db.refresh(db_department)
+    await db.commit()
+    await db.refresh(db_department)
     return db_department
 
 @app.put("/departments/{department_id}", response_model=schemas.Department)
-async def update_department(department_id: str, department: schemas.DepartmentCreate, db: Session = Depends(get_db)):
-    db_department = db.query(models.Department).filter(models.Department.id == department_id).first()
+async def update_department(department_id: str, department: schemas.DepartmentCreate, db: AsyncSession = Depends(get_db)):
+    db_department = await db.get(models.Department, department_id)
     if db_department is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Department not found")
     
     for key, value in department.dict(exclude_unset=True).items():
         setattr(db_department, key, value)
     
-    db.commit()
-    db.refresh(db_department)
+    await db.commit()
+    await db.refresh(db_department)
     return db_department
 
 @app.delete("/departments/{department_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_department(department_id: str, db: Session = Depends(get_db)):
-    db_department = db.query(models.Department).filter(models.Department.id == department_id).first()
+async def delete_department(department_id: str, db: AsyncSession = Depends(get_db)):
+    db_department = await db.get(models.Department, department_id)
     if db_department is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Department not found")
     
-    db.delete(db_department)
-    db.commit()
+    await db.delete(db_department)
+    await db.commit()
     return
 
+# Internal
+@app.get("/internal/pool", response_model=Dict[str, Any])
+async def get_pool_status():
+    # Số kết nối đang dùng/rảnh/vượt mức và thời gian chờ lấy kết nối của worker xử lý request này
+    # (mỗi worker uvicorn có pool riêng), dùng để chọn DB_POOL_SIZE/DB_MAX_OVERFLOW theo số liệu thực tế
+    return database.pool_status()
+
+@app.get("/internal/cache", response_model=Dict[str, Any])
+async def get_cache_status():
+    # Số lần trúng/trượt/bị đẩy ra của cache dòng theo khóa chính (cache.py) trong worker này
+    return cache.get_cache().status()
+
+@app.get("/internal/archive", response_model=List[Dict[str, Any]])
+async def get_archive_manifest(db: AsyncSession = Depends(get_db)):
+    # Danh mục các tháng giao dịch đã chuyển sang file lưu trữ (archive.py)
+    return [dict(entry._mapping) for entry in await archive.months(db)]
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    # Định dạng Prometheus: histogram theo route từ metrics.py và trạng thái pool kết nối của worker này
+    gauges, counters = {}, {}
+    for engine_name, pool in database.pool_status().items():
+        if engine_name == "settings":
+            continue
+        labels = (("engine", engine_name),)
+        for field in ("checked_out", "idle", "overflow"):
+            gauges.setdefault(f"wms_db_pool_{field}", {})[labels] = pool[field]
+        gauges.setdefault("wms_db_pool_size", {})[labels] = pool["pool_size"]
+        counters.setdefault("wms_db_pool_checkouts_total", {})[labels] = pool["checkouts"]
+        counters.setdefault("wms_db_pool_timeouts_total", {})[labels] = pool["timeouts"]
+        counters.setdefault("wms_db_pool_checkout_wait_seconds_total", {})[labels] = pool["wait_total_ms"] / 1000
+    for table, entity_stats in cache.get_cache().status().items():
+        labels = (("table", table),)
+        gauges.setdefault("wms_entity_cache_entries", {})[labels] = entity_stats["size"]
+        for field in ("hits", "misses", "evictions", "stale"):
+            counters.setdefault(f"wms_entity_cache_{field}_total", {})[labels] = entity_stats[field]
+    return PlainTextResponse(metrics.render(gauges, counters), media_type="text/plain; version=0.0.4")
+
+# Tồn kho tại một ngày (stock_history.py): ảnh chụp gần nhất + các phiếu từ ngày chụp tới ngày cần xem
+STOCK_HISTORY_TABLES = ("stock_snapshots", "stock_snapshot_days", "stock_adjustments", "transactions", "products", "inventory", "archived_months")
+
+@app.get("/products/{product_id}/stock", response_model=schemas.StockAsOf, dependencies=[Depends(versions.conditional_get(*STOCK_HISTORY_TABLES))])
+async def get_product_stock_as_of(
+    product_id: str,
+    db: AsyncSession = Depends(get_db),
+    as_of: Optional[datetime.date] = Query(None, description="Tồn kho vào cuối ngày này (mặc định hôm nay)"),
+    warehouse_id: Optional[str] = Query(None, description="Tồn kho tại một kho (bỏ trống: tồn kho tổng của sản phẩm)")
+):
+    if await cache.get(db, models.Product, product_id) is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Product not found")
+    # Khoảng ngày thuộc tháng đã lưu trữ được đọc (giải nén) từ file: không chạy trên event loop
+    return await _in_threadpool(stock_history.stock_as_of, product_id, as_of or datetime.date.today(), warehouse_id)
+
+@app.get("/inventory-report/as-of", response_model=List[schemas.StockAsOf], dependencies=[Depends(versions.conditional_get(*STOCK_HISTORY_TABLES))])
+async def get_inventory_report_as_of(
+    as_of: datetime.date = Query(..., description="Tồn kho vào cuối ngày này"),
+    warehouse_id: Optional[str] = Query(None, description="Chỉ lấy tồn kho của một kho cụ thể"),
+    by_warehouse: bool = Query(False, description="Tồn kho theo từng (sản phẩm, kho) thay vì tồn kho tổng của sản phẩm")
+):
+    return await _in_threadpool(stock_history.report_as_of, as_of, warehouse_id, by_warehouse)
+
+@app.post("/stock-snapshots", response_model=Dict[str, Any], status_code=status.HTTP_201_CREATED)
+async def take_stock_snapshot(
+    day: Optional[datetime.date] = Query(None, description="Ngày chụp (mặc định hôm qua)")
+):
+    # Bình thường chạy nền mỗi STOCK_SNAPSHOT_DAYS ngày; 0 dòng nếu ngày này đã được chụp
+    return {"rows": await _in_threadpool(stock_history.take_snapshot, day)}
+
 # Reports and Dashboard Stats
-@app.get("/inventory-report", response_model=List[Dict[str, Any]])
-async def get_inventory_report(db: Session = Depends(get_db)):
-    products = db.query(models.Product).all()
-    
-    report_data = []
-    for product in products:
-        imports = db.query(func.sum(models.Transaction.quantity)).filter(
-            models.Transaction.product_id == product.id,
-            models.Transaction.type == 'import'
-        ).scalar() or 0
-
-        exports = db.query(func.sum(models.Transaction.quantity)).filter(
-            models.Transaction.product_id == product.id,
-            models.Transaction.type == 'export'
-        ).scalar() or 0
-        
-        report_data.append({
-            "warehouse_id": "WH001", # Giả lập 1 kho
-            "product_id": product.id,
-            "product_name": product.name,
-            "current_stock": product.stock,
-            "total_imports": imports,
-            "total_exports": exports,
-        })
-    return report_data
-
-@app.get("/revenue-report", response_model=List[Dict[str, Any]])
-async def get_revenue_report(db: Session = Depends(get_db)):
-    revenue_by_month = db.query(
-        func.DATE_FORMAT(models.Transaction.date, '%Y-%m').label("month"),
-        func.sum(models.Transaction.quantity * models.Transaction.price).label("total_revenue")
-    ).filter(
-        models.Transaction.type == 'export'
-    ).group_by(
-        func.DATE_FORMAT(models.Transaction.date, '%Y-%m')
-    ).order_by("month").all()
-    
-    return [{"month": r.month, "total_revenue": r.total_revenue} for r in revenue_by_month]
+@app.get("/inventory-report", response_model=List[Dict[str, Any]], dependencies=[Depends(versions.conditional_get("products", "inventory", "transactions", "archived_product_totals", "archived_warehouse_totals"))])
+async def get_inventory_report(
+    db: AsyncSession = Depends(get_db),
+    warehouse_id: Optional[str] = Query(None, description="Chỉ lấy tồn kho của một kho cụ thể"),
+    category: Optional[str] = Query(None, description="Chỉ lấy sản phẩm thuộc loại này")
+):
+    # Tổng nhập/xuất được tính bằng truy vấn gom nhóm trên bảng transactions (theo sản phẩm và theo
+    # (sản phẩm, kho)), thay vì 2 truy vấn SUM cho từng dòng (2N+1 lượt truy vấn), cộng với tổng đã lưu của
+    # các tháng đã lưu trữ (không đọc file lưu trữ).
+    totals = archive.product_totals()
+    warehouse_totals = archive.warehouse_totals()
 
-@app.get("/dashboard-stats", response_model=Dict[str, Any])
-async def get_dashboard_stats(db: Session = Depends(get_db)):
-    total_products = db.query(models.Product).count()
-    
-    total_inventory_value_result = db.query(func.sum(models.Product.price * models.Product.stock)).scalar()
-    total_inventory_value = total_inventory_value_result if total_inventory_value_result is not None else 0.0
+    # Mỗi dòng báo cáo là một cặp (sản phẩm, kho) lấy từ bảng inventory, với tổng nhập/xuất của các phiếu
+    # tại kho đó. Sản phẩm chưa được xếp vào kho nào vẫn xuất hiện với warehouse_id = None, tồn kho tổng
+    # và tổng nhập/xuất của sản phẩm.
+    query = select(
+        models.Inventory.warehouse_id,
+        models.Product.id.label("product_id"),
+        models.Product.name.label("product_name"),
+        models.Product.stock.label("product_stock"),
+        models.Inventory.stock.label("warehouse_stock"),
+        func.coalesce(case(
+            (models.Inventory.warehouse_id.is_(None), totals.c.total_imports), else_=warehouse_totals.c.total_imports
+        ), 0).label("total_imports"),
+        func.coalesce(case(
+            (models.Inventory.warehouse_id.is_(None), totals.c.total_exports), else_=warehouse_totals.c.total_exports
+        ), 0).label("total_exports")
+    ).select_from(models.Product).outerjoin(
+        models.Inventory, models.Inventory.product_id == models.Product.id
+    ).outerjoin(
+        totals, totals.c.product_id == models.Product.id
+    ).outerjoin(
+        warehouse_totals, and_(
+            warehouse_totals.c.product_id == models.Inventory.product_id,
+            warehouse_totals.c.warehouse_id == models.Inventory.warehouse_id
+        )
+    )
+    if warehouse_id:
+        query = query.where(models.Inventory.warehouse_id == warehouse_id)
+    if category:
+        query = query.where(models.Product.category == category)
 
-    current_month = datetime.datetime.now().month
-    current_year = datetime.datetime.now().year
+    rows = (await db.execute(query.order_by(models.Product.id, models.Inventory.warehouse_id))).all()
 
-    new_orders = db.query(models.Transaction).filter(
-        models.Transaction.type == 'export',
-        extract('month', models.Transaction.date) == current_month,
-        extract('year', models.Transaction.date) == current_year
-    ).count()
-    
-    today = datetime.date.today()
-    first_day_of_current_month = today.replace(day=1)
-    last_day_of_last_month = first_day_of_current_month - datetime.timedelta(days=1)
-    last_month = last_day_of_last_month.month
-    last_month_year = last_day_of_last_month.year
-
-    total_revenue_last_month_result = db.query(
-        func.sum(models.Transaction.quantity * models.Transaction.price)
-    ).filter(
-        models.Transaction.type == 'export',
-        extract('month', models.Transaction.date) == last_month,
-        extract('year', models.Transaction.date) == last_month_year
-    ).scalar()
-
-    total_revenue_last_month = total_revenue_last_month_result if total_revenue_last_month_result is not None else 0.0
-    
-    pending_transactions = db.query(models.Transaction).count()
-
-    top_selling_product_result = db.query(
-        models.Product.name,
-        func.sum(models.Transaction.quantity).label("total_exported")
-    ).join(
-        models.Transaction, models.Product.id == models.Transaction.product_id
-    ).filter(
-        models.Transaction.type == 'export'
-    ).group_by(
-        models.Product.name
-    ).order_by(
-        func.sum(models.Transaction.quantity).desc()
-    ).first()
-            
-    top_selling_product_name = top_selling_product_result.name if top_selling_product_result else "N/A"
-
-    return {
-        "totalProducts": total_products,
-        "newOrders": new_orders,
-        "totalInventoryValue": total_inventory_value,
-        "totalRevenueLastMonth": total_revenue_last_month,
-        "pendingTransactions": pending_transactions,
-        "topSellingProduct": top_selling_product_name
-    }
+    return [
+        {
+            "warehouse_id": row.warehouse_id,
+            "product_id": row.product_id,
+            "product_name": row.product_name,
+            "current_stock": row.warehouse_stock if row.warehouse_id is not None else row.product_stock,
+            "product_stock": row.product_stock,
+            "total_imports": int(row.total_imports),
+            "total_exports": int(row.total_exports),
+        }
+        for row in rows
+    ]
+
+@app.get("/revenue-report", response_model=List[Dict[str, Any]], dependencies=[Depends(versions.conditional_get("revenue_monthly"))])
+async def get_revenue_report(
+    db: AsyncSession = Depends(get_db),
+    month_from: Optional[str] = Query(None, alias="from", pattern=MONTH_PATTERN, description="Từ tháng (YYYY-MM, bao gồm)"),
+    month_to: Optional[str] = Query(None, alias="to", pattern=MONTH_PATTERN, description="Đến tháng (YYYY-MM, bao gồm)")
+):
+    # Đọc từ bảng tổng hợp revenue_monthly (được cập nhật khi thêm/xóa giao dịch),
+    # không gom nhóm lại toàn bộ lịch sử giao dịch mỗi lần gọi
+    return await db.run_sync(stats.revenue_report, month_from, month_to)
+
+# "Tháng này"/"tháng trước" tính theo ngày hiện tại: ngày đổi thì ETag đổi
+@app.get(
+    "/dashboard-stats",
+    response_model=Dict[str, Any],
+    dependencies=[Depends(versions.conditional_get(
+        "stat_counters", "revenue_monthly", "product_sales", "products",
+        scope=lambda request: datetime.date.today().isoformat()
+    ))]
+)
+async def get_dashboard_stats(db: AsyncSession = Depends(get_db)):
+    # Đọc từ các bộ đếm được cập nhật cùng lúc với thao tác ghi (xem stats.py),
+    # không còn quét bảng products/transactions mỗi lần tải trang
+    return await db.run_sync(stats.dashboard)
+
+@app.get("/dashboard-stats/drift", response_model=Dict[str, Any])
+async def get_dashboard_stats_drift():
+    # Tính lại toàn bộ từ bảng gốc và các file lưu trữ để kiểm tra sai lệch (tốn kém, chỉ dùng định kỳ)
+    drift = await _in_threadpool(stats.drift)
+    return {name: {"stored": have, "expected": want} for name, (have, want) in drift.items()}
+
+@app.post("/dashboard-stats/recompute", response_model=Dict[str, Any])
+async def recompute_dashboard_stats():
+    corrected = await _in_threadpool(stats.recompute)
+    return {name: {"stored": have, "expected": want} for name, (have, want) in corrected.items()}
+
+# Phân tích trên ảnh chụp dạng cột (analytics.py): gom nhóm bằng NumPy trong worker, không chạy truy vấn
+# gom nhóm trên database. Số liệu có thể trễ tối đa ANALYTICS_REFRESH_SECONDS giây so với bảng.
+async def _analytics(method: str, *args):
+    if not analytics.available():
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Analytics requires NumPy")
+    # Làm mới ảnh chụp (đọc database, ghi file) và tính toán chạy trong threadpool, không chặn event loop
+    return await run_in_threadpool(lambda: getattr(analytics.get_snapshot(), method)(*args))
+
+def _analytics_days(date_from: Optional[datetime.date], date_to: Optional[datetime.date]):
+    return (analytics.to_day(date_from) if date_from else None, analytics.to_day(date_to) if date_to else None)
+
+@app.get("/analytics/revenue", response_model=List[Dict[str, Any]])
+async def get_analytics_revenue(
+    period: Literal["day", "week", "month", "year"] = Query("month", description="Gom theo ngày, tuần (từ thứ Hai), tháng hoặc năm"),
+    date_from: Optional[datetime.date] = Query(None, description="Từ ngày (bao gồm)"),
+    date_to: Optional[datetime.date] = Query(None, description="Đến ngày (bao gồm)")
+):
+    return await _analytics("revenue", period, *_analytics_days(date_from, date_to))
+
+@app.get("/analytics/top-products", response_model=List[Dict[str, Any]])
+async def get_analytics_top_products(
+    limit: int = Query(10, ge=1, le=pagination.MAX_LIMIT),
+    date_from: Optional[datetime.date] = Query(None, description="Từ ngày (bao gồm)"),
+    date_to: Optional[datetime.date] = Query(None, description="Đến ngày (bao gồm)")
+):
+    return await _analytics("top_products", limit, *_analytics_days(date_from, date_to))
+
+@app.get("/analytics/product-totals", response_model=List[Dict[str, Any]])
+async def get_analytics_product_totals(
+    date_from: Optional[datetime.date] = Query(None, description="Từ ngày (bao gồm)"),
+    date_to: Optional[datetime.date] = Query(None, description="Đến ngày (bao gồm)")
+):
+    return await _analytics("product_report", *_analytics_days(date_from, date_to))
+
+@app.get("/analytics/inventory-value", response_model=Dict[str, Any])
+async def get_analytics_inventory_value():
+    return await _analytics("inventory_value")
+
+@app.get("/analytics/status", response_model=Dict[str, Any])
+async def get_analytics_status():
+    return await _analytics("status")
@@ -0,0 +1,225 @@
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+from sqlalchemy import event
+
+import logs
+
+# Số liệu theo route cho mỗi request: thời gian xử lý, số câu lệnh SQL, tổng thời gian chờ DB và số dòng.
+#
+# - MetricsMiddleware (ASGI) tạo bộ đếm cho request hiện tại trong một ContextVar.
+# - instrument_engine gắn before/after_cursor_execute vào engine; mỗi câu lệnh chạy trong request
+#   (kể cả qua AsyncSession và db.run_sync) được cộng vào bộ đếm đó.
+# - render() xuất histogram theo định dạng Prometheus cho GET /metrics. Số liệu là của từng worker;
+#   Prometheus lấy mẫu từng worker hoặc cộng dồn theo nhãn instance.
+# - query_budget() dùng khi kiểm thử: báo lỗi nếu một request vượt quá số câu lệnh SQL cho phép,
+#   giúp phát hiện vòng lặp N+1 (ví dụ mỗi sản phẩm một truy vấn) trước khi lên production. Ngân sách của
+#   GET /inventory-report và POST /transactions được kiểm tra trong tests/test_query_budget.py.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100, 500)
+ROW_BUCKETS = (1, 10, 100, 1000, 10000, 100000, 1000000)
+
+
+class RequestStats:
+    __slots__ = ("statements", "db_time", "rows")
+
+    def __init__(self):
+        self.statements = 0
+        self.db_time = 0.0
+        self.rows = 0
+
+
+_current: contextvars.ContextVar[Optional[RequestStats]] = contextvars.ContextVar("request_stats", default=None)
+
+
+class Histogram:
+    """Histogram tích lũy kiểu Prometheus, mỗi bộ giá trị nhãn một dãy bucket."""
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str], buckets: Sequence[float]):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label_values: Tuple[str, ...], value: float) -> None:
+        with self._lock:
+            # [count theo từng bucket..., +Inf, sum]
+            series = self._series.setdefault(label_values, [0] * (len(self.buckets) + 1) + [0.0])
+            series[bisect.bisect_left(self.buckets, value)] += 1
+            series[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {key: list(values) for key, values in self._series.items()}
+        for label_values, values in sorted(series.items()):
+            labels = _labels(zip(self.labels, label_values))
+            cumulative = 0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{labels},le="{bound:g}"}} {cumulative}')
+            cumulative += values[len(self.buckets)]
+            lines.append(f'{self.name}_bucket{{{labels},le="+Inf"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{labels}}} {values[-1]:g}")
+            lines.append(f"{self.name}_count{{{labels}}} {cumulative}")
+        return lines
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(pairs) -> str:
+    return ",".join(f'{name}="{_escape(value)}"' for name, value in pairs)
+
+
+REQUEST_LATENCY = Histogram("wms_http_request_duration_seconds", "Thời gian xử lý request", ("method", "route", "status"), LATENCY_BUCKETS)
+DB_STATEMENTS = Histogram("wms_db_statements_per_request", "Số câu lệnh SQL mỗi request", ("method", "route"), STATEMENT_BUCKETS)
+DB_TIME = Histogram("wms_db_time_per_request_seconds", "Tổng thời gian thực thi SQL mỗi request", ("method", "route"), LATENCY_BUCKETS)
+DB_ROWS = Histogram("wms_db_rows_per_request", "Số dòng trả về hoặc bị ảnh hưởng mỗi request (theo rowcount của driver)", ("method", "route"), ROW_BUCKETS)
+HISTOGRAMS = [REQUEST_LATENCY, DB_STATEMENTS, DB_TIME, DB_ROWS]
+
+
+# --- Ghi nhận câu lệnh SQL ---
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current.get()
+    if stats is None:
+        return
+    # Hook được gắn giữa chừng một câu lệnh (hoặc before/after lệch cặp): không có mốc thời gian thì bỏ qua
+    pending = conn.info.get("query_started")
+    if not pending:
+        return
+    started = pending.pop()
+    stats.statements += 1
+    stats.db_time += time.perf_counter() - started
+    # Driver MySQL báo số dòng của SELECT ngay sau khi thực thi; SQLite chỉ báo cho INSERT/UPDATE/DELETE
+    rowcount = getattr(cursor, "rowcount", -1)
+    if rowcount and rowcount > 0:
+        stats.rows += rowcount
+
+
+def _handle_error(context):
+    # Câu lệnh lỗi không đi qua after_cursor_execute: bỏ mốc thời gian của nó
+    started = context.connection.info.get("query_started") if context.connection is not None else None
+    if _current.get() is not None and started:
+        started.pop()
+
+
+def instrument_engine(engine) -> None:
+    """Gắn bộ đếm vào engine đồng bộ (với AsyncEngine truyền async_engine.sync_engine)."""
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
+
+# --- Middleware ---
+
+_budget_lock = threading.Lock()
+_active_budgets: List[List[Tuple[str, RequestStats]]] = []
+
+
+class MetricsMiddleware:
+    """Middleware ASGI (không dùng BaseHTTPMiddleware để không bọc lại response dạng stream)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = _current.set(stats)
+        log_token = logs.bind_request(scope)
+        status_code = 500
+        started = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            _current.reset(token)
+            logs.unbind_request(log_token)
+            elapsed = time.perf_counter() - started
+            # Nhãn là mẫu đường dẫn của route (/products/{product_id}), không phải đường dẫn thật,
+            # để số chuỗi thời gian không tăng theo số mã sản phẩm
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            method = scope["method"]
+            REQUEST_LATENCY.observe((method, path, str(status_code)), elapsed)
+            DB_STATEMENTS.observe((method, path), stats.statements)
+            DB_TIME.observe((method, path), stats.db_time)
+            DB_ROWS.observe((method, path), stats.rows)
+            logs.access(method, path, status_code, elapsed, stats.statements, stats.db_time)
+            if _active_budgets:
+                with _budget_lock:
+                    for captured in _active_budgets:
+                        captured.append((f"{method} {path}", stats))
+
+
+Series = Dict[Tuple[Tuple[str, str], ...], float]
+
+
+def render(gauges: Optional[Dict[str, Series]] = None, counters: Optional[Dict[str, Series]] = None) -> str:
+    """Nội dung cho GET /metrics. gauges/counters: {tên: {((nhãn, giá trị), ...): số}} được xuất thêm."""
+    lines: List[str] = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.render())
+    for kind, metrics in (("gauge", gauges or {}), ("counter", counters or {})):
+        for name, series in sorted(metrics.items()):
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in sorted(series.items()):
+                lines.append(f"{name}{{{_labels(labels)}}} {value:g}")
+    return "\n".join(lines) + "\n"
+
+
+# --- Kiểm tra ngân sách truy vấn khi kiểm thử ---
+
+@contextmanager
+def query_budget(limit: Union[int, Dict[str, int]]) -> Iterator[List[Tuple[str, RequestStats]]]:
+    """
+    Báo AssertionError nếu một request hoàn thành trong khối with dùng nhiều câu lệnh SQL hơn cho phép.
+    limit là một số áp dụng cho mọi request, hoặc {"GET /inventory-report": 2, ...} theo route
+    (route không có trong dict thì không bị giới hạn).
+
+        with metrics.query_budget({"GET /inventory-report": 1, "POST /transactions": 11}):
+            client.get("/inventory-report")
+            client.post("/transactions", json=...)
+
+    Hoạt động với TestClient (app chạy ở luồng khác) và httpx.ASGITransport vì các request được thu thập
+    ở mức module.
+    """
+    captured: List[Tuple[str, RequestStats]] = []
+    with _budget_lock:
+        _active_budgets.append(captured)
+    try:
+        yield captured
+    finally:
+        with _budget_lock:
+            _active_budgets.remove(captured)
+    over = []
+    for route, stats in captured:
+        allowed = limit if isinstance(limit, int) else limit.get(route)
+        if allowed is not None and stats.statements > allowed:
+            over.append(f"{route}: {stats.statements} câu lệnh SQL (cho phép {allowed})")
+    if over:
+        raise AssertionError("Vượt ngân sách truy vấn:\n" + "\n".join(over))
@@ -0,0 +1,94 @@
+import sys
+from typing import List
+
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import DBAPIError
+
+import logs
+import models
+
+# Nâng cấp lược đồ của database đã có dữ liệu, chạy khi khởi động sau create_all.
+#
+# create_all chỉ tạo bảng còn thiếu; cột (cho phép NULL) và index khai báo thêm trong models.py cho bảng
+# đã tồn tại phải được tạo ở đây. Mỗi bước kiểm tra trạng thái hiện tại nên chạy lại nhiều lần (hoặc nhiều worker cùng lúc)
+# không gây lỗi. Với bảng lớn nên chạy trước khi triển khai thay vì để worker đầu tiên tạo index:
+#
+#   python migrations.py
+
+logger = logs.get_logger("migrations")
+
+
+def ensure_columns(bind) -> List[str]:
+    """
+    Thêm các cột khai báo trong models.py mà bảng hiện có còn thiếu (ALTER TABLE ... ADD COLUMN, dòng cũ
+    nhận NULL). Chỉ áp dụng cho cột cho phép NULL; ràng buộc khóa ngoại của cột mới không được tạo.
+    Trả về tên các cột đã thêm (bảng.cột).
+    """
+    inspector = inspect(bind)
+    quote = bind.dialect.identifier_preparer.quote
+    added = []
+    for table in models.Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            if not column.nullable or column.primary_key:
+                logger.warning("Không tự thêm được cột bắt buộc %s.%s", table.name, column.name)
+                continue
+            ddl = f"ALTER TABLE {quote(table.name)} ADD COLUMN {quote(column.name)} {column.type.compile(dialect=bind.dialect)}"
+            try:
+                with bind.begin() as conn:
+                    conn.execute(text(ddl))
+            except DBAPIError as error:
+                # Worker khác vừa thêm cùng cột
+                logger.warning("Không thêm được cột %s.%s: %s", table.name, column.name, error.orig)
+                continue
+            added.append(f"{table.name}.{column.name}")
+    return added
+
+
+def ensure_indexes(bind) -> List[str]:
+    """Tạo các index khai báo trong models.py mà bảng hiện có còn thiếu. Trả về tên các index đã tạo."""
+    inspector = inspect(bind)
+    created = []
+    for table in models.Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        names = {index["name"] for index in inspector.get_indexes(table.name)}
+        # Index (hoặc khóa chính/ràng buộc unique) có các cột đầu trùng với index cần tạo thì đã đủ dùng,
+        # ví dụ index MySQL tự tạo cho khóa ngoại
+        existing = [tuple(index["column_names"]) for index in inspector.get_indexes(table.name)]
+        existing.append(tuple(inspector.get_pk_constraint(table.name)["constrained_columns"]))
+        existing.extend(tuple(unique["column_names"]) for unique in inspector.get_unique_constraints(table.name))
+        for index in table.indexes:
+            columns = tuple(column.name for column in index.columns)
+            if index.name in names or any(have[:len(columns)] == columns for have in existing):
+                continue
+            try:
+                index.create(bind)
+            except DBAPIError as error:
+                # Worker khác vừa tạo cùng index
+                logger.warning("Không tạo được index %s: %s", index.name, error.orig)
+                continue
+            created.append(index.name)
+    return created
+
+
+def upgrade(bind) -> None:
+    for name in ensure_columns(bind):
+        logger.info("Đã thêm cột %s", name)
+    for name in ensure_indexes(bind):
+        logger.info("Đã tạo index %s", name)
+
+
+if __name__ == "__main__":
+    # python migrations.py
+    from database import engine
+
+    logs.setup()
+    models.Base.metadata.create_all(bind=engine)
+    upgrade(engine)
+    logs.shutdown()
+    sys.exit(0)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, Date, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, Date, DateTime, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from database import Base # Import Base từ file database.py
 
@@ -123,6 +123,7 @@ class Transaction(Base):
     NgayGiaoDich: Ngày giao dịch (Date)
     MaNCC: Khóa ngoại đến NHACUNGCAP (String) - Nullable nếu là giao dịch xuất
     MaKH: Khóa ngoại đến KHACHHANG (String) - Nullable nếu là giao dịch nhập
+    MaKho: Khóa ngoại đến KHO (String) - kho nhập/xuất; Nullable với phiếu tạo trước khi phiếu gắn với kho
     """
     __tablename__ = "transactions"
     id = Column(String(255), primary_key=True, index=True) # MaPhieu - Changed to String
@@ -138,6 +139,22 @@ class Transaction(Base):
     supplier_id = Column(String(255), ForeignKey("suppliers.id"), nullable=True) # MaNCC
     # Khóa ngoại đến khách hàng (chỉ cho phiếu xuất) - Changed to String
     customer_id = Column(String(255), ForeignKey("customers.id"), nullable=True) # MaKH
+    # Kho nhập/xuất: phiếu cập nhật tồn kho của kho đó (inventory) và mức sử dụng kho (warehouse_usage)
+    warehouse_id = Column(String(255), ForeignKey("warehouses.id"), nullable=True) # MaKho
+
+    __table_args__ = (
+        # Xuất/báo cáo theo loại phiếu trong một khoảng ngày; tính lại doanh thu theo tháng
+        Index("ix_transactions_type_date", "type", "date"),
+        # Giao dịch của một sản phẩm (tìm theo tên/mã sản phẩm, tổng nhập/xuất theo sản phẩm)
+        Index("ix_transactions_product_type", "product_id", "type"),
+        # Đơn hàng (phiếu xuất) của một khách hàng
+        Index("ix_transactions_customer_type", "customer_id", "type"),
+        # Thay đổi tồn kho của một sản phẩm trong một khoảng ngày (tồn kho tại một ngày, stock_history.py)
+        Index("ix_transactions_product_date", "product_id", "date"),
+        # Tìm phiếu theo tiền tố mã nhân viên/nhà cung cấp
+        Index("ix_transactions_employee_id", "employee_id"),
+        Index("ix_transactions_supplier_id", "supplier_id"),
+    )
 
     # Relationships
     product_rel = relationship("Product", back_populates="transactions")
@@ -180,3 +197,215 @@ class Inventory(Base):
     product_rel = relationship("Product", back_populates="inventory_items")
     # Mối quan hệ N-1: Nhiều mục tồn kho thuộc về một kho
     warehouse_rel = relationship("Warehouse", back_populates="inventory_items")
+
+
+class WarehouseUsage(Base):
+    """
+    Mức sử dụng của từng kho (tổng inventory.stock của kho), được cập nhật cùng giao dịch với mọi thay đổi
+    tồn kho theo kho. Việc nhập kho cộng vào dòng này bằng một câu UPDATE có điều kiện used + SL <= sức chứa,
+    nên sức chứa được kiểm tra nguyên tử kể cả khi nhiều phiếu nhập chạy đồng thời.
+    """
+    __tablename__ = "warehouse_usage"
+    warehouse_id = Column(String(255), primary_key=True)
+    used = Column(Integer, nullable=False, default=0)
+
+
+class StockSnapshotDay(Base):
+    """
+    Danh sách các ngày đã chụp tồn kho (stock_history.py). Ngày có trong bảng này nhưng không có dòng
+    stock_snapshots cho một sản phẩm/kho nghĩa là tồn kho bằng 0 vào cuối ngày đó.
+    """
+    __tablename__ = "stock_snapshot_days"
+    day = Column(Date, primary_key=True)
+    row_count = Column(Integer, nullable=False, default=0)
+    taken_at = Column(DateTime, nullable=False)
+
+
+class StockSnapshot(Base):
+    """
+    Tồn kho vào cuối một ngày đã chụp (chỉ lưu giá trị khác 0).
+    warehouse_id: mã kho, hoặc chuỗi rỗng cho tồn kho tổng của sản phẩm (products.stock)
+    Khóa chính bắt đầu bằng day: tìm ngày chụp gần nhất và đọc toàn bộ một lần chụp đều dùng khóa chính.
+    """
+    __tablename__ = "stock_snapshots"
+    day = Column(Date, primary_key=True)
+    product_id = Column(String(255), primary_key=True)
+    warehouse_id = Column(String(255), primary_key=True)
+    stock = Column(Integer, nullable=False, default=0)
+
+
+class StockAdjustment(Base):
+    """
+    Sửa tồn kho trực tiếp, không qua phiếu (POST/PUT/DELETE /inventory, xóa sản phẩm).
+    stock_history.py cộng các dòng này như phiếu để tồn kho tại một ngày không gán thay đổi cho sai ngày.
+    warehouse_id: mã kho nếu sửa tồn kho theo kho, NULL nếu chỉ đổi tồn kho tổng của sản phẩm
+    quantity: lượng thay đổi (âm nếu giảm)
+    """
+    __tablename__ = "stock_adjustments"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    day = Column(Date, nullable=False)
+    product_id = Column(String(255), nullable=False)
+    warehouse_id = Column(String(255), nullable=True)
+    quantity = Column(Integer, nullable=False)
+    created_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        # Tồn kho tại một ngày cộng các lần sửa trong một khoảng ngày (toàn bộ hoặc của một sản phẩm)
+        Index("ix_stock_adjustments_day", "day"),
+        Index("ix_stock_adjustments_product_day", "product_id", "day"),
+    )
+
+class SearchGram(Base):
+    """
+    Bảng chỉ mục tìm kiếm n-gram (dùng chung cho các endpoint có tham số search)
+    entity: Tên bảng được đánh chỉ mục (products, suppliers, ...)
+    entity_id: Mã của dòng được đánh chỉ mục
+    gram: Chuỗi 3 ký tự đã bỏ dấu và chuyển chữ thường
+    weight: Trọng số của trường chứa gram (tên quan trọng hơn các trường phụ)
+    """
+    __tablename__ = "search_index"
+    # Khóa chính (entity, gram, entity_id) cũng là index phục vụ tra cứu theo gram
+    entity = Column(String(20), primary_key=True)
+    gram = Column(String(12), primary_key=True)
+    entity_id = Column(String(255), primary_key=True)
+    weight = Column(Integer, nullable=False, default=1)
+
+    __table_args__ = (
+        # Phục vụ xóa/cập nhật chỉ mục của một dòng
+        Index("ix_search_index_entity_id", "entity", "entity_id"),
+    )
+
+
+class StatCounter(Base):
+    """
+    Bảng bộ đếm thống kê cho trang tổng quan (cập nhật cùng giao dịch DB với thao tác ghi)
+    name: Tên bộ đếm, ví dụ "products.count" hoặc "exports.revenue:2024-05"
+    shard: Mỗi bộ đếm được chia thành nhiều dòng để các giao dịch đồng thời không tranh nhau một dòng
+    value: Giá trị của phần bộ đếm; giá trị thật là tổng của tất cả các shard
+    """
+    __tablename__ = "stat_counters"
+    name = Column(String(64), primary_key=True)
+    shard = Column(Integer, primary_key=True, default=0)
+    value = Column(Float, nullable=False, default=0.0)
+
+
+class ProductSales(Base):
+    """
+    Bảng tổng số lượng đã xuất của từng sản phẩm (dùng để tìm sản phẩm bán chạy nhất)
+    product_id: Mã sản phẩm (không đặt khóa ngoại để không cản trở việc xóa sản phẩm)
+    exported_quantity: Tổng số lượng trên các phiếu xuất
+    """
+    __tablename__ = "product_sales"
+    product_id = Column(String(255), primary_key=True)
+    exported_quantity = Column(Integer, nullable=False, default=0, index=True)
+
+
+class RevenueMonthly(Base):
+    """
+    Bảng tổng hợp doanh thu theo tháng (cập nhật khi thêm/xóa phiếu xuất)
+    month: Tháng dạng "YYYY-MM"
+    shard: Mỗi tháng được chia thành nhiều dòng để các phiếu xuất đồng thời không tranh nhau một dòng
+    revenue: Tổng quantity * price của các phiếu xuất
+    quantity: Tổng số lượng đã xuất
+    order_count: Số phiếu xuất
+    """
+    __tablename__ = "revenue_monthly"
+    month = Column(String(7), primary_key=True)
+    shard = Column(Integer, primary_key=True, default=0)
+    revenue = Column(Float, nullable=False, default=0.0)
+    quantity = Column(Integer, nullable=False, default=0)
+    order_count = Column(Integer, nullable=False, default=0)
+
+
+class EmployeeRevenue(Base):
+    """
+    Bảng doanh thu theo nhân viên và tháng (cập nhật khi thêm/xóa phiếu xuất, thay cho cộng trực tiếp vào
+    employees.revenue_contribution)
+    employee_id: Mã nhân viên (không đặt khóa ngoại, giống product_sales)
+    month: Tháng dạng "YYYY-MM"
+    shard: Mỗi (nhân viên, tháng) được chia thành nhiều dòng để các phiếu xuất đồng thời của cùng một nhân viên
+    không tranh nhau một dòng
+    revenue, quantity, order_count: Tổng quantity * price, tổng số lượng và số phiếu xuất
+    """
+    __tablename__ = "employee_revenue"
+    employee_id = Column(String(255), primary_key=True)
+    month = Column(String(7), primary_key=True)
+    shard = Column(Integer, primary_key=True, default=0)
+    revenue = Column(Float, nullable=False, default=0.0)
+    quantity = Column(Integer, nullable=False, default=0)
+    order_count = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        # Bảng xếp hạng theo khoảng tháng
+        Index("ix_employee_revenue_month", "month"),
+    )
+
+
+class ArchivedMonth(Base):
+    """
+    Bảng danh mục lưu trữ (manifest): mỗi dòng là một tháng giao dịch đã được chuyển khỏi bảng transactions
+    sang file nén dạng cột (xem archive.py)
+    month: Tháng dạng "YYYY-MM"
+    file: Tên file trong thư mục lưu trữ (ARCHIVE_DIR)
+    checksum: SHA-256 của file
+    row_count: Số giao dịch trong file
+    first_id, last_id: Mã nhỏ nhất/lớn nhất trong file (bỏ qua tháng khi phân trang theo mã)
+    import_quantity, export_quantity, revenue, order_count: Tổng hợp của tháng, dùng khi đối chiếu số liệu thống kê
+    archived_at: Thời điểm lưu trữ gần nhất
+    """
+    __tablename__ = "archived_months"
+    month = Column(String(7), primary_key=True)
+    file = Column(String(255), nullable=False)
+    checksum = Column(String(64), nullable=False)
+    row_count = Column(Integer, nullable=False, default=0)
+    first_id = Column(String(255), nullable=False)
+    last_id = Column(String(255), nullable=False)
+    import_quantity = Column(Integer, nullable=False, default=0)
+    export_quantity = Column(Integer, nullable=False, default=0)
+    revenue = Column(Float, nullable=False, default=0.0)
+    order_count = Column(Integer, nullable=False, default=0)
+    archived_at = Column(DateTime, nullable=False)
+
+
+class ArchivedProductTotal(Base):
+    """
+    Bảng tổng nhập/xuất theo sản phẩm của từng tháng đã lưu trữ (báo cáo tồn kho không phải đọc file lưu trữ)
+    month: Tháng dạng "YYYY-MM"
+    product_id: Mã sản phẩm (không đặt khóa ngoại, giống product_sales)
+    total_imports, total_exports: Tổng số lượng trên các phiếu nhập/xuất của sản phẩm trong tháng
+    """
+    __tablename__ = "archived_product_totals"
+    month = Column(String(7), primary_key=True)
+    product_id = Column(String(255), primary_key=True)
+    total_imports = Column(Integer, nullable=False, default=0)
+    total_exports = Column(Integer, nullable=False, default=0)
+
+
+class ArchivedWarehouseTotal(Base):
+    """
+    Bảng tổng nhập/xuất theo (sản phẩm, kho) của từng tháng đã lưu trữ (dòng theo kho của báo cáo tồn kho)
+    month: Tháng dạng "YYYY-MM"
+    product_id, warehouse_id: Mã sản phẩm và mã kho (không đặt khóa ngoại, giống archived_product_totals);
+        phiếu không gắn với kho chỉ được cộng vào archived_product_totals
+    total_imports, total_exports: Tổng số lượng trên các phiếu nhập/xuất của sản phẩm tại kho trong tháng
+    """
+    __tablename__ = "archived_warehouse_totals"
+    month = Column(String(7), primary_key=True)
+    product_id = Column(String(255), primary_key=True)
+    warehouse_id = Column(String(255), primary_key=True)
+    total_imports = Column(Integer, nullable=False, default=0)
+    total_exports = Column(Integer, nullable=False, default=0)
+
+
+class ArchivedCustomerMonth(Base):
+    """
+    Bảng các tháng đã lưu trữ có đơn hàng (phiếu xuất) của từng khách hàng: đơn hàng của một khách hàng
+    chỉ phải đọc file lưu trữ của các tháng này
+    month: Tháng dạng "YYYY-MM"
+    customer_id: Mã khách hàng (không đặt khóa ngoại, giống archived_product_totals)
+    order_count: Số đơn hàng của khách hàng trong tháng
+    """
+    __tablename__ = "archived_customer_months"
+    customer_id = Column(String(255), primary_key=True)
+    month = Column(String(7), primary_key=True)
+    order_count = Column(Integer, nullable=False, default=0)
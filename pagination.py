@@ -0,0 +1,66 @@
+import base64
+import binascii
+import json
+from typing import Any, List, Optional, Sequence
+
+from fastapi import HTTPException, Response, status
+from sqlalchemy import and_, or_
+
+# Phân trang keyset (cursor) dùng chung cho các endpoint danh sách.
+# Thay vì OFFSET (phải đọc bỏ qua toàn bộ các dòng phía trước), mỗi trang bắt đầu ngay sau
+# khóa sắp xếp của dòng cuối trang trước, nên chi phí một trang không phụ thuộc kích thước bảng.
+
+# Header chứa cursor của trang kế tiếp (không có header nghĩa là đã hết dữ liệu)
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+MAX_LIMIT = 1000
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    """Mã hóa giá trị khóa sắp xếp của dòng cuối trang thành chuỗi cursor không trong suốt."""
+    raw = json.dumps(list(values), separators=(",", ":"), default=str).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int) -> List[Any]:
+    """Giải mã cursor do encode_cursor tạo ra. Cursor sai định dạng trả về lỗi 400."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except (ValueError, binascii.Error, UnicodeError):
+        values = None
+    if not isinstance(values, list) or len(values) != size:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+    return values
+
+
+def keyset_condition(key_columns: Sequence[Any], values: Sequence[Any]):
+    """Điều kiện "đứng sau" (col1, col2, ...) > (v1, v2, ...) viết dạng OR/AND để dùng được index."""
+    clauses = []
+    for i, column in enumerate(key_columns):
+        equal_prefix = [key_columns[j] == values[j] for j in range(i)]
+        clauses.append(and_(*equal_prefix, column > values[i]))
+    return or_(*clauses)
+
+
+def paginate(query, key_columns: Sequence[Any], limit: Optional[int], cursor: Optional[str]):
+    """
+    Áp dụng sắp xếp ổn định theo key_columns, điều kiện cursor và giới hạn số dòng.
+    query có thể là select() (AsyncSession) hoặc db.query() (Session đồng bộ).
+    Lấy dư 1 dòng để biết còn trang sau hay không (xem page_results).
+    """
+    query = query.order_by(*key_columns)
+    if cursor:
+        query = query.filter(keyset_condition(key_columns, decode_cursor(cursor, len(key_columns))))
+    if limit is not None:
+        query = query.limit(limit + 1)
+    return query
+
+
+def page_results(rows: List[Any], key_columns: Sequence[Any], limit: Optional[int], response: Response) -> List[Any]:
+    """Cắt dòng dư và đặt header X-Next-Cursor nếu còn dữ liệu phía sau."""
+    if limit is None or len(rows) <= limit:
+        return rows
+    rows = rows[:limit]
+    last = rows[-1]
+    response.headers[NEXT_CURSOR_HEADER] = encode_cursor([getattr(last, column.key) for column in key_columns])
+    return rows
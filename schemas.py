@@ -115,6 +115,9 @@ class OrderForCustomer(BaseModel):
     quantity: int
     totalAmount: float
     date: Date
+    # Chỉ có khi gọi với ?expand=product,employee
+    product_name: Optional[str] = None
+    employee_name: Optional[str] = None
 
     class Config:
         from_attributes = True
@@ -129,6 +132,8 @@ class TransactionBase(BaseModel):
     supplier_id: Optional[str] = None # Đã sửa từ supplierId
     customer_id: Optional[str] = None # Đã sửa từ customerId
     price: float
+    # Kho nhập/xuất (tồn kho theo kho và mức sử dụng kho được cập nhật cùng phiếu); bỏ trống: chỉ đổi tồn kho tổng
+    warehouse_id: Optional[str] = None
 
     class Config :
         populate_by_name = True
@@ -136,6 +141,13 @@ class TransactionBase(BaseModel):
 class TransactionCreate(TransactionBase):
     pass
 
+# Kết quả của từng phiếu trong POST /transactions/batch (theo đúng thứ tự gửi lên)
+class TransactionBatchItemResult(BaseModel):
+    index: int
+    status: Literal["created", "error"]
+    id: Optional[str] = None
+    detail: Optional[str] = None
+
 class TransactionUpdate(BaseModel):
     type: Optional[str] = None
     product_id: Optional[str] = None
@@ -145,6 +157,7 @@ class TransactionUpdate(BaseModel):
     supplier_id: Optional[str] = None
     customer_id: Optional[str] = None
     price: Optional[float] = None
+    warehouse_id: Optional[str] = None
 
 class Transaction(TransactionBase):
     id: str
@@ -154,6 +167,13 @@ class Transaction(TransactionBase):
         from_attributes = True
         populate_by_name = True
         alias_generator = to_camel
+
+# GET /transactions?expand=...: thêm tên sản phẩm/nhân viên/đối tác (nhà cung cấp hoặc khách hàng).
+# Trường nào không được yêu cầu thì không có trong JSON (endpoint dùng response_model_exclude_unset).
+class TransactionExpanded(Transaction):
+    product_name: Optional[str] = None
+    employee_name: Optional[str] = None
+    counterparty_name: Optional[str] = None
 # Base Schema cho Warehouse
 class WarehouseBase(BaseModel):
     name: str
@@ -173,6 +193,22 @@ class Warehouse(WarehouseBase):
     class Config:
         from_attributes = True
 
+# GET /products/{id}/stock?as_of=... và GET /inventory-report/as-of
+class StockAsOf(BaseModel):
+    product_id: str
+    warehouse_id: Optional[str] = None # None: tồn kho tổng của sản phẩm
+    as_of: Date
+    stock: int
+    snapshot_day: Optional[Date] = None # ngày chụp được dùng làm mốc (None: tính từ tồn kho hiện tại)
+
+# GET /warehouses/{id}/utilization (đọc từ bảng warehouse_usage)
+class WarehouseUtilization(BaseModel):
+    warehouse_id: str
+    capacity: Optional[int] = None
+    used: int
+    available: Optional[int] = None
+    utilization: Optional[float] = None # used / capacity
+
 # Base Schema cho Inventory
 class InventoryBase(BaseModel):
     product_id: str # Đã sửa từ productId
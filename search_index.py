@@ -0,0 +1,284 @@
+import sys
+import unicodedata
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import and_, delete, event, func, insert, inspect, or_, select, union
+from sqlalchemy.orm import Session
+
+import models
+
+# Tìm kiếm dùng chung cho các endpoint có tham số search.
+#
+# func.lower(col).like('%x%') luôn phải quét toàn bảng. Ở đây:
+# - Các trường văn bản (tên, loại, địa chỉ, ...) được bỏ dấu, chuyển chữ thường rồi tách thành
+#   các gram 3 ký tự lưu trong bảng search_index. Một truy vấn chỉ đọc các dòng chỉ mục có gram
+#   trùng với gram của từ khóa (tra cứu theo khóa chính), nên "may" tìm được "máy".
+# - Các mã (id, product_id, ...) đã có index nên được so khớp theo tiền tố, viết dưới dạng khoảng
+#   (id >= 'SP12' AND id < 'SP13') thay cho LIKE 'SP12%': LIKE của SQLite không phân biệt hoa thường
+#   nên không dùng được index thường, còn khoảng thì dùng được index ở mọi DB.
+#   Từ khóa trông như mã (có chữ số, không có khoảng trắng) mà không khớp tiền tố nào thì mới tìm mã chứa
+#   từ khóa ở giữa (?search=0012 tìm được TX...0012): cách này quét toàn bảng nên chỉ là đường dự phòng.
+# Chỉ mục được cập nhật tự động khi session flush (thêm/sửa/xóa qua ORM). Các đường ghi hàng loạt
+# bằng Core phải gọi index_rows / remove_rows, hoặc chạy lại rebuild().
+
+DEFAULT_LIMIT = 50
+GRAM_SIZE = 3
+
+# Trọng số khi xếp hạng: khớp chính xác mã > khớp tiền tố mã > khớp tên > khớp trường phụ
+EXACT_ID_WEIGHT = 100
+ID_PREFIX_WEIGHT = 50
+ID_SUBSTRING_WEIGHT = 20
+
+# Các trường văn bản được đánh chỉ mục n-gram của mỗi bảng, kèm trọng số
+TEXT_FIELDS: Dict[str, List[Tuple[str, int]]] = {
+    "products": [("name", 3), ("category", 1)],
+    "suppliers": [("name", 3), ("contactPerson", 1)],
+    "customers": [("name", 3), ("phone", 1)],
+    "warehouses": [("name", 3), ("location", 1)],
+    "departments": [("name", 3), ("phone", 1)],
+}
+
+MODELS = {
+    "products": models.Product,
+    "suppliers": models.Supplier,
+    "customers": models.Customer,
+    "warehouses": models.Warehouse,
+    "departments": models.Department,
+}
+
+# Các cột mã của giao dịch được so khớp theo tiền tố (dự phòng: chuỗi con)
+TRANSACTION_ID_COLUMNS = ["id", "product_id", "employee_id", "supplier_id", "customer_id"]
+
+
+def fold(text: Optional[str]) -> str:
+    """Bỏ dấu tiếng Việt, chuyển chữ thường và gộp khoảng trắng: "Máy Đo" -> "may do"."""
+    if not text:
+        return ""
+    text = unicodedata.normalize("NFD", str(text).lower()).replace("đ", "d")
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return " ".join(text.split())
+
+
+def grams(value: str) -> List[str]:
+    """Các gram 3 ký tự của một giá trị đã fold. Thêm 2 khoảng trắng ở cuối để mỗi ký tự đều là đầu
+    của một gram, nhờ đó từ khóa 1-2 ký tự tìm được bằng so khớp tiền tố trên cột gram."""
+    padded = value + " " * (GRAM_SIZE - 1)
+    return [padded[i:i + GRAM_SIZE] for i in range(len(value))]
+
+
+def _entity_grams(entity: str, values: Dict[str, Optional[str]]) -> Dict[str, int]:
+    result: Dict[str, int] = {}
+    for field, weight in TEXT_FIELDS[entity]:
+        for gram in grams(fold(values.get(field))):
+            if result.get(gram, 0) < weight:
+                result[gram] = weight
+    return result
+
+
+def index_rows(db, entity: str, rows: Iterable[Dict[str, Optional[str]]]) -> None:
+    """Ghi (lại) chỉ mục cho các dòng. Mỗi dòng là dict có "id" và các trường trong TEXT_FIELDS."""
+    rows = list(rows)
+    if not rows:
+        return
+    remove_rows(db, entity, [row["id"] for row in rows])
+    values = [
+        {"entity": entity, "entity_id": row["id"], "gram": gram, "weight": weight}
+        for row in rows
+        for gram, weight in _entity_grams(entity, row).items()
+    ]
+    if values:
+        db.execute(insert(models.SearchGram), values)
+
+
+def remove_rows(db, entity: str, ids: Sequence[str]) -> None:
+    if ids:
+        db.execute(delete(models.SearchGram).where(
+            models.SearchGram.entity == entity,
+            models.SearchGram.entity_id.in_(list(ids))
+        ))
+
+
+def rebuild(db: Session, batch_size: int = 1000) -> int:
+    """Xóa và tạo lại toàn bộ chỉ mục từ dữ liệu hiện có. Trả về số dòng đã đánh chỉ mục."""
+    db.execute(delete(models.SearchGram))
+    total = 0
+    for entity, model in MODELS.items():
+        columns = [model.id] + [getattr(model, field) for field, _ in TEXT_FIELDS[entity]]
+        result = db.execute(select(*columns).execution_options(yield_per=batch_size))
+        for rows in result.partitions():
+            values = [
+                {"entity": entity, "entity_id": row.id, "gram": gram, "weight": weight}
+                for row in rows
+                for gram, weight in _entity_grams(entity, row._mapping).items()
+            ]
+            if values:
+                db.execute(insert(models.SearchGram), values)
+            total += len(rows)
+    db.commit()
+    return total
+
+
+def is_empty(db: Session) -> bool:
+    return db.execute(select(models.SearchGram.entity).limit(1)).first() is None
+
+
+def _gram_scores(db, entity: str, term: str, limit: int) -> Dict[str, int]:
+    folded = fold(term)
+    if not folded:
+        return {}
+    table = models.SearchGram
+    query = select(table.entity_id, func.sum(table.weight).label("score")).where(table.entity == entity)
+    if len(folded) < GRAM_SIZE:
+        # Từ khóa ngắn: mọi gram bắt đầu bằng từ khóa (quét một khoảng trên khóa chính)
+        query = query.where(_prefix_range(table.gram, folded)).group_by(table.entity_id)
+    else:
+        # Dòng khớp phải chứa tất cả các gram của từ khóa
+        term_grams = {folded[i:i + GRAM_SIZE] for i in range(len(folded) - GRAM_SIZE + 1)}
+        query = query.where(table.gram.in_(term_grams)).group_by(table.entity_id).having(
+            func.count() == len(term_grams)
+        )
+    query = query.order_by(func.sum(table.weight).desc(), table.entity_id).limit(limit)
+    return {row.entity_id: int(row.score) for row in db.execute(query)}
+
+
+def _prefix_range(column, prefix: str):
+    """column bắt đầu bằng prefix, viết dưới dạng khoảng để DB tra trên index của column."""
+    upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+    return and_(column >= prefix, column < upper)
+
+
+def _id_prefix_scores(db, columns: Sequence, term: str, limit: int) -> Dict[str, int]:
+    prefix = term.strip().upper()
+    if not prefix:
+        return {}
+    id_column = columns[0]
+    # Mỗi cột một khoảng trên index của chính nó, gộp bằng UNION trong một câu lệnh
+    # (OR trên nhiều cột kèm ORDER BY id buộc DB duyệt cả bảng theo khóa chính)
+    parts = [
+        select(id_column.label("id")).where(_prefix_range(column, prefix)).order_by(column).limit(limit).subquery()
+        for column in columns
+    ]
+    query = union(*[select(part.c.id) for part in parts])
+    ids = sorted(row[0] for row in db.execute(query))[:limit]
+    return {
+        entity_id: EXACT_ID_WEIGHT if entity_id.upper() == prefix else ID_PREFIX_WEIGHT
+        for entity_id in ids
+    }
+
+
+def _looks_like_id(term: str) -> bool:
+    term = term.strip()
+    return bool(term) and not any(ch.isspace() for ch in term) and any(ch.isdigit() for ch in term)
+
+
+def _id_substring_scores(db, columns: Sequence, term: str, limit: int) -> Dict[str, int]:
+    """Mã chứa từ khóa ở bất kỳ vị trí nào (LIKE '%x%', quét toàn bảng): chỉ gọi khi không khớp tiền tố."""
+    needle = term.strip().upper()
+    id_column = columns[0]
+    query = select(id_column).where(
+        or_(*[func.upper(column).contains(needle, autoescape=True) for column in columns])
+    ).order_by(id_column).limit(limit)
+    return {entity_id: ID_SUBSTRING_WEIGHT for entity_id in db.execute(query).scalars()}
+
+
+def _id_scores(db, columns: Sequence, term: str, limit: int) -> Dict[str, int]:
+    scores = _id_prefix_scores(db, columns, term, limit)
+    if not scores and _looks_like_id(term):
+        scores = _id_substring_scores(db, columns, term, limit)
+    return scores
+
+
+def _rank(scores: Dict[str, int], limit: int) -> List[str]:
+    return [entity_id for entity_id, _ in sorted(scores.items(), key=lambda item: (-item[1], item[0]))][:limit]
+
+
+def search_ids(db: Session, entity: str, term: str, limit: int = DEFAULT_LIMIT) -> List[str]:
+    """Mã các dòng khớp với từ khóa, xếp theo độ liên quan giảm dần."""
+    if entity == "transactions":
+        return search_transaction_ids(db, term, limit)
+    model = MODELS[entity]
+    scores = _gram_scores(db, entity, term, limit)
+    for entity_id, score in _id_scores(db, [model.id], term, limit).items():
+        scores[entity_id] = scores.get(entity_id, 0) + score
+    return _rank(scores, limit)
+
+
+def search_transaction_ids(db: Session, term: str, limit: int = DEFAULT_LIMIT) -> List[str]:
+    """Giao dịch khớp theo mã phiếu/mã liên quan (tiền tố, dự phòng là chuỗi con), hoặc thuộc về sản phẩm có tên khớp từ khóa."""
+    table = models.Transaction
+    scores = _id_scores(db, [getattr(table, name) for name in TRANSACTION_ID_COLUMNS], term, limit)
+    remaining = limit - len(scores)
+    product_ids = _rank(_gram_scores(db, "products", term, limit), limit) if remaining > 0 else []
+    if product_ids:
+        query = select(table.id, table.product_id).where(
+            table.product_id.in_(product_ids)
+        ).order_by(table.id.desc()).limit(limit)
+        # Giao dịch của sản phẩm xếp hạng cao hơn được ưu tiên
+        product_rank = {product_id: len(product_ids) - i for i, product_id in enumerate(product_ids)}
+        for row in db.execute(query):
+            scores.setdefault(row.id, product_rank[row.product_id])
+    return _rank(scores, limit)
+
+
+def load_ranked(db: Session, model, ids: List[str]) -> list:
+    """Nạp các đối tượng theo danh sách mã và giữ nguyên thứ tự xếp hạng."""
+    if not ids:
+        return []
+    objects = {obj.id: obj for obj in db.query(model).filter(model.id.in_(ids)).all()}
+    return [objects[entity_id] for entity_id in ids if entity_id in objects]
+
+
+# --- Cập nhật chỉ mục tự động khi flush ---
+
+_ENTITY_BY_CLASS = {model: entity for entity, model in MODELS.items()}
+
+
+def _values(entity: str, obj) -> Dict[str, Optional[str]]:
+    values = {"id": obj.id}
+    values.update({field: getattr(obj, field) for field, _ in TEXT_FIELDS[entity]})
+    return values
+
+
+@event.listens_for(Session, "after_flush")
+def _sync_index(session, flush_context):
+    changed: Dict[str, list] = {}
+    removed: Dict[str, list] = {}
+    for obj in session.new:
+        entity = _ENTITY_BY_CLASS.get(type(obj))
+        if entity:
+            changed.setdefault(entity, []).append(_values(entity, obj))
+    for obj in session.dirty:
+        entity = _ENTITY_BY_CLASS.get(type(obj))
+        if not entity:
+            continue
+        # Chỉ đánh lại chỉ mục khi trường văn bản thay đổi (ví dụ không phải khi chỉ đổi tồn kho)
+        state = inspect(obj)
+        if any(state.attrs[field].history.has_changes() for field, _ in TEXT_FIELDS[entity]):
+            changed.setdefault(entity, []).append(_values(entity, obj))
+    for obj in session.deleted:
+        entity = _ENTITY_BY_CLASS.get(type(obj))
+        if entity:
+            removed.setdefault(entity, []).append(obj.id)
+
+    if not changed and not removed:
+        return
+    connection = session.connection()
+    for entity, rows in changed.items():
+        index_rows(connection, entity, rows)
+    for entity, ids in removed.items():
+        remove_rows(connection, entity, ids)
+
+
+if __name__ == "__main__":
+    # python search_index.py rebuild
+    from database import SessionLocal
+    import versions  # noqa: F401  (tăng phiên bản bảng sau commit để ETag của API được làm mới)
+
+    if sys.argv[1:] != ["rebuild"]:
+        print("Usage: python search_index.py rebuild")
+        sys.exit(1)
+    session = SessionLocal()
+    try:
+        print(f"Đã đánh chỉ mục {rebuild(session)} dòng.")
+    finally:
+        session.close()
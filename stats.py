@@ -0,0 +1,453 @@
+import datetime
+import os
+import random
+import sys
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import bindparam, delete, extract, func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+import archive
+import models
+
+# Số liệu của /dashboard-stats và /revenue-report được duy trì tăng dần thay vì tính lại từ đầu
+# mỗi lần tải trang. Các hàm ghi nhận thay đổi ở đây phải được gọi trong CÙNG session/giao dịch với
+# thao tác ghi sản phẩm hoặc giao dịch, để số liệu được commit hoặc rollback cùng với dữ liệu.
+
+# Bộ đếm và tổng hợp theo tháng được chia thành nhiều shard; mỗi lần cộng chọn ngẫu nhiên một shard
+# nên các giao dịch đồng thời hiếm khi phải chờ khóa của cùng một dòng.
+SHARDS = 8
+
+# employees.revenue_contribution là bản gộp của employee_revenue, được cập nhật định kỳ (0: không chạy nền)
+EMPLOYEE_REVENUE_MERGE_SECONDS = float(os.environ.get("EMPLOYEE_REVENUE_MERGE_SECONDS", "60"))
+
+PRODUCTS_COUNT = "products.count"
+INVENTORY_VALUE = "products.inventory_value"
+TRANSACTIONS_COUNT = "transactions.count"
+
+
+def month_of(day: datetime.date) -> str:
+    return day.strftime("%Y-%m")
+
+
+def _increment(db: Session, table, keys: Dict[str, Any], increments: Dict[str, Any]) -> None:
+    """UPDATE ... SET col = col + :delta cho dòng có khóa keys; tạo dòng nếu chưa có."""
+    condition = [getattr(table, name) == value for name, value in keys.items()]
+    values = {name: getattr(table, name) + delta for name, delta in increments.items()}
+    if db.execute(update(table).where(*condition).values(**values)).rowcount:
+        return
+    try:
+        with db.begin_nested():
+            db.execute(insert(table).values(**keys, **increments))
+    except IntegrityError:
+        # Giao dịch khác vừa tạo dòng này
+        db.execute(update(table).where(*condition).values(**values))
+
+
+def add(db: Session, deltas: Dict[str, float]) -> None:
+    """Cộng dồn vào các bộ đếm bằng UPDATE value = value + :delta (không đọc giá trị cũ vào Python)."""
+    # Sắp xếp theo tên để các giao dịch luôn khóa các dòng theo cùng một thứ tự
+    for name in sorted(deltas):
+        if deltas[name]:
+            _increment(db, models.StatCounter, {"name": name, "shard": random.randrange(SHARDS)}, {"value": deltas[name]})
+
+
+def read(db: Session, names: Iterable[str]) -> Dict[str, float]:
+    table = models.StatCounter
+    names = list(names)
+    rows = db.execute(
+        select(table.name, func.sum(table.value)).where(table.name.in_(names)).group_by(table.name)
+    ).all()
+    values = {name: 0.0 for name in names}
+    values.update({name: value or 0.0 for name, value in rows})
+    return values
+
+
+def product_changed(db: Session, old: Optional[Tuple[float, int]], new: Optional[Tuple[float, int]]) -> None:
+    """Ghi nhận thêm/sửa/xóa sản phẩm. old/new là (price, stock), None nếu sản phẩm chưa có/đã bị xóa."""
+    def value(state):
+        return (state[0] or 0.0) * (state[1] or 0) if state else 0.0
+    add(db, {
+        PRODUCTS_COUNT: (new is not None) - (old is not None),
+        INVENTORY_VALUE: value(new) - value(old),
+    })
+
+
+def stock_changed(db: Session, price: Optional[float], quantity_delta: int) -> None:
+    """Ghi nhận tồn kho của một sản phẩm thay đổi quantity_delta đơn vị (giá bán không đổi)."""
+    add(db, {INVENTORY_VALUE: (price or 0.0) * quantity_delta})
+
+
+def transactions_changed(db: Session, transactions: Iterable, sign: int = 1) -> None:
+    """Ghi nhận các giao dịch được thêm (sign=1) hoặc xóa (sign=-1), gộp theo sản phẩm và theo tháng."""
+    count = 0
+    sales: Dict[str, int] = {}
+    months: Dict[str, Dict[str, float]] = {}
+    employees: Dict[Tuple[str, str], Dict[str, float]] = {}
+    for tx in transactions:
+        count += sign
+        if tx.type != "export":
+            continue
+        sales[tx.product_id] = sales.get(tx.product_id, 0) + sign * tx.quantity
+        for row in (
+            months.setdefault(month_of(tx.date), {"revenue": 0.0, "quantity": 0, "order_count": 0}),
+            employees.setdefault((tx.employee_id, month_of(tx.date)), {"revenue": 0.0, "quantity": 0, "order_count": 0}),
+        ):
+            row["revenue"] += sign * tx.quantity * tx.price
+            row["quantity"] += sign * tx.quantity
+            row["order_count"] += sign
+    add(db, {TRANSACTIONS_COUNT: count})
+
+    for product_id in sorted(sales):
+        _increment(db, models.ProductSales, {"product_id": product_id}, {"exported_quantity": sales[product_id]})
+    for month in sorted(months):
+        _increment(db, models.RevenueMonthly, {"month": month, "shard": random.randrange(SHARDS)}, months[month])
+    # Doanh thu của nhân viên: cộng vào một shard ngẫu nhiên thay vì dòng employees của nhân viên đó (dòng nóng
+    # khi vài nhân viên bán hàng xử lý phần lớn phiếu xuất); employees.revenue_contribution được cập nhật định kỳ
+    # bởi merge_employee_revenue
+    for employee_id, month in sorted(employees):
+        _increment(
+            db, models.EmployeeRevenue,
+            {"employee_id": employee_id, "month": month, "shard": random.randrange(SHARDS)}, employees[employee_id, month]
+        )
+
+
+def revenue_report(db: Session, month_from: Optional[str] = None, month_to: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Doanh thu theo tháng đọc từ bảng tổng hợp (số dòng tỉ lệ với số tháng, không phải số giao dịch)."""
+    table = models.RevenueMonthly
+    query = select(
+        table.month, func.sum(table.revenue), func.sum(table.quantity), func.sum(table.order_count)
+    ).group_by(table.month).having(func.sum(table.order_count) != 0).order_by(table.month)
+    if month_from:
+        query = query.where(table.month >= month_from)
+    if month_to:
+        query = query.where(table.month <= month_to)
+    return [
+        {"month": month, "total_revenue": revenue or 0.0, "total_quantity": int(quantity or 0), "order_count": int(orders or 0)}
+        for month, revenue, quantity, orders in db.execute(query)
+    ]
+
+
+def leaderboard(db: Session, month_from: Optional[str] = None, month_to: Optional[str] = None, limit: int = 10) -> List[Dict[str, Any]]:
+    """limit nhân viên có doanh thu cao nhất trong khoảng tháng (bao gồm hai đầu; None: không giới hạn)."""
+    table = models.EmployeeRevenue
+    revenue = func.sum(table.revenue)
+    totals = select(
+        table.employee_id, revenue.label("revenue"), func.sum(table.quantity).label("quantity"),
+        func.sum(table.order_count).label("order_count")
+    ).group_by(table.employee_id).having(func.sum(table.order_count) != 0)
+    if month_from:
+        totals = totals.where(table.month >= month_from)
+    if month_to:
+        totals = totals.where(table.month <= month_to)
+    totals = totals.subquery()
+    rows = db.execute(
+        select(totals, models.Employee.name).join(models.Employee, models.Employee.id == totals.c.employee_id)
+        .order_by(totals.c.revenue.desc(), totals.c.employee_id).limit(limit)
+    ).all()
+    return [
+        {
+            "rank": rank, "employee_id": row.employee_id, "employee_name": row.name,
+            "revenue": row.revenue or 0.0, "quantity": int(row.quantity or 0), "order_count": int(row.order_count or 0),
+        }
+        for rank, row in enumerate(rows, 1)
+    ]
+
+
+def merge_employee_revenue(db: Session) -> int:
+    """
+    Ghi tổng doanh thu của từng nhân viên (từ employee_revenue) vào employees.revenue_contribution, chỉ cho các
+    dòng có giá trị khác, và commit. Trả về số nhân viên được cập nhật.
+    """
+    table = models.EmployeeRevenue
+    totals = dict(db.execute(select(table.employee_id, func.sum(table.revenue)).group_by(table.employee_id)).all())
+    employees = models.Employee.__table__
+    changed = [
+        {"b_id": employee_id, "b_revenue": totals.get(employee_id) or 0.0}
+        for employee_id, current in db.execute(select(employees.c.id, employees.c.revenue_contribution))
+        if round(current or 0.0, 2) != round(totals.get(employee_id) or 0.0, 2)
+    ]
+    if changed:
+        db.execute(
+            update(employees).where(employees.c.id == bindparam("b_id")).values(revenue_contribution=bindparam("b_revenue")),
+            changed,
+        )
+    db.commit()
+    return len(changed)
+
+
+def dashboard(db: Session, today: Optional[datetime.date] = None) -> Dict[str, object]:
+    """Số liệu trang tổng quan: đọc vài dòng bộ đếm/tổng hợp và một truy vấn theo index cho sản phẩm bán chạy."""
+    today = today or datetime.date.today()
+    this_month = month_of(today)
+    last_month = month_of(today.replace(day=1) - datetime.timedelta(days=1))
+    values = read(db, [PRODUCTS_COUNT, INVENTORY_VALUE, TRANSACTIONS_COUNT])
+    months = {row["month"]: row for row in revenue_report(db, last_month, this_month)}
+
+    top = db.execute(
+        select(models.Product.name).join(
+            models.ProductSales, models.ProductSales.product_id == models.Product.id
+        ).where(
+            models.ProductSales.exported_quantity > 0
+        ).order_by(
+            models.ProductSales.exported_quantity.desc(), models.ProductSales.product_id
+        ).limit(1)
+    ).scalar()
+
+    return {
+        "totalProducts": int(values[PRODUCTS_COUNT]),
+        "newOrders": months[this_month]["order_count"] if this_month in months else 0,
+        "totalInventoryValue": values[INVENTORY_VALUE],
+        "totalRevenueLastMonth": months[last_month]["total_revenue"] if last_month in months else 0.0,
+        "pendingTransactions": int(values[TRANSACTIONS_COUNT]),
+        "topSellingProduct": top or "N/A",
+    }
+
+
+# --- Tính lại từ bảng gốc (quét toàn bảng, chỉ dùng để backfill hoặc kiểm tra sai lệch) ---
+# Giao dịch của các tháng đã lưu trữ (archive.py) không còn trong bảng transactions: cộng thêm tổng đã lưu
+# trong archived_months/archived_product_totals.
+
+def _expected_counters(db: Session) -> Dict[str, float]:
+    hot = db.query(func.count(models.Transaction.id)).scalar() or 0
+    archived = db.query(func.sum(models.ArchivedMonth.row_count)).scalar() or 0
+    return {
+        PRODUCTS_COUNT: db.query(func.count(models.Product.id)).scalar() or 0,
+        INVENTORY_VALUE: db.query(func.sum(models.Product.price * models.Product.stock)).scalar() or 0.0,
+        TRANSACTIONS_COUNT: hot + archived,
+    }
+
+
+def _expected_sales(db: Session) -> Dict[str, int]:
+    tx, cold = models.Transaction, models.ArchivedProductTotal
+    rows = db.query(tx.product_id, func.sum(tx.quantity)).filter(tx.type == "export").group_by(tx.product_id).all()
+    sales = {product_id: int(quantity or 0) for product_id, quantity in rows}
+    for product_id, quantity in db.query(cold.product_id, func.sum(cold.total_exports)).group_by(cold.product_id).all():
+        if quantity:
+            sales[product_id] = sales.get(product_id, 0) + int(quantity)
+    return sales
+
+
+def _expected_revenue(db: Session) -> Dict[str, Dict[str, float]]:
+    tx = models.Transaction
+    year, month = extract("year", tx.date), extract("month", tx.date)
+    rows = db.query(
+        year, month, func.sum(tx.quantity * tx.price), func.sum(tx.quantity), func.count(tx.id)
+    ).filter(tx.type == "export").group_by(year, month).all()
+    expected = {
+        f"{int(row_year):04d}-{int(row_month):02d}": {
+            "revenue": revenue or 0.0, "quantity": int(quantity or 0), "order_count": int(orders or 0)
+        }
+        for row_year, row_month, revenue, quantity, orders in rows
+    }
+    for entry in db.query(models.ArchivedMonth).filter(models.ArchivedMonth.order_count > 0).all():
+        row = expected.setdefault(entry.month, {"revenue": 0.0, "quantity": 0, "order_count": 0})
+        row["revenue"] += entry.revenue
+        row["quantity"] += entry.export_quantity
+        row["order_count"] += entry.order_count
+    return expected
+
+
+def _expected_employee_revenue(db: Session) -> Dict[Tuple[str, str], Dict[str, float]]:
+    tx = models.Transaction
+    year, month = extract("year", tx.date), extract("month", tx.date)
+    rows = db.query(
+        tx.employee_id, year, month, func.sum(tx.quantity * tx.price), func.sum(tx.quantity), func.count(tx.id)
+    ).filter(tx.type == "export").group_by(tx.employee_id, year, month).all()
+    expected = {
+        (employee_id, f"{int(row_year):04d}-{int(row_month):02d}"): {
+            "revenue": revenue or 0.0, "quantity": int(quantity or 0), "order_count": int(orders or 0)
+        }
+        for employee_id, row_year, row_month, revenue, quantity, orders in rows
+    }
+    # Không có tổng theo nhân viên cho các tháng đã lưu trữ: đọc file lưu trữ của tháng đó
+    for entry in db.query(models.ArchivedMonth).filter(models.ArchivedMonth.order_count > 0).all():
+        data = archive.read_file(entry.file)
+        for kind, employee_id, quantity, price in zip(data["type"], data["employee_id"], data["quantity"], data["price"]):
+            if kind != "export":
+                continue
+            row = expected.setdefault((employee_id, entry.month), {"revenue": 0.0, "quantity": 0, "order_count": 0})
+            row["revenue"] += quantity * price
+            row["quantity"] += quantity
+            row["order_count"] += 1
+    return expected
+
+
+def _expected_warehouse_usage(db: Session) -> Dict[str, int]:
+    inventory = models.Inventory
+    expected = {warehouse_id: 0 for warehouse_id in db.execute(select(models.Warehouse.id)).scalars()}
+    expected.update({
+        warehouse_id: int(used or 0) for warehouse_id, used in db.execute(
+            select(inventory.warehouse_id, func.sum(inventory.stock)).group_by(inventory.warehouse_id)
+        )
+    })
+    return expected
+
+
+INVENTORY_TOTAL_PREFIX = "inventory_total:"
+
+
+def _inventory_totals(db: Session) -> Tuple[Dict[str, int], Dict[str, int]]:
+    """(tổng inventory.stock, products.stock) theo sản phẩm."""
+    inventory = models.Inventory
+    allocated = {
+        product_id: int(stock or 0) for product_id, stock in db.execute(
+            select(inventory.product_id, func.sum(inventory.stock)).group_by(inventory.product_id)
+        )
+    }
+    total = {product_id: int(stock or 0) for product_id, stock in db.execute(select(models.Product.id, models.Product.stock))}
+    return allocated, total
+
+
+def _differences(stored: Dict[str, float], expected: Dict[str, float], prefix: str = "") -> Dict[str, Tuple[float, float]]:
+    result = {}
+    for name in set(stored) | set(expected):
+        have, want = stored.get(name) or 0.0, expected.get(name) or 0.0
+        if abs(have - want) > 1e-6 * max(1.0, abs(want)):
+            result[prefix + name] = (have, want)
+    return result
+
+
+def drift(db: Session) -> Dict[str, Tuple[float, float]]:
+    """So sánh số liệu đang lưu với giá trị tính lại; trả về {tên: (đang lưu, đúng)} cho các mục bị lệch."""
+    counter = models.StatCounter
+    stored_counters = dict(db.execute(select(counter.name, func.sum(counter.value)).group_by(counter.name)).all())
+    result = _differences(stored_counters, _expected_counters(db))
+
+    stored_sales = dict(db.execute(select(models.ProductSales.product_id, models.ProductSales.exported_quantity)).all())
+    result.update(_differences(stored_sales, _expected_sales(db), "product_sales:"))
+
+    stored_revenue = {}
+    for row in revenue_report(db):
+        stored_revenue[f"{row['month']}.revenue"] = row["total_revenue"]
+        stored_revenue[f"{row['month']}.quantity"] = row["total_quantity"]
+        stored_revenue[f"{row['month']}.order_count"] = row["order_count"]
+    expected_revenue = {
+        f"{month}.{name}": value
+        for month, row in _expected_revenue(db).items()
+        for name, value in row.items()
+    }
+    result.update(_differences(stored_revenue, expected_revenue, "revenue_monthly:"))
+
+    table = models.EmployeeRevenue
+    stored_employees = {}
+    for employee_id, month, revenue, quantity, orders in db.execute(
+        select(table.employee_id, table.month, func.sum(table.revenue), func.sum(table.quantity), func.sum(table.order_count))
+        .group_by(table.employee_id, table.month)
+    ):
+        stored_employees.update({
+            f"{employee_id}:{month}.revenue": revenue, f"{employee_id}:{month}.quantity": quantity,
+            f"{employee_id}:{month}.order_count": orders,
+        })
+    expected_employees = {
+        f"{employee_id}:{month}.{name}": value
+        for (employee_id, month), row in _expected_employee_revenue(db).items()
+        for name, value in row.items()
+    }
+    result.update(_differences(stored_employees, expected_employees, "employee_revenue:"))
+
+    stored_usage = dict(db.execute(select(models.WarehouseUsage.warehouse_id, models.WarehouseUsage.used)).all())
+    result.update(_differences(stored_usage, _expected_warehouse_usage(db), "warehouse_usage:"))
+
+    # Tổng tồn kho theo kho so với products.stock. Chỉ báo, recompute không sửa được (không biết bên nào đúng);
+    # phiếu không ghi kho chỉ đổi tồn kho tổng nên sản phẩm của chúng cũng hiện ở đây.
+    allocated, total = _inventory_totals(db)
+    result.update(_differences(allocated, total, INVENTORY_TOTAL_PREFIX))
+    return result
+
+
+def rebuild_revenue_monthly(db: Session) -> int:
+    """Backfill bảng revenue_monthly từ transactions và commit. Trả về số tháng."""
+    expected = _expected_revenue(db)
+    db.execute(delete(models.RevenueMonthly))
+    if expected:
+        db.execute(insert(models.RevenueMonthly), [{"month": month, "shard": 0, **row} for month, row in expected.items()])
+    db.commit()
+    return len(expected)
+
+
+def rebuild_employee_revenue(db: Session) -> int:
+    """
+    Đối chiếu hàng loạt: tính lại bảng employee_revenue từ transactions (và các tháng đã lưu trữ), cập nhật
+    employees.revenue_contribution và commit. Trả về số cặp (nhân viên, tháng).
+    """
+    expected = _expected_employee_revenue(db)
+    db.execute(delete(models.EmployeeRevenue))
+    if expected:
+        db.execute(insert(models.EmployeeRevenue), [
+            {"employee_id": employee_id, "month": month, "shard": 0, **row} for (employee_id, month), row in expected.items()
+        ])
+    merge_employee_revenue(db)
+    return len(expected)
+
+
+def rebuild_warehouse_usage(db: Session) -> int:
+    """Tính lại warehouse_usage từ bảng inventory và commit. Trả về số kho."""
+    expected = _expected_warehouse_usage(db)
+    db.execute(delete(models.WarehouseUsage))
+    if expected:
+        db.execute(insert(models.WarehouseUsage), [
+            {"warehouse_id": warehouse_id, "used": used} for warehouse_id, used in expected.items()
+        ])
+    db.commit()
+    return len(expected)
+
+
+def recompute(db: Session) -> Dict[str, Tuple[float, float]]:
+    """Ghi đè toàn bộ số liệu bằng giá trị tính lại từ các bảng gốc và commit. Trả về các sai lệch đã sửa."""
+    corrected = {name: values for name, values in drift(db).items() if not name.startswith(INVENTORY_TOTAL_PREFIX)}
+    counters, sales = _expected_counters(db), _expected_sales(db)
+    db.execute(delete(models.StatCounter))
+    db.execute(delete(models.ProductSales))
+    db.execute(insert(models.StatCounter), [{"name": name, "shard": 0, "value": value} for name, value in counters.items()])
+    if sales:
+        db.execute(insert(models.ProductSales), [
+            {"product_id": product_id, "exported_quantity": quantity} for product_id, quantity in sales.items()
+        ])
+    rebuild_revenue_monthly(db)
+    rebuild_employee_revenue(db)
+    rebuild_warehouse_usage(db)
+    return corrected
+
+
+def is_empty(db: Session) -> bool:
+    return db.execute(select(models.StatCounter.name).limit(1)).first() is None
+
+
+def revenue_is_empty(db: Session) -> bool:
+    return db.execute(select(models.RevenueMonthly.month).limit(1)).first() is None
+
+
+def employee_revenue_is_empty(db: Session) -> bool:
+    return db.execute(select(models.EmployeeRevenue.month).limit(1)).first() is None
+
+
+def warehouse_usage_is_empty(db: Session) -> bool:
+    return db.execute(select(models.WarehouseUsage.warehouse_id).limit(1)).first() is None
+
+
+if __name__ == "__main__":
+    # python stats.py check | recompute | backfill-revenue | reconcile-employees | merge-employees
+    from database import SessionLocal
+    import versions  # noqa: F401  (tăng phiên bản bảng sau commit để ETag của API được làm mới)
+
+    commands = ("check", "recompute", "backfill-revenue", "reconcile-employees", "merge-employees")
+    if len(sys.argv) != 2 or sys.argv[1] not in commands:
+        print("Usage: python stats.py check|recompute|backfill-revenue|reconcile-employees|merge-employees")
+        sys.exit(1)
+    session = SessionLocal()
+    try:
+        if sys.argv[1] == "backfill-revenue":
+            print(f"Đã tổng hợp doanh thu của {rebuild_revenue_monthly(session)} tháng.")
+        elif sys.argv[1] == "reconcile-employees":
+            print(f"Đã tính lại doanh thu của {rebuild_employee_revenue(session)} cặp (nhân viên, tháng).")
+        elif sys.argv[1] == "merge-employees":
+            print(f"Đã cập nhật revenue_contribution của {merge_employee_revenue(session)} nhân viên.")
+        else:
+            result = drift(session) if sys.argv[1] == "check" else recompute(session)
+            for name, (have, want) in sorted(result.items()):
+                print(f"{name}: {have} -> {want}")
+            print(f"{len(result)} mục bị lệch.")
+    finally:
+        session.close()
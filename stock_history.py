@@ -0,0 +1,385 @@
+import datetime
+import os
+import sys
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import case, func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+import archive
+import logs
+import models
+
+# Tồn kho tại một ngày trong quá khứ: ảnh chụp định kỳ + các phiếu trong khoảng giữa.
+#
+# - Mỗi STOCK_SNAPSHOT_DAYS ngày, tồn kho cuối ngày hôm qua được chụp vào stock_snapshots: tồn kho tổng của
+#   từng sản phẩm (warehouse_id = "") và tồn kho theo kho (bảng inventory). Ảnh chụp được tính từ tồn kho hiện
+#   tại trừ đi các phiếu có ngày sau ngày chụp, nên không phải duyệt lại lịch sử.
+# - Tồn kho tại ngày D = ảnh chụp gần nhất S <= D (tìm theo khóa chính, O(log n)) + tổng các phiếu có
+#   S < ngày <= D (index (product_id, date), tối đa khoảng cách giữa hai lần chụp). Trước lần chụp đầu tiên:
+#   lùi từ lần chụp kế tiếp (hoặc từ tồn kho hiện tại nếu chưa có lần chụp nào). Khoảng ngày thuộc tháng đã
+#   lưu trữ được đọc từ file của archive.py.
+# - Thêm/xóa phiếu có ngày không sau lần chụp cuối cùng (phiếu lùi ngày) cập nhật các ảnh chụp từ ngày đó trở
+#   đi trong CÙNG giao dịch DB (transactions_changed), nên ảnh chụp luôn khớp với bảng transactions.
+# - Sửa tồn kho trực tiếp (POST/PUT/DELETE /inventory, xóa sản phẩm) không phải phiếu: mỗi lần sửa được ghi
+#   một dòng stock_adjustments với ngày sửa (record_adjustment) và được cộng như phiếu, nên không bị tính vào
+#   ngày của lần chụp trước. Phiếu không gắn kho chỉ làm đổi tồn kho tổng của sản phẩm.
+#
+#   python stock_history.py snapshot [--day 2024-05-31]
+#   python stock_history.py backfill [--every 7]
+#   python stock_history.py as-of --product SP... --day 2024-05-31 [--warehouse WH...]
+
+SNAPSHOT_INTERVAL_DAYS = int(os.environ.get("STOCK_SNAPSHOT_DAYS", "7"))
+# Khoảng thời gian giữa hai lần kiểm tra (chạy nền) xem đã tới lúc chụp chưa
+CHECK_SECONDS = float(os.environ.get("STOCK_SNAPSHOT_CHECK_SECONDS", "3600"))
+BATCH_SIZE = 5000
+
+PRODUCT_TOTAL = ""
+
+logger = logs.get_logger("stock_history")
+
+Key = Tuple[str, str]
+
+
+def _signed_quantity(kind: str, quantity: int) -> int:
+    return quantity if kind == "import" else -quantity
+
+
+def _add(target: Dict[Key, int], product_id: str, warehouse_id: Optional[str], delta: int) -> None:
+    target[product_id, PRODUCT_TOTAL] = target.get((product_id, PRODUCT_TOTAL), 0) + delta
+    if warehouse_id:
+        target[product_id, warehouse_id] = target.get((product_id, warehouse_id), 0) + delta
+
+
+def deltas(db: Session, after: Optional[datetime.date], until: Optional[datetime.date],
+           product_id: Optional[str] = None) -> Dict[Key, int]:
+    """
+    Tổng thay đổi tồn kho của các phiếu có after < ngày <= until (None: không giới hạn), theo
+    (sản phẩm, kho) và (sản phẩm, PRODUCT_TOTAL). Gồm cả các tháng đã lưu trữ.
+    """
+    tx = models.Transaction
+    conditions = [tx.type.in_(archive.TYPES)]
+    if product_id is not None:
+        conditions.append(tx.product_id == product_id)
+    if after is not None:
+        conditions.append(tx.date > after)
+    if until is not None:
+        conditions.append(tx.date <= until)
+    signed = func.sum(case((tx.type == "import", tx.quantity), else_=-tx.quantity))
+    result: Dict[Key, int] = {}
+    for row_product, row_warehouse, delta in db.execute(
+        select(tx.product_id, tx.warehouse_id, signed).where(*conditions).group_by(tx.product_id, tx.warehouse_id)
+    ):
+        _add(result, row_product, row_warehouse, int(delta or 0))
+
+    entries = db.query(models.ArchivedMonth)
+    if after is not None:
+        entries = entries.filter(models.ArchivedMonth.month >= (after + datetime.timedelta(days=1)).strftime("%Y-%m"))
+    if until is not None:
+        entries = entries.filter(models.ArchivedMonth.month <= until.strftime("%Y-%m"))
+    reader = archive.get_reader()
+    date_from = after + datetime.timedelta(days=1) if after is not None else None
+    for entry in entries.order_by(models.ArchivedMonth.month).all():
+        for row_product, row_warehouse, kind, quantity in reader.select(
+            entry, ["product_id", "warehouse_id", "type", "quantity"], date_from, until
+        ):
+            if product_id is None or row_product == product_id:
+                _add(result, row_product, row_warehouse, _signed_quantity(kind, quantity))
+
+    adjustment = models.StockAdjustment
+    conditions = []
+    if product_id is not None:
+        conditions.append(adjustment.product_id == product_id)
+    if after is not None:
+        conditions.append(adjustment.day > after)
+    if until is not None:
+        conditions.append(adjustment.day <= until)
+    for row_product, row_warehouse, delta in db.execute(
+        select(adjustment.product_id, adjustment.warehouse_id, func.sum(adjustment.quantity))
+        .where(*conditions).group_by(adjustment.product_id, adjustment.warehouse_id)
+    ):
+        _add(result, row_product, row_warehouse, int(delta or 0))
+    return result
+
+
+def current(db: Session, product_id: Optional[str] = None) -> Dict[Key, int]:
+    """Tồn kho hiện tại (products.stock và inventory.stock), bỏ các giá trị 0."""
+    products, inventory = models.Product, models.Inventory
+    product_rows = select(products.id, products.stock)
+    inventory_rows = select(inventory.product_id, inventory.warehouse_id, inventory.stock)
+    if product_id is not None:
+        product_rows = product_rows.where(products.id == product_id)
+        inventory_rows = inventory_rows.where(inventory.product_id == product_id)
+    result = {(row_product, PRODUCT_TOTAL): stock for row_product, stock in db.execute(product_rows) if stock}
+    result.update({(row_product, warehouse_id): stock for row_product, warehouse_id, stock in db.execute(inventory_rows) if stock})
+    return result
+
+
+def latest_day(db: Session, on_or_before: Optional[datetime.date] = None) -> Optional[datetime.date]:
+    stmt = select(func.max(models.StockSnapshotDay.day))
+    if on_or_before is not None:
+        stmt = stmt.where(models.StockSnapshotDay.day <= on_or_before)
+    return db.execute(stmt).scalar()
+
+
+def _next_day(db: Session, after: datetime.date) -> Optional[datetime.date]:
+    return db.execute(select(func.min(models.StockSnapshotDay.day)).where(models.StockSnapshotDay.day > after)).scalar()
+
+
+def _snapshot(db: Session, day: datetime.date, product_id: Optional[str] = None) -> Dict[Key, int]:
+    table = models.StockSnapshot
+    stmt = select(table.product_id, table.warehouse_id, table.stock).where(table.day == day)
+    if product_id is not None:
+        stmt = stmt.where(table.product_id == product_id)
+    return {(row_product, warehouse_id): stock for row_product, warehouse_id, stock in db.execute(stmt)}
+
+
+def state(db: Session, day: datetime.date, product_id: Optional[str] = None) -> Tuple[Dict[Key, int], Optional[datetime.date]]:
+    """
+    Tồn kho vào cuối ngày day theo (sản phẩm, kho) và (sản phẩm, PRODUCT_TOTAL), cùng ngày chụp được dùng làm
+    mốc (None: tính lùi từ tồn kho hiện tại).
+    """
+    anchor = latest_day(db, day)
+    if anchor is not None:
+        base, change, sign = _snapshot(db, anchor, product_id), deltas(db, anchor, day, product_id), 1
+    else:
+        anchor = _next_day(db, day)
+        if anchor is not None:
+            base, change = _snapshot(db, anchor, product_id), deltas(db, day, anchor, product_id)
+        else:
+            base, change = current(db, product_id), deltas(db, day, None, product_id)
+        sign = -1
+    result = dict(base)
+    for key, delta in change.items():
+        result[key] = result.get(key, 0) + sign * delta
+    return result, anchor
+
+
+def stock_as_of(db: Session, product_id: str, day: datetime.date, warehouse_id: Optional[str] = None) -> Dict[str, Any]:
+    values, anchor = state(db, day, product_id)
+    return {
+        "product_id": product_id, "warehouse_id": warehouse_id, "as_of": day,
+        "stock": values.get((product_id, warehouse_id or PRODUCT_TOTAL), 0), "snapshot_day": anchor,
+    }
+
+
+def report_as_of(db: Session, day: datetime.date, warehouse_id: Optional[str] = None,
+                 by_warehouse: bool = False) -> List[Dict[str, Any]]:
+    """
+    Tồn kho của mọi sản phẩm vào cuối ngày day: tồn kho tổng (mặc định), theo từng kho (by_warehouse) hoặc
+    tại một kho. Bỏ các dòng bằng 0.
+    """
+    values, anchor = state(db, day)
+    rows = []
+    for (product_id, key_warehouse), stock in sorted(values.items()):
+        if not stock:
+            continue
+        if warehouse_id is not None:
+            if key_warehouse != warehouse_id:
+                continue
+        elif by_warehouse == (key_warehouse == PRODUCT_TOTAL):
+            continue
+        rows.append({
+            "product_id": product_id, "warehouse_id": key_warehouse or None, "as_of": day,
+            "stock": stock, "snapshot_day": anchor,
+        })
+    return rows
+
+
+def _insert_rows(db: Session, day: datetime.date, values: Dict[Key, int]) -> int:
+    rows = [
+        {"day": day, "product_id": product_id, "warehouse_id": warehouse_id, "stock": stock}
+        for (product_id, warehouse_id), stock in sorted(values.items()) if stock
+    ]
+    for start in range(0, len(rows), BATCH_SIZE):
+        db.execute(insert(models.StockSnapshot), rows[start:start + BATCH_SIZE])
+    return len(rows)
+
+
+def take_snapshot(db: Session, day: Optional[datetime.date] = None) -> int:
+    """
+    Chụp tồn kho cuối ngày day (mặc định hôm qua) và commit. Trả về số dòng đã ghi (0 nếu ngày này đã được
+    chụp, kể cả bởi worker khác cùng lúc).
+    """
+    day = day or datetime.date.today() - datetime.timedelta(days=1)
+    try:
+        # Ghi dòng của ngày trước: worker thứ hai chụp cùng ngày dừng ở đây vì trùng khóa chính
+        db.add(models.StockSnapshotDay(day=day, row_count=0, taken_at=datetime.datetime.utcnow()))
+        db.flush()
+    except IntegrityError:
+        db.rollback()
+        return 0
+    values = current(db)
+    for key, delta in deltas(db, day, None).items():
+        values[key] = values.get(key, 0) - delta
+    count = _insert_rows(db, day, values)
+    db.execute(update(models.StockSnapshotDay).where(models.StockSnapshotDay.day == day).values(row_count=count))
+    db.commit()
+    return count
+
+
+def ensure_recent(db: Session, today: Optional[datetime.date] = None) -> Optional[datetime.date]:
+    """Chụp ngày hôm qua nếu lần chụp cuối cũ hơn SNAPSHOT_INTERVAL_DAYS ngày. Trả về ngày vừa chụp."""
+    yesterday = (today or datetime.date.today()) - datetime.timedelta(days=1)
+    latest = latest_day(db)
+    if latest is not None and (yesterday - latest).days < SNAPSHOT_INTERVAL_DAYS:
+        return None
+    count = take_snapshot(db, yesterday)
+    logger.info("Đã chụp tồn kho ngày %s: %d dòng", yesterday, count)
+    return yesterday
+
+
+def backfill(db: Session, every_days: int = SNAPSHOT_INTERVAL_DAYS, today: Optional[datetime.date] = None) -> int:
+    """
+    Tạo các ảnh chụp còn thiếu cho lịch sử đã có, mỗi every_days ngày tính lùi từ hôm qua tới ngày của phiếu
+    cũ nhất, trong một lượt đọc lịch sử. Commit sau mỗi ngày chụp. Trả về số ngày đã chụp.
+    """
+    yesterday = (today or datetime.date.today()) - datetime.timedelta(days=1)
+    tx = models.Transaction
+    first = [db.execute(select(func.min(tx.date)).where(tx.type.in_(archive.TYPES))).scalar()]
+    first_month = db.execute(select(func.min(models.ArchivedMonth.month))).scalar()
+    if first_month:
+        first.append(archive.month_bounds(first_month)[0])
+    first = min((day for day in first if day is not None), default=None)
+    if first is None:
+        return 0
+    existing = set(db.execute(select(models.StockSnapshotDay.day)).scalars())
+
+    # Thay đổi theo ngày của toàn bộ lịch sử, rồi lùi dần từ tồn kho hiện tại
+    by_day: Dict[datetime.date, Dict[Key, int]] = {}
+    signed = func.sum(case((tx.type == "import", tx.quantity), else_=-tx.quantity))
+    for day, product_id, warehouse_id, delta in db.execute(
+        select(tx.date, tx.product_id, tx.warehouse_id, signed).where(tx.type.in_(archive.TYPES))
+        .group_by(tx.date, tx.product_id, tx.warehouse_id)
+    ):
+        _add(by_day.setdefault(day, {}), product_id, warehouse_id, int(delta or 0))
+    reader = archive.get_reader()
+    for entry in db.query(models.ArchivedMonth).all():
+        for day, product_id, warehouse_id, kind, quantity in reader.select(
+            entry, ["date", "product_id", "warehouse_id", "type", "quantity"]
+        ):
+            _add(by_day.setdefault(day, {}), product_id, warehouse_id, _signed_quantity(kind, quantity))
+    adjustment = models.StockAdjustment
+    for day, product_id, warehouse_id, delta in db.execute(
+        select(adjustment.day, adjustment.product_id, adjustment.warehouse_id, func.sum(adjustment.quantity))
+        .group_by(adjustment.day, adjustment.product_id, adjustment.warehouse_id)
+    ):
+        _add(by_day.setdefault(day, {}), product_id, warehouse_id, int(delta or 0))
+
+    values = current(db)
+    history = sorted(by_day, reverse=True)
+    position = 0
+    taken = 0
+    day = yesterday
+    while day >= first:
+        # Bỏ các phiếu có ngày sau ngày chụp
+        while position < len(history) and history[position] > day:
+            for key, delta in by_day[history[position]].items():
+                values[key] = values.get(key, 0) - delta
+            position += 1
+        if day not in existing:
+            db.add(models.StockSnapshotDay(day=day, row_count=0, taken_at=datetime.datetime.utcnow()))
+            db.flush()
+            count = _insert_rows(db, day, values)
+            db.execute(update(models.StockSnapshotDay).where(models.StockSnapshotDay.day == day).values(row_count=count))
+            db.commit()
+            taken += 1
+        day -= datetime.timedelta(days=every_days)
+    return taken
+
+
+def transactions_changed(db: Session, transactions: Iterable, sign: int = 1) -> None:
+    """
+    Ghi nhận thêm (sign=1) hoặc xóa (sign=-1) các phiếu: phiếu có ngày không sau lần chụp cuối cùng làm đổi
+    các ảnh chụp từ ngày của phiếu trở đi. Gọi trong cùng session/giao dịch với thao tác ghi phiếu.
+    """
+    transactions = list(transactions)
+    latest = latest_day(db)
+    if latest is None or not transactions:
+        return
+    changes: Dict[datetime.date, Dict[Key, int]] = {}
+    for tx in transactions:
+        if tx.date <= latest:
+            _add(changes.setdefault(tx.date, {}), tx.product_id, getattr(tx, "warehouse_id", None),
+                 sign * _signed_quantity(tx.type, tx.quantity))
+    _apply_to_snapshots(db, changes)
+
+
+def record_adjustment(db: Session, product_id: str, warehouse_id: Optional[str], quantity: int,
+                      today: Optional[datetime.date] = None) -> None:
+    """
+    Ghi nhận sửa tồn kho trực tiếp (quantity âm nếu giảm) vào ngày hôm nay, kèm warehouse_id nếu là tồn kho theo
+    kho (tồn kho tổng cũng đổi theo). Gọi trong cùng session/giao dịch với thao tác sửa tồn kho.
+    """
+    if not quantity:
+        return
+    day = today or datetime.date.today()
+    db.execute(insert(models.StockAdjustment).values(
+        day=day, product_id=product_id, warehouse_id=warehouse_id, quantity=quantity, created_at=datetime.datetime.utcnow()
+    ))
+    # Thường không có ảnh chụp nào từ hôm nay trở đi, trừ khi vừa chụp tay (POST /stock-snapshots?day=...)
+    changes: Dict[Key, int] = {}
+    _add(changes, product_id, warehouse_id, quantity)
+    _apply_to_snapshots(db, {day: changes})
+
+
+def _apply_to_snapshots(db: Session, changes: Dict[datetime.date, Dict[Key, int]]) -> None:
+    """Cộng thay đổi của từng ngày vào mọi ảnh chụp từ ngày đó trở đi."""
+    if not changes:
+        return
+    days = db.execute(
+        select(models.StockSnapshotDay.day).where(models.StockSnapshotDay.day >= min(changes)).order_by(models.StockSnapshotDay.day)
+    ).scalars().all()
+    increments: Dict[Tuple[datetime.date, str, str], int] = {}
+    for tx_day, values in changes.items():
+        for day in days:
+            if day < tx_day:
+                continue
+            for (product_id, warehouse_id), delta in values.items():
+                increments[day, product_id, warehouse_id] = increments.get((day, product_id, warehouse_id), 0) + delta
+
+    table = models.StockSnapshot
+    # Sắp xếp để các giao dịch luôn khóa các dòng theo cùng một thứ tự
+    for (day, product_id, warehouse_id), delta in sorted(increments.items()):
+        if not delta:
+            continue
+        condition = (table.day == day, table.product_id == product_id, table.warehouse_id == warehouse_id)
+        stmt = update(table).where(*condition).values(stock=table.stock + delta)
+        if db.execute(stmt).rowcount:
+            continue
+        try:
+            with db.begin_nested():
+                db.execute(insert(table).values(day=day, product_id=product_id, warehouse_id=warehouse_id, stock=delta))
+        except IntegrityError:
+            # Giao dịch khác vừa tạo dòng này
+            db.execute(stmt)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Ảnh chụp tồn kho theo ngày")
+    parser.add_argument("command", choices=["snapshot", "backfill", "as-of"])
+    parser.add_argument("--day", type=datetime.date.fromisoformat, help="Ngày (YYYY-MM-DD)")
+    parser.add_argument("--every", type=int, default=SNAPSHOT_INTERVAL_DAYS, help="Khoảng cách giữa hai lần chụp (ngày)")
+    parser.add_argument("--product")
+    parser.add_argument("--warehouse")
+    args = parser.parse_args()
+
+    from database import SessionLocal
+    import versions  # noqa: F401  (tăng phiên bản bảng sau commit để ETag của API được làm mới)
+
+    session = SessionLocal()
+    try:
+        if args.command == "snapshot":
+            print(f"Đã chụp {take_snapshot(session, args.day)} dòng tồn kho.")
+        elif args.command == "backfill":
+            print(f"Đã tạo {backfill(session, args.every)} ảnh chụp.")
+        else:
+            if not args.product or not args.day:
+                parser.error("as-of cần --product và --day")
+            print(stock_as_of(session, args.product, args.day, args.warehouse))
+    finally:
+        session.close()
+    sys.exit(0)
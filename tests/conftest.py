@@ -0,0 +1,18 @@
+import os
+import sys
+import tempfile
+
+# Các module của ứng dụng nằm ở thư mục gốc của repo và đọc cấu hình từ biến môi trường khi import:
+# trỏ chúng vào một database SQLite và các file dùng chung tạm thời trước khi test nào import main.
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+_workdir = tempfile.mkdtemp(prefix="wms-tests-")
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(_workdir, "test.db")
+os.environ["TABLE_VERSIONS_FILE"] = os.path.join(_workdir, "table-versions.bin")
+os.environ["ENTITY_CACHE_FILE"] = os.path.join(_workdir, "entity-cache.bin")
+os.environ["ARCHIVE_DIR"] = os.path.join(_workdir, "archive")
+# Không chạy các việc nền (gộp doanh thu, chụp tồn kho) trong lúc test
+os.environ["EMPLOYEE_REVENUE_MERGE_SECONDS"] = "0"
+os.environ["STOCK_SNAPSHOT_CHECK_SECONDS"] = "0"
+os.environ.setdefault("LOG_LEVEL", "WARNING")
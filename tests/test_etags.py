@@ -0,0 +1,77 @@
+import asyncio
+import datetime
+from types import SimpleNamespace
+
+import httpx
+
+import main
+
+
+async def _run(scenario):
+    async with main.app.router.lifespan_context(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            await scenario(client)
+
+
+async def _revalidate(client, path, etag):
+    return await client.get(path, headers={"If-None-Match": etag})
+
+
+def test_if_none_match_returns_304_until_a_write():
+    async def scenario(client):
+        first = await client.get("/products")
+        assert first.status_code == 200
+        etag = first.headers["ETag"]
+
+        cached = await _revalidate(client, "/products", etag)
+        assert cached.status_code == 304
+        assert cached.headers["ETag"] == etag
+        assert cached.content == b""
+
+        # Ghi vào bảng khác không làm đổi ETag của danh sách sản phẩm
+        department = await client.post("/departments", json={"name": "Phòng kiểm tra ETag", "phone": "0900000000"})
+        assert department.status_code == 201
+        assert (await _revalidate(client, "/products", etag)).status_code == 304
+
+        product = await client.post("/products", json={
+            "name": "Sản phẩm kiểm tra ETag", "category": "Test", "price": 1000.0,
+            "XuatXu": "Việt Nam", "GiaNhap": 800.0,
+        })
+        assert product.status_code == 201
+        fresh = await _revalidate(client, "/products", etag)
+        assert fresh.status_code == 200
+        assert fresh.headers["ETag"] != etag
+        assert product.json()["id"] in [row["id"] for row in fresh.json()]
+        assert (await _revalidate(client, "/products", fresh.headers["ETag"])).status_code == 304
+
+    asyncio.run(_run(scenario))
+
+
+def test_etag_depends_on_query_string():
+    async def scenario(client):
+        first = await client.get("/products", params={"limit": 5})
+        other = await client.get("/products", params={"limit": 6})
+        assert first.headers["ETag"] != other.headers["ETag"]
+        assert (await client.get("/products", params={"limit": 6}, headers={"If-None-Match": first.headers["ETag"]})).status_code == 200
+
+    asyncio.run(_run(scenario))
+
+
+def test_dashboard_etag_changes_with_the_date(monkeypatch):
+    async def scenario(client):
+        etag = (await client.get("/dashboard-stats")).headers["ETag"]
+        assert (await _revalidate(client, "/dashboard-stats", etag)).status_code == 304
+
+        # "Tháng này"/"tháng trước" tính theo ngày hiện tại: sang ngày mới thì không trả 304 cho ngày cũ
+        class Tomorrow(datetime.date):
+            @classmethod
+            def today(cls):
+                return datetime.date.today() + datetime.timedelta(days=1)
+
+        monkeypatch.setattr(main, "datetime", SimpleNamespace(
+            date=Tomorrow, datetime=datetime.datetime, timedelta=datetime.timedelta
+        ))
+        assert (await _revalidate(client, "/dashboard-stats", etag)).status_code == 200
+
+    asyncio.run(_run(scenario))
@@ -0,0 +1,74 @@
+import asyncio
+
+import httpx
+
+import main
+import pagination
+
+
+async def _run(scenario):
+    async with main.app.router.lifespan_context(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            await scenario(client)
+
+
+async def _get(client, path, **params):
+    response = await client.get(path, params=params)
+    assert response.status_code == 200, response.text
+    return response
+
+
+def test_fields_return_only_requested_aliases():
+    async def scenario(client):
+        full = (await _get(client, "/products")).json()
+        sparse = (await _get(client, "/products", fields="id,name")).json()
+        assert sparse == [{"id": row["id"], "name": row["name"]} for row in full]
+
+        # Giao dịch dùng alias camelCase; tên snake_case cũng được chấp nhận nhưng JSON vẫn theo alias
+        full = (await _get(client, "/transactions", limit=20)).json()
+        for fields in ("id,productId,quantity", "id,product_id,quantity"):
+            sparse = (await _get(client, "/transactions", limit=20, fields=fields)).json()
+            assert sparse == [{"id": row["id"], "productId": row["productId"], "quantity": row["quantity"]} for row in full]
+
+        # Trường tên tự bật expand tương ứng
+        named = (await _get(client, "/transactions", limit=20, fields="id,productName")).json()
+        expanded = (await _get(client, "/transactions", limit=20, expand="product")).json()
+        assert named == [{"id": row["id"], "productName": row["productName"]} for row in expanded]
+
+        customer_id = next(row["customerId"] for row in (await _get(client, "/transactions")).json() if row["type"] == "export")
+        full = (await _get(client, f"/customers/{customer_id}/orders")).json()
+        sparse = (await _get(client, f"/customers/{customer_id}/orders", fields="id,totalAmount")).json()
+        assert full
+        assert sparse == [{"id": order["id"], "totalAmount": order["totalAmount"]} for order in full]
+
+    asyncio.run(_run(scenario))
+
+
+def test_fields_keep_cursor_pagination():
+    # Cột khóa phân trang luôn được SELECT để tạo cursor nhưng không có trong JSON nếu không được yêu cầu
+    async def scenario(client):
+        full = [row["name"] for row in (await _get(client, "/products")).json()]
+        names, cursor, limit = [], None, max(1, len(full) // 4)
+        while True:
+            params = {"limit": limit, "fields": "name", **({"cursor": cursor} if cursor else {})}
+            response = await _get(client, "/products", **params)
+            assert all(set(row) == {"name"} for row in response.json())
+            names.extend(row["name"] for row in response.json())
+            cursor = response.headers.get(pagination.NEXT_CURSOR_HEADER)
+            if cursor is None:
+                break
+        assert names == full
+
+    asyncio.run(_run(scenario))
+
+
+def test_unknown_fields_are_rejected():
+    async def scenario(client):
+        for path, fields in (("/products", "id,colour"), ("/transactions", "id,product"), ("/products", " , ")):
+            response = await client.get(path, params={"fields": fields})
+            assert response.status_code == 400, (path, fields)
+        detail = (await client.get("/products", params={"fields": "id,colour"})).json()["detail"]
+        assert "colour" in detail
+
+    asyncio.run(_run(scenario))
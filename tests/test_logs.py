@@ -0,0 +1,37 @@
+import io
+import json
+
+import pytest
+
+import logs
+
+
+@pytest.fixture
+def output():
+    # Thay luồng ghi nền đang chạy (nếu có) bằng một luồng ghi vào bộ nhớ, mức WARNING như khi chạy test
+    logs.shutdown()
+    stream = io.StringIO()
+    logs.setup(level="WARNING", stream=stream)
+    yield stream
+    logs.shutdown()
+    logs.setup()
+
+
+def _messages(stream):
+    return [json.loads(line)["msg"] for line in stream.getvalue().splitlines()]
+
+
+def test_access_keeps_errors_and_slow_requests_above_log_level(output):
+    logs.access("GET", "/ok", 200, 0.01, 1, 0.0)
+    logs.access("GET", "/error", 503, 0.01, 1, 0.0)
+    logs.access("GET", "/slow", 200, logs.SLOW_MS / 1000 + 1, 1, 0.0)
+    logs.shutdown()
+    assert _messages(output) == ["GET /error 503", "GET /slow 200"]
+
+
+def test_records_after_shutdown_are_written(output):
+    logger = logs.get_logger("test")
+    logger.warning("before shutdown")
+    logs.shutdown()
+    logger.warning("after shutdown")
+    assert _messages(output) == ["before shutdown", "after shutdown"]
@@ -0,0 +1,88 @@
+import asyncio
+
+import httpx
+
+import main
+import pagination
+
+
+async def _run(scenario):
+    async with main.app.router.lifespan_context(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            await scenario(client)
+
+
+async def _walk(client, path, limit):
+    """Đọc hết danh sách theo từng trang, đi theo header X-Next-Cursor."""
+    rows, cursor, pages = [], None, 0
+    while True:
+        params = {"limit": limit, **({"cursor": cursor} if cursor else {})}
+        response = await client.get(path, params=params)
+        assert response.status_code == 200, response.text
+        page = response.json()
+        assert len(page) <= limit
+        rows.extend(page)
+        pages += 1
+        cursor = response.headers.get(pagination.NEXT_CURSOR_HEADER)
+        if cursor is None:
+            return rows, pages
+        assert len(page) == limit
+
+
+def test_cursor_round_trip_matches_unpaged_list():
+    async def scenario(client):
+        for path in ("/products", "/transactions", "/customers"):
+            full = (await client.get(path)).json()
+            limit = max(1, len(full) // 4)
+            rows, pages = await _walk(client, path, limit)
+            assert rows == full
+            assert pages > 1
+
+    asyncio.run(_run(scenario))
+
+
+def test_cursor_boundary_inside_composite_key():
+    # Inventory được phân trang theo (product_id, warehouse_id): ranh giới trang rơi giữa các dòng của cùng
+    # một sản phẩm thì trang sau phải tiếp tục đúng ở kho kế tiếp, không lặp và không bỏ sót dòng
+    async def scenario(client):
+        warehouses = []
+        for i in range(3):
+            warehouse = await client.post("/warehouses", json={"name": f"Kho kiểm tra phân trang {i}", "location": "Hà Nội", "capacity": 100})
+            assert warehouse.status_code == 201
+            warehouses.append(warehouse.json()["id"])
+        product = await client.post("/products", json={
+            "name": "Sản phẩm kiểm tra phân trang", "category": "Test", "price": 1000.0,
+            "XuatXu": "Việt Nam", "GiaNhap": 800.0,
+        })
+        assert product.status_code == 201
+        product_id = product.json()["id"]
+        for warehouse_id in warehouses:
+            created = await client.post("/inventory", json={"product_id": product_id, "warehouse_id": warehouse_id, "stock": 1})
+            assert created.status_code == 201, created.text
+
+        full = (await client.get("/inventory")).json()
+        start = next(i for i, row in enumerate(full) if row["product_id"] == product_id)
+        assert [row["warehouse_id"] for row in full[start:start + 3]] == sorted(warehouses)
+        params = {"limit": 2}
+        if start:
+            before = full[start - 1]
+            params["cursor"] = pagination.encode_cursor([before["product_id"], before["warehouse_id"]])
+
+        first = await client.get("/inventory", params=params)
+        assert first.json() == full[start:start + 2]
+        cursor = first.headers[pagination.NEXT_CURSOR_HEADER]
+        second = await client.get("/inventory", params={"limit": 2, "cursor": cursor})
+        assert second.json() == full[start + 2:start + 4]
+        assert second.json()[0] == {"product_id": product_id, "warehouse_id": sorted(warehouses)[2], "stock": 1}
+
+    asyncio.run(_run(scenario))
+
+
+def test_invalid_cursor_is_rejected():
+    async def scenario(client):
+        for cursor in ("not-a-cursor", pagination.encode_cursor(["a", "b"])):
+            response = await client.get("/products", params={"limit": 10, "cursor": cursor})
+            assert response.status_code == 400
+
+    asyncio.run(_run(scenario))
@@ -0,0 +1,69 @@
+import asyncio
+import datetime
+
+import httpx
+import pytest
+
+import main
+import metrics
+import stats
+
+# Số câu lệnh SQL tối đa của mỗi request (ứng dụng đã chạy, cache đã nạp, các dòng bộ đếm đã có):
+# - báo cáo tồn kho là một câu SELECT gom nhóm, không phải 2 truy vấn cho mỗi sản phẩm;
+# - thêm phiếu là các câu UPDATE có điều kiện (tồn kho, kho, bộ đếm) cộng INSERT: 8 câu cho phiếu nhập,
+#   11 câu cho phiếu xuất (thêm doanh số sản phẩm, doanh thu tháng và doanh thu nhân viên).
+BUDGET = {"GET /inventory-report": 1, "POST /transactions": 11}
+
+
+async def _run(product_name, check):
+    async with main.app.router.lifespan_context(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            employee_id = (await client.get("/employees")).json()[0]["id"]
+            customer_id = (await client.get("/customers")).json()[0]["id"]
+            supplier_id = (await client.get("/suppliers")).json()[0]["id"]
+            warehouse_id = (await client.get("/warehouses")).json()[0]["id"]
+            product = await client.post("/products", json={
+                "name": product_name, "category": "Test", "price": 1000.0,
+                "XuatXu": "Việt Nam", "GiaNhap": 800.0,
+            })
+            assert product.status_code == 201
+            today = datetime.date.today().isoformat()
+            common = {"productId": product.json()["id"], "date": today, "employeeId": employee_id, "warehouseId": warehouse_id}
+            payloads = [
+                dict(common, type="import", quantity=10, price=800.0, supplierId=supplier_id),
+                dict(common, type="export", quantity=1, price=1000.0, customerId=customer_id),
+            ]
+
+            async def requests():
+                assert (await client.get("/inventory-report")).status_code == 200
+                for payload in payloads:
+                    assert (await client.post("/transactions", json=payload)).status_code == 201
+
+            # Lượt đầu nạp cache (sản phẩm, nhân viên, kho, ...) và tạo các dòng bộ đếm
+            await requests()
+            await check(requests)
+
+
+def test_requests_stay_within_query_budget(monkeypatch):
+    # Bộ đếm chia shard ngẫu nhiên: lần đầu ghi vào một shard phải tạo dòng (SAVEPOINT + INSERT).
+    # Một shard thì lượt làm nóng đã tạo đủ các dòng và số câu lệnh không còn phụ thuộc may rủi
+    monkeypatch.setattr(stats, "SHARDS", 1)
+
+    async def check(requests):
+        with metrics.query_budget(BUDGET) as captured:
+            await requests()
+        assert [(route, request.statements) for route, request in captured] == [
+            ("GET /inventory-report", 1), ("POST /transactions", 8), ("POST /transactions", 11),
+        ]
+
+    asyncio.run(_run("Sản phẩm kiểm tra ngân sách truy vấn", check))
+
+
+def test_query_budget_reports_routes_over_budget():
+    async def check(requests):
+        with pytest.raises(AssertionError, match="GET /inventory-report: 1 "):
+            with metrics.query_budget({"GET /inventory-report": 0}):
+                await requests()
+
+    asyncio.run(_run("Sản phẩm kiểm tra vượt ngân sách", check))
@@ -0,0 +1,35 @@
+import os
+
+import pytest
+
+import bench
+import datagen
+import plans
+
+# Đủ lớn để bộ tối ưu của SQLite chọn kế hoạch như trên dữ liệu thật
+TRANSACTIONS = 20_000
+
+
+@pytest.fixture(scope="module")
+def results():
+    datagen.main(["--database-url", os.environ["DATABASE_URL"], "--reset"] + bench.dataset_args(TRANSACTIONS, 42))
+    return plans.collect()
+
+
+@pytest.mark.parametrize("name", plans.case_names())
+def test_query_uses_indexes(results, name):
+    result = results[name]
+    assert result["status"] < 400, result["path"]
+    scans = {table for item in result["statements"] for table in item["full_scans"]}
+    assert not scans, f"{result['path']} quét toàn bảng {sorted(scans)}: " + "; ".join(
+        " ".join(item["statement"].split())[:160] for item in result["statements"] if item["full_scans"]
+    )
+
+
+@pytest.mark.parametrize("name,indexes", sorted(plans.EXPECTED_INDEXES.items()))
+def test_query_uses_expected_index(results, name, indexes):
+    result = results[name]
+    assert plans.uses_index(result, indexes), f"{result['path']} không dùng {' hoặc '.join(indexes)}: " + "; ".join(
+        " ".join(item["statement"].split())[:160] + " -> " + str([row.get("detail") for row in item["plan"]])
+        for item in result["statements"]
+    )
@@ -0,0 +1,63 @@
+import asyncio
+import datetime
+
+import httpx
+
+import main
+
+
+async def _run(scenario):
+    async with main.app.router.lifespan_context(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            await scenario(client)
+
+
+async def _search(client, path, term):
+    response = await client.get(path, params={"search": term})
+    assert response.status_code == 200, response.text
+    return [row["id"] for row in response.json()]
+
+
+async def _create_product(client, name):
+    product = await client.post("/products", json={
+        "name": name, "category": "Dụng cụ", "price": 1000.0, "XuatXu": "Đức", "GiaNhap": 800.0,
+    })
+    assert product.status_code == 201
+    return product.json()["id"]
+
+
+def test_search_folds_diacritics_and_case():
+    async def scenario(client):
+        product_id = await _create_product(client, "Máy khoan động lực kiểm thử")
+        for term in ("may khoan", "MÁY KHOAN", "dong luc", "khoan động"):
+            assert product_id in await _search(client, "/products", term), term
+        assert product_id not in await _search(client, "/products", "may cat")
+
+    asyncio.run(_run(scenario))
+
+
+def test_search_matches_id_prefix_then_substring():
+    async def scenario(client):
+        product_id = await _create_product(client, "Sản phẩm kiểm tra tìm mã")
+        # Khớp chính xác mã xếp đầu; tiền tố mã tìm được sản phẩm
+        assert (await _search(client, "/products", product_id))[0] == product_id
+        assert product_id in await _search(client, "/products", product_id[:-3])
+        # Đoạn giữa mã (không là tiền tố của mã nào) chỉ tìm được qua đường dự phòng chuỗi con
+        middle = product_id[4:-2].lower()
+        assert any(ch.isdigit() for ch in middle)
+        assert product_id in await _search(client, "/products", middle)
+
+        employee_id = (await client.get("/employees")).json()[0]["id"]
+        created = await client.post("/transactions", json={
+            "type": "import", "productId": product_id, "quantity": 1, "price": 800.0,
+            "date": datetime.date.today().isoformat(), "employeeId": employee_id,
+        })
+        assert created.status_code == 201
+        transaction_id = created.json()["id"]
+        assert (await _search(client, "/transactions", transaction_id))[0] == transaction_id
+        assert transaction_id in await _search(client, "/transactions", transaction_id[4:-2])
+        # Giao dịch của sản phẩm có tên khớp từ khóa
+        assert transaction_id in await _search(client, "/transactions", "kiem tra tim ma")
+
+    asyncio.run(_run(scenario))
@@ -0,0 +1,54 @@
+import asyncio
+import datetime
+
+import httpx
+
+import main
+
+IMPORTED = 50
+EXPORT_QUANTITY = 3
+CONCURRENT_EXPORTS = 40
+
+
+async def _run_exports():
+    async with main.app.router.lifespan_context(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            employee_id = (await client.get("/employees")).json()[0]["id"]
+            customer_id = (await client.get("/customers")).json()[0]["id"]
+            product = await client.post("/products", json={
+                "name": "Sản phẩm kiểm tra đồng thời", "category": "Test", "price": 1000.0,
+                "XuatXu": "Việt Nam", "GiaNhap": 800.0,
+            })
+            assert product.status_code == 201
+            product_id = product.json()["id"]
+            today = datetime.date.today().isoformat()
+
+            imported = await client.post("/transactions", json={
+                "type": "import", "productId": product_id, "quantity": IMPORTED, "price": 800.0,
+                "date": today, "employeeId": employee_id,
+            })
+            assert imported.status_code == 201
+
+            # Tổng lượng xuất yêu cầu vượt tồn kho: chỉ một phần được chấp nhận
+            responses = await asyncio.gather(*[
+                client.post("/transactions", json={
+                    "type": "export", "productId": product_id, "quantity": EXPORT_QUANTITY, "price": 1000.0,
+                    "date": today, "employeeId": employee_id, "customerId": customer_id,
+                })
+                for _ in range(CONCURRENT_EXPORTS)
+            ])
+            products = (await client.get("/products", params={"search": product_id})).json()
+            stock = next(row["stock"] for row in products if row["id"] == product_id)
+            return [response.status_code for response in responses], stock
+
+
+def test_concurrent_exports_never_oversell():
+    statuses, stock = asyncio.run(_run_exports())
+
+    assert set(statuses) <= {201, 400}, statuses
+    accepted = statuses.count(201)
+    assert stock >= 0
+    assert stock == IMPORTED - accepted * EXPORT_QUANTITY
+    # Mọi phiếu bị từ chối là do hết hàng, nên số phiếu được nhận là tối đa có thể
+    assert accepted == IMPORTED // EXPORT_QUANTITY
@@ -0,0 +1,216 @@
+import hashlib
+import mmap
+import os
+import secrets
+import struct
+import tempfile
+import threading
+from typing import Callable, Dict, Iterable, Optional, Sequence, Set
+
+from fastapi import HTTPException, Request, Response, status
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+import database
+import models
+
+try:
+    import fcntl
+
+    def lock_file(handle):
+        fcntl.flock(handle.fileno(), fcntl.LOCK_EX)
+
+    def unlock_file(handle):
+        fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+except ImportError:  # Windows
+    import msvcrt
+
+    def lock_file(handle):
+        handle.seek(0)
+        msvcrt.locking(handle.fileno(), msvcrt.LK_LOCK, 1)
+
+    def unlock_file(handle):
+        handle.seek(0)
+        msvcrt.locking(handle.fileno(), msvcrt.LK_UNLCK, 1)
+
+# Số phiên bản ghi của từng bảng, dùng làm ETag cho các endpoint GET.
+#
+# - Mỗi bảng có một bộ đếm 8 byte trong một file nhỏ được mmap, dùng chung cho mọi worker uvicorn trên
+#   cùng máy (không cần Redis hay dịch vụ ngoài). Đọc phiên bản chỉ là đọc bộ nhớ, không truy vấn DB.
+# - Bảng nào bị INSERT/UPDATE/DELETE trong một giao dịch (ORM flush, câu lệnh Core, db.run_sync...) được
+#   ghi nhận ở mức engine và bộ đếm của nó được tăng SAU khi session commit, nên client không bao giờ nhận
+#   phiên bản mới kèm dữ liệu cũ. Giao dịch bị rollback không làm tăng phiên bản.
+# - conditional_get(...) là dependency cho endpoint GET: trả 304 nếu If-None-Match khớp, ngược lại đặt ETag.
+# File mặc định nằm trong thư mục tạm, tên theo chuỗi kết nối (ghi đè bằng TABLE_VERSIONS_FILE).
+
+HEADER = struct.Struct("<Q")
+COUNTER = struct.Struct("<Q")
+MAX_TABLES = 64
+
+# Thứ tự cố định của các bảng trong file; mã băm của danh sách được đưa vào ETag để ETag cũ
+# không khớp nhầm khi bản triển khai mới thêm bảng (vị trí các bộ đếm thay đổi)
+TABLES = sorted(models.Base.metadata.tables)
+_LAYOUT = hashlib.sha1(",".join(TABLES).encode("utf-8")).hexdigest()[:8]
+
+
+def default_path(url: str = database.SQLALCHEMY_DATABASE_URL) -> str:
+    digest = hashlib.sha1(str(url).encode("utf-8")).hexdigest()[:12]
+    return os.environ.get("TABLE_VERSIONS_FILE") or os.path.join(tempfile.gettempdir(), f"wms-table-versions-{digest}.bin")
+
+
+class SharedCounters:
+    """Dãy bộ đếm uint64 trong một file mmap dùng chung giữa các tiến trình (mọi worker trên cùng máy)."""
+
+    def __init__(self, path: str, slots: int):
+        self.path = path
+        self.slots = slots
+        self._lock = threading.Lock()
+        size = HEADER.size + COUNTER.size * slots
+        self._file = open(path, "a+b")
+        lock_file(self._file)
+        try:
+            self._file.seek(0, os.SEEK_END)
+            if self._file.tell() < size:
+                # File mới: epoch ngẫu nhiên để giá trị suy ra từ file cũ (đã xóa, ví dụ ETag) không trùng với file mới
+                self._file.truncate(0)
+                self._file.write(HEADER.pack(secrets.randbits(63)) + bytes(size - HEADER.size))
+                self._file.flush()
+        finally:
+            unlock_file(self._file)
+        self._map = mmap.mmap(self._file.fileno(), size)
+        self.epoch = HEADER.unpack_from(self._map, 0)[0]
+
+    def get(self, slot: int) -> int:
+        return COUNTER.unpack_from(self._map, HEADER.size + COUNTER.size * slot)[0]
+
+    def increment(self, slots: Iterable[int]) -> None:
+        slots = sorted(set(slots))
+        if not slots:
+            return
+        with self._lock:
+            lock_file(self._file)
+            try:
+                for slot in slots:
+                    offset = HEADER.size + COUNTER.size * slot
+                    COUNTER.pack_into(self._map, offset, COUNTER.unpack_from(self._map, offset)[0] + 1)
+            finally:
+                unlock_file(self._file)
+
+
+class TableVersions(SharedCounters):
+    """Bộ đếm phiên bản của các bảng, mỗi bảng một ô theo thứ tự trong TABLES."""
+
+    def __init__(self, path: str):
+        super().__init__(path, MAX_TABLES)
+
+    def read(self, tables: Sequence[str]) -> Dict[str, int]:
+        return {table: self.get(TABLES.index(table)) for table in tables}
+
+    def bump(self, tables: Iterable[str]) -> None:
+        self.increment(TABLES.index(table) for table in set(tables) & set(TABLES))
+
+    def etag(self, tables: Sequence[str], resource: str) -> str:
+        values = self.read(tables)
+        raw = f"{self.epoch}:{_LAYOUT}:{resource}:" + ",".join(f"{table}={values[table]}" for table in tables)
+        return 'W/"' + hashlib.sha1(raw.encode("utf-8")).hexdigest()[:20] + '"'
+
+
+_versions: Optional[TableVersions] = None
+
+
+def get_versions() -> TableVersions:
+    global _versions
+    if _versions is None:
+        _versions = TableVersions(default_path())
+    return _versions
+
+
+# --- Ghi nhận bảng bị thay đổi và tăng phiên bản sau commit ---
+
+TOUCHED_KEY = "touched_tables"
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is None or not (context.isinsert or context.isupdate or context.isdelete):
+        return
+    table = getattr(getattr(context.compiled, "statement", None), "table", None)
+    name = getattr(table, "name", None)
+    touched: Set[str] = conn.info.setdefault(TOUCHED_KEY, set())
+    # Không xác định được bảng: coi như mọi bảng đều thay đổi
+    touched.update([name] if name in TABLES else TABLES)
+
+
+def _discard_on_reset(dbapi_connection, connection_record, reset_state):
+    # Kết nối trả về pool mà chưa commit (ví dụ session đóng khi có lỗi): bỏ các bảng đã ghi nhận
+    connection_record.info.pop(TOUCHED_KEY, None)
+
+
+def track_engine(engine) -> None:
+    """Ghi nhận bảng bị ghi trên engine (với AsyncEngine truyền async_engine.sync_engine)."""
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "reset", _discard_on_reset)
+
+
+# Các engine của ứng dụng được theo dõi ngay khi import (kể cả khi chạy các công cụ dòng lệnh)
+track_engine(database.engine)
+track_engine(database.async_engine.sync_engine)
+
+
+@event.listens_for(Session, "after_begin")
+def _remember_connection(session, transaction, connection):
+    # Giữ dict info của kết nối (vẫn dùng được sau khi session trả kết nối về pool)
+    session.info.setdefault("connection_infos", []).append(connection.info)
+
+
+def _pop_touched(session) -> Set[str]:
+    touched: Set[str] = set()
+    for info in session.info.pop("connection_infos", []):
+        touched |= info.pop(TOUCHED_KEY, set())
+    return touched
+
+
+@event.listens_for(Session, "after_commit")
+def _bump_after_commit(session):
+    touched = _pop_touched(session)
+    if touched:
+        get_versions().bump(touched)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session):
+    _pop_touched(session)
+
+
+# --- Conditional GET ---
+
+def _matches(header: Optional[str], tag: str) -> bool:
+    if not header:
+        return False
+    candidates = [value.strip() for value in header.split(",")]
+    # So sánh yếu: W/"x" khớp với "x"
+    return "*" in candidates or tag in candidates or tag[2:] in candidates
+
+
+def conditional_get(*tables: str, scope: Optional[Callable[[Request], str]] = None):
+    """
+    Dependency cho endpoint GET đọc từ các bảng tables. ETag gồm phiên bản các bảng và đường dẫn + query
+    string; nếu If-None-Match khớp thì trả 304 ngay, trước khi handler mở truy vấn nào.
+
+    scope: giá trị thêm vào ETag cho kết quả còn phụ thuộc vào thứ khác ngoài các bảng (ví dụ ngày hiện tại:
+    sang ngày/tháng mới thì ETag đổi dù không có thao tác ghi nào).
+    """
+    unknown = set(tables) - set(TABLES)
+    if unknown:
+        raise ValueError(f"Unknown tables: {sorted(unknown)}")
+
+    async def dependency(request: Request, response: Response):
+        resource = request.url.path + ("?" + request.url.query if request.url.query else "")
+        if scope is not None:
+            resource += "#" + scope(request)
+        tag = get_versions().etag(tables, resource)
+        headers = {"ETag": tag, "Cache-Control": "no-cache"}
+        if _matches(request.headers.get("if-none-match"), tag):
+            raise HTTPException(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        response.headers.update(headers)
+
+    return dependency